@@ -43,6 +43,11 @@ target_metadata = Model.metadata
 # ... etc.
 
 
+def include_object(object_, name, type_, reflected, compare_to) -> bool:
+    """Секции секционированных таблиц создаются вне миграций, autogenerate их не трогает"""
+    return not (type_ == 'table' and reflected and compare_to is None and name.startswith('gitlab_pipeline_event_'))
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -59,6 +64,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -78,7 +84,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,45 @@
+"""drop__gitlab_pipeline_event_default
+
+Revision ID: d17f4a8c2e90
+Revises: 5a0c8e4d9f13
+Create Date: 2026-10-19 17:00:12.408736
+
+"""
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd17f4a8c2e90'
+down_revision = '5a0c8e4d9f13'
+branch_labels = None
+depends_on = None
+
+
+def create_partition(month: date) -> None:
+    end = (month + timedelta(days=31)).replace(day=1)
+    op.execute(
+        f'CREATE TABLE IF NOT EXISTS gitlab_pipeline_event_{month:y%Ym%m} PARTITION OF gitlab_pipeline_event '
+        f"FOR VALUES FROM ('{month.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+    )
+
+
+def upgrade() -> None:
+    # Строки секции по умолчанию переносятся в секции своих месяцев, иначе эти секции нельзя создать
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT to_regclass('gitlab_pipeline_event_default')")).scalar() is None:
+        return
+    op.execute('ALTER TABLE gitlab_pipeline_event DETACH PARTITION gitlab_pipeline_event_default')
+    months = bind.execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', received_at AT TIME ZONE 'UTC')::date FROM gitlab_pipeline_event_default"
+    )).scalars().all()
+    for month in months:
+        create_partition(month)
+    op.execute('INSERT INTO gitlab_pipeline_event SELECT * FROM gitlab_pipeline_event_default')
+    op.execute('DROP TABLE gitlab_pipeline_event_default')
+
+
+def downgrade() -> None:
+    op.execute('CREATE TABLE IF NOT EXISTS gitlab_pipeline_event_default PARTITION OF gitlab_pipeline_event DEFAULT')
@@ -0,0 +1,9 @@
+"""
+Микробенчмарки горячих путей matterlab.
+
+Результаты сравниваются с JSON-базой (benchmarks/baseline.json), прогон падает, если какой-то замер медленнее базы
+больше, чем на порог. Запуск: python -m benchmarks --help
+
+Проверка того, что горячие выборки идут по индексам: python -m benchmarks.query_plans
+Память и скорость разбора вебхука прежней и облегченной схемой: python -m benchmarks.webhook_memory
+"""
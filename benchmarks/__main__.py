@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import fnmatch
+import gc
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+# Без .env замеры, не трогающие базу, все равно должны запускаться
+for _key, _value in {
+    'DB_USER': 'postgres', 'DB_PASSWORD': 'postgres', 'GITLAB_SECRET': 'benchmark',
+    'MATTERMOST_HOST': 'http://localhost:8065/'
+}.items():
+    os.environ.setdefault(_key, _value)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Микробенчмарки matterlab')
+    parser.add_argument('-k', '--filter', default='*', help='glob по именам замеров')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='JSON-файл базы')
+    parser.add_argument('--save', action='store_true', help='Записать результаты как новую базу')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление, доля (0.2 = 20%%)')
+    parser.add_argument('--repeat', type=int, default=7, help='Повторов каждого замера')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Минимальная длительность одного повтора, с')
+    return parser.parse_args()
+
+
+async def run_batch(func, is_async: bool, number: int) -> float:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        if is_async:
+            for _ in range(number):
+                await func()
+        else:
+            for _ in range(number):
+                func()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+async def measure(func, repeat: int, min_time: float) -> dict:
+    """
+    Замер одной функции: подбор кол-ва вызовов на повтор, затем repeat повторов
+    :return: медиана и минимум времени одного вызова, мкс
+    """
+    is_async = inspect.iscoroutinefunction(func)
+    number = 1
+    while (elapsed := await run_batch(func, is_async, number)) < min_time:
+        number *= 10 if elapsed < min_time / 10 else 2
+    timings = [await run_batch(func, is_async, number) / number for _ in range(repeat)]
+    return {
+        'median_us': round(statistics.median(timings) * 1e6, 3),
+        'min_us': round(min(timings) * 1e6, 3),
+        'number': number,
+    }
+
+
+async def run_cases(args: argparse.Namespace) -> tuple[dict, dict]:
+    from .cases import CASES, SkipCase
+
+    results, skipped = {}, {}
+    for name, factory in CASES.items():
+        if not fnmatch.fnmatch(name, args.filter):
+            continue
+        try:
+            async with factory() as func:
+                results[name] = await measure(func, args.repeat, args.min_time)
+        except SkipCase as exc:
+            skipped[name] = str(exc)
+    return results, skipped
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Сравнение с базой
+    :return: список описаний регрессий
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f'{name:45} {result["median_us"]:>12.2f} us   (нет в базе)')
+            continue
+        base = baseline[name]['median_us']
+        ratio = result['median_us'] / base if base else 1.0
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  REGRESSION'
+            regressions.append(f'{name}: {base:.2f} -> {result["median_us"]:.2f} us (x{ratio:.2f})')
+        print(f'{name:45} {result["median_us"]:>12.2f} us   x{ratio:.2f} от базы{mark}')
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    results, skipped = asyncio.run(run_cases(args))
+    for name, reason in skipped.items():
+        print(f'{name:45} пропущен: {reason}')
+
+    if args.save:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline['results'] = {**baseline.get('results', {}), **results}
+        baseline['machine'] = {'python': platform.python_version(), 'platform': platform.platform()}
+        args.baseline.write_text(json.dumps(baseline, indent=2, ensure_ascii=False, sort_keys=True) + '\n')
+        for name, result in results.items():
+            print(f'{name:45} {result["median_us"]:>12.2f} us')
+        print(f'База записана в {args.baseline}')
+        return
+
+    if not args.baseline.exists():
+        # Без базы сравнивать не с чем: молча пройденная проверка скрыла бы любую регрессию
+        print(f'База {args.baseline} не найдена. Запишите ее на этой машине: python -m benchmarks --save')
+        sys.exit(2)
+    baseline = json.loads(args.baseline.read_text())['results']
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print('\nЗамедление больше порога:\n' + '\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
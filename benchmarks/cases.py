@@ -0,0 +1,207 @@
+import contextlib
+import functools
+import json
+from collections.abc import AsyncIterator, Callable
+from types import SimpleNamespace
+
+from loadtest.generator import WebhookGenerator
+
+# Имя замера -> асинхронный контекстный менеджер, отдающий измеряемую функцию (обычную или корутинную)
+CASES: dict[str, Callable[[], contextlib.AbstractAsyncContextManager[Callable]]] = {}
+
+
+class SkipCase(Exception):  # noqa: N818
+    """Замер невозможно выполнить в текущем окружении (например, нет базы)"""
+
+
+def case(name: str):
+    def decorator(factory):
+        CASES[name] = contextlib.asynccontextmanager(factory)
+        return factory
+    return decorator
+
+
+def make_payload(jobs: int, status: str = 'success') -> dict:
+    generator = WebhookGenerator(
+        gitlab_url='https://gitlab.example.com', projects=1, jobs=jobs, status_mix={status: 1}, seed=0
+    )
+    return generator.make()[1]
+
+
+def worst_case_payload(jobs: int) -> dict:
+    """Успешный pipeline, где единственная упавшая allow_failure задача - последняя: полный проход по builds"""
+    payload = make_payload(jobs)
+    for build in payload['builds']:
+        build.update(status='success', allow_failure=False)
+    payload['builds'][-1].update(status='failed', allow_failure=True)
+    return payload
+
+
+def realistic_payload(jobs: int) -> bytes:
+    """Тело вебхука в том виде, в каком его шлет GitLab: у задач есть поля, которые приложению не нужны"""
+    payload = worst_case_payload(jobs)
+    for index, build in enumerate(payload['builds']):
+        build.update(
+            id=10_000 + index,
+            created_at='2026-10-19 09:00:00 UTC',
+            started_at='2026-10-19 09:00:05 UTC',
+            finished_at='2026-10-19 09:01:05 UTC',
+            duration=60.5,
+            queued_duration=1.2,
+            failure_reason='script_failure' if build['status'] == 'failed' else None,
+            when='on_success',
+            manual=False,
+            user=payload['user'],
+            runner={'id': 1, 'description': 'shared', 'runner_type': 'instance_type', 'active': True, 'tags': []},
+            artifacts_file={'filename': None, 'size': None},
+            environment=None
+        )
+    return json.dumps(payload).encode()
+
+
+async def webhook_validation(jobs: int) -> AsyncIterator[Callable]:
+    from src.gitlab.schemas import WebHook
+
+    payload = worst_case_payload(jobs)
+    yield lambda: WebHook(**payload)
+
+
+for _jobs in (10, 100, 1000, 5000):
+    case(f'webhook_validation[jobs={_jobs}]')(functools.partial(webhook_validation, _jobs))
+
+
+async def webhook_parse(parser: str, jobs: int) -> AsyncIterator[Callable]:
+    """Разбор сырого тела запроса: как раньше (json + WebHook) и облегченной схемой"""
+    from src.gitlab.schemas import WebHook, webhook_adapter
+
+    body = realistic_payload(jobs)
+    if parser == 'full':
+        yield lambda: WebHook(**json.loads(body))
+    else:
+        yield lambda: webhook_adapter.validate_json(body)
+
+
+for _jobs in (100, 1000, 5000):
+    for _parser in ('full', 'lean'):
+        case(f'webhook_parse[{_parser},jobs={_jobs}]')(functools.partial(webhook_parse, _parser, _jobs))
+
+
+async def prepare_message(status: str) -> AsyncIterator[Callable]:
+    from src.gitlab.schemas import WebHook
+    from src.mattermost.services import prepare_message as prepare
+
+    data = WebHook(**make_payload(30, status))
+
+    async def run():
+        await prepare(data)
+    yield run
+
+
+for _status in ('success', 'failed'):
+    case(f'prepare_message[{_status}]')(functools.partial(prepare_message, _status))
+
+
+@case('manifest_serialization')
+async def manifest_serialization() -> AsyncIterator[Callable]:
+    from src.mattermost.routers import build_manifest
+
+    yield lambda: build_manifest('http://localhost:8000/').model_dump_json(exclude_none=True, by_alias=True)
+
+
+@case('bindings_serialization')
+async def bindings_serialization() -> AsyncIterator[Callable]:
+    from src.mattermost.routers import build_bindings
+
+    yield lambda: build_bindings('http://localhost:8000/').model_dump_json(exclude_none=True, by_alias=True)
+
+
+@case('bindings_response[cached]')
+async def bindings_response_cached() -> AsyncIterator[Callable]:
+    from src.mattermost.routers import bindings_response
+
+    yield lambda: bindings_response.get('http://localhost:8000/')
+
+
+@case('form_template.render[reminder]')
+async def form_template_render() -> AsyncIterator[Callable]:
+    from src.mattermost.routers import reminder_datetime_form
+
+    value = {'label': 'Указать дату и время', 'value': 'specific_datetime'}
+    yield lambda: reminder_datetime_form.render({'interval': value})
+
+
+@contextlib.asynccontextmanager
+async def db_fixture():
+    """Сессия к локальному Postgres с тестовыми проектом и каналом, удаляемыми после замера"""
+    from sqlalchemy import delete, text
+
+    from src.database import AsyncSession
+    from src.gitlab.models import Project
+    from src.mattermost.models import Channel, GitlabProjectChannel
+
+    project_id = 899_999_999
+    channel_iid = 'benchmarkchannel'
+    session = AsyncSession()
+    try:
+        await session.execute(text('SELECT 1'))
+    except Exception as exc:
+        await session.close()
+        raise SkipCase(f'Postgres недоступен: {exc.__class__.__name__}') from exc
+
+    async def cleanup():
+        await session.execute(delete(GitlabProjectChannel).where(GitlabProjectChannel.gitlab_project_id == project_id))
+        await session.execute(delete(Channel).where(Channel.iid == channel_iid))
+        await session.execute(delete(Project).where(Project.id == project_id))
+        await session.commit()
+
+    await cleanup()
+    project = Project(
+        id=project_id, name='benchmark', web_url='https://gitlab.example.com/benchmark',
+        path_with_namespace='bench/benchmark'
+    )
+    session.add(Channel(iid=channel_iid, name='benchmark', gitlab_projects=[project]))
+    await session.commit()
+    try:
+        yield SimpleNamespace(session=session, project_id=project_id, channel_iid=channel_iid)
+    finally:
+        await cleanup()
+        await session.close()
+
+
+@case('crud.get_or_create_project')
+async def crud_get_or_create_project() -> AsyncIterator[Callable]:
+    from src.gitlab import crud
+    from src.gitlab.schemas import ProjectAttrs
+
+    async with db_fixture() as db:
+        schema = ProjectAttrs(id=db.project_id, name='benchmark', web_url='https://gitlab.example.com/benchmark')
+
+        async def run():
+            await crud.get_or_create_project(db.session, schema)
+            db.session.expunge_all()
+        yield run
+
+
+@case('crud.get_project_by_id')
+async def crud_get_project_by_id() -> AsyncIterator[Callable]:
+    from src.gitlab import crud
+
+    async with db_fixture() as db:
+        async def run():
+            await crud.get_project_by_id(db.session, db.project_id)
+            db.session.expunge_all()
+        yield run
+
+
+@case('crud.get_or_create_channel')
+async def crud_get_or_create_channel() -> AsyncIterator[Callable]:
+    from src.mattermost import crud
+    from src.mattermost.schemas import Channel
+
+    async with db_fixture() as db:
+        schema = Channel(id=db.channel_iid, name='benchmark', display_name=None)
+
+        async def run():
+            await crud.get_or_create_channel(db.session, schema)
+            db.session.expunge_all()
+        yield run
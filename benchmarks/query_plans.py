@@ -0,0 +1,120 @@
+"""
+Проверка планов запросов горячих выборок: каждая должна идти по индексу, а не полным сканированием таблицы.
+
+Нужен Postgres с примененными миграциями. На маленьких таблицах планировщик и так предпочитает Seq Scan,
+поэтому последовательное сканирование отключается на время EXPLAIN: если подходящего индекса нет, Postgres
+все равно выберет Seq Scan, и проверка упадет. Запуск: python -m benchmarks.query_plans
+"""
+import os
+import sys
+from collections.abc import Callable, Iterator
+
+# Без .env проверка все равно должна импортировать настройки
+for _key, _value in {
+    'DB_USER': 'postgres', 'DB_PASSWORD': 'postgres', 'GITLAB_SECRET': 'benchmark',
+    'MATTERMOST_HOST': 'http://localhost:8065/'
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from sqlalchemy import Select, select, text  # noqa: E402
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from src.gitlab import models as gl_models  # noqa: E402
+from src.mattermost import models  # noqa: E402
+
+# Имя выборки -> (запрос, таблица, которая должна читаться по индексу)
+LOOKUPS: dict[str, Callable[[], tuple[Select, str]]] = {
+    'mattermost.crud.get_or_create_channel': lambda: (
+        select(models.Channel).where(models.Channel.iid == 'channel'), 'mattermost_channel'
+    ),
+    'Channel.gitlab_projects': lambda: (
+        select(gl_models.Project)
+        .join(models.GitlabProjectChannel)
+        .where(models.GitlabProjectChannel.mattermost_channel_id.in_([1, 2])),
+        'gitlab_project_mattermost_channel'
+    ),
+    'Project.mattermost_channels': lambda: (
+        select(models.Channel)
+        .join(models.GitlabProjectChannel)
+        .where(models.GitlabProjectChannel.gitlab_project_id.in_([1, 2])),
+        'gitlab_project_mattermost_channel'
+    ),
+    'gitlab.crud.get_channel_projects[query]': lambda: (
+        select(gl_models.Project.id).where(gl_models.Project.path_with_namespace.ilike('%group/repo%')),
+        'gitlab_project'
+    ),
+    'gitlab.crud.get_project_by_id': lambda: (
+        select(gl_models.Project).where(gl_models.Project.id == 1), 'gitlab_project'
+    ),
+    'mattermost.crud.get_or_create_user': lambda: (
+        select(models.User).where(models.User.id == 'user'), 'mattermost_user'
+    ),
+    'GitlabUser.mattermost_user': lambda: (
+        select(models.User).where(models.User.gitlab_user_id.in_([1, 2])), 'mattermost_user'
+    ),
+    'mattermost.crud.get_user_id_by_gitlab_iid': lambda: (
+        select(gl_models.GitlabUser.id).where(gl_models.GitlabUser.iid == 1), 'gitlab_user'
+    ),
+    'mattermost.crud.get_or_create_bot': lambda: (
+        select(models.Bot).where(models.Bot.iid == 'bot'), 'mattermost_bot'
+    ),
+    'gitlab.crud.get_channel_pipeline_stats': lambda: (
+        select(gl_models.PipelineDailyStats.ref)
+        .where(gl_models.PipelineDailyStats.project_id.in_([1, 2]), gl_models.PipelineDailyStats.day >= '2026-10-01'),
+        'gitlab_pipeline_daily_stats'
+    ),
+    'gitlab.crud.get_channel_branch_statuses': lambda: (
+        select(gl_models.PipelineLatest.ref).where(gl_models.PipelineLatest.project_id.in_([1, 2])),
+        'gitlab_pipeline_latest'
+    ),
+    'mattermost.crud.get_pending_reminder_batch': lambda: (
+        select(models.Reminder.id, models.Reminder.due_at)
+        .where(models.Reminder.sent_at.is_(None), models.Reminder.id > 0)
+        .order_by(models.Reminder.id)
+        .limit(500),
+        'mattermost_reminder'
+    ),
+}
+
+
+def iter_nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from iter_nodes(child)
+
+
+def check(session, statement: Select, table: str) -> tuple[bool, list[str]]:
+    """
+    EXPLAIN запроса при отключенном последовательном сканировании
+    :return: признак того, что таблица читается по индексу, и узлы плана для отчета
+    """
+    sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    with session.begin():
+        session.execute(text('SET LOCAL enable_seqscan = off'))
+        plan = session.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar_one()[0]['Plan']
+    nodes = list(iter_nodes(plan))
+    index_names = [node['Index Name'] for node in nodes if 'Index Name' in node]
+    nodes = [node for node in nodes if node.get('Relation Name') == table]
+    # Bitmap Heap Scan читает таблицу по результату Bitmap Index Scan, это тоже доступ по индексу
+    indexed = bool(nodes) and all(node['Node Type'] != 'Seq Scan' for node in nodes)
+    return indexed, [node['Node Type'] for node in nodes] + index_names
+
+
+def main() -> None:
+    from src.database import SyncSession
+
+    failed = []
+    with SyncSession() as session:
+        for name, lookup in LOOKUPS.items():
+            statement, table = lookup()
+            indexed, nodes = check(session, statement, table)
+            print(f'{name:45} {"ok" if indexed else "SEQ SCAN":8} {", ".join(nodes)}')
+            if not indexed:
+                failed.append(name)
+    if failed:
+        print('\nБез индекса: ' + ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Сравнение разбора вебхука: прежний путь (json.loads + WebHook) и облегченная схема PipelineWebHook.
+
+Для каждого размера pipeline выводится пропускная способность, пик памяти во время разбора и память,
+которую держит разобранный объект (он живет до конца фоновой задачи). Запуск: python -m benchmarks.webhook_memory
+"""
+import gc
+import json
+import os
+import time
+import tracemalloc
+from collections.abc import Callable
+
+# Без .env проверка все равно должна импортировать настройки
+for _key, _value in {
+    'DB_USER': 'postgres', 'DB_PASSWORD': 'postgres', 'GITLAB_SECRET': 'benchmark',
+    'MATTERMOST_HOST': 'http://localhost:8065/'
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from src.gitlab.schemas import WebHook, webhook_adapter  # noqa: E402
+
+from .cases import realistic_payload  # noqa: E402
+
+PARSERS: dict[str, Callable[[bytes], object]] = {
+    'full': lambda body: WebHook(**json.loads(body)),
+    'lean': webhook_adapter.validate_json,
+}
+
+
+def throughput(parse: Callable[[bytes], object], body: bytes, min_time: float = 0.5) -> float:
+    """:return: разборов в секунду"""
+    count = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time:
+        parse(body)
+        count += 1
+    return count / elapsed
+
+
+def memory(parse: Callable[[bytes], object], body: bytes) -> tuple[int, int]:
+    """:return: пик памяти во время разбора и память, занятая результатом, байт"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = parse(body)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+def main() -> None:
+    print(f'{"jobs":>6} {"parser":>6} {"parse/s":>10} {"peak KiB":>10} {"retained KiB":>13}')
+    for jobs in (100, 1000, 5000):
+        body = realistic_payload(jobs)
+        for name, parse in PARSERS.items():
+            rate = throughput(parse, body)
+            peak, retained = memory(parse, body)
+            print(f'{jobs:>6} {name:>6} {rate:>10.1f} {peak / 1024:>10.1f} {retained / 1024:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""
+Нагрузочное тестирование matterlab без выхода в сеть.
+
+Приложение запускается отдельным процессом и смотрит на локальные заглушки GitLab и Mattermost
+(см. loadtest.stubs), вебхуки генерирует loadtest.generator. Запуск: python -m loadtest --help
+"""
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from .generator import WebhookGenerator, parse_status_mix
+from .stubs import DeliveryLog, Faults, StubServer, create_gitlab_stub, create_mattermost_stub
+
+SECRET = 'loadtest'  # noqa: S105
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summary(values: list[float], elapsed: float) -> dict:
+    return {
+        'count': len(values),
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(max(values, default=0) * 1000, 2),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m loadtest', description='Нагрузочный прогон matterlab')
+    parser.add_argument('--requests', type=int, default=1000, help='Сколько вебхуков отправить')
+    parser.add_argument('--concurrency', type=int, default=50, help='Одновременных запросов')
+    parser.add_argument('--rate', type=float, default=0, help='Вебхуков в секунду, 0 - без ограничения')
+    parser.add_argument('--projects', type=int, default=20)
+    parser.add_argument('--channels', type=int, default=2, help='Каналов на проект')
+    parser.add_argument('--jobs', type=int, default=30, help='Задач в pipeline')
+    parser.add_argument('--status-mix', default='success=0.7,failed=0.2,warning=0.1')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--mm-latency', type=float, default=0.02, help='Задержка Mattermost, с')
+    parser.add_argument('--mm-jitter', type=float, default=0.01)
+    parser.add_argument('--mm-error-rate', type=float, default=0.0)
+    parser.add_argument('--gl-latency', type=float, default=0.05, help='Задержка GitLab, с')
+    parser.add_argument('--gl-error-rate', type=float, default=0.0)
+    parser.add_argument('--app-port', type=int, default=18000)
+    parser.add_argument('--mm-port', type=int, default=18065)
+    parser.add_argument('--gl-port', type=int, default=18080)
+    parser.add_argument('--workers', type=int, default=1, help='Воркеров uvicorn у приложения')
+    parser.add_argument(
+        '--digest-threshold', type=int, default=0,
+        help='Порог сводок приложения; по умолчанию сводки выключены, чтобы каждое сообщение доходило с маркером'
+    )
+    parser.add_argument('--drain-timeout', type=float, default=60, help='Сколько ждать доставки сообщений, с')
+    parser.add_argument('--json', action='store_true', help='Вывести отчет в JSON')
+    return parser.parse_args()
+
+
+def seed_database(generator: WebhookGenerator) -> None:
+    """Проекты, каналы и связи между ними для прогона. Бот создается, если его еще нет"""
+    from sqlalchemy import select
+
+    from src.database import SyncSession
+    from src.gitlab.models import Project
+    from src.mattermost.models import Bot, Channel
+
+    with SyncSession() as session:
+        for project_id in generator.project_ids:
+            attrs = generator.project_attrs(project_id)
+            channels = [
+                Channel(iid=iid, name=iid, display_name=iid) for iid in generator.channel_iids(project_id)
+            ]
+            session.add(Project(**attrs, mattermost_channels=channels))
+        if not session.scalars(select(Bot)).first():
+            session.add(Bot(iid='loadtest', access_token=SECRET))
+        session.commit()
+
+
+def cleanup_database(generator: WebhookGenerator) -> None:
+    from sqlalchemy import delete
+
+    from src.database import SyncSession
+    from src.gitlab.models import Project
+    from src.mattermost.models import Bot, Channel, GitlabProjectChannel
+
+    with SyncSession() as session:
+        session.execute(delete(GitlabProjectChannel).where(
+            GitlabProjectChannel.gitlab_project_id.in_(generator.project_ids)
+        ))
+        session.execute(delete(Channel).where(Channel.iid.startswith('lt')))
+        session.execute(delete(Project).where(Project.id.in_(generator.project_ids)))
+        session.execute(delete(Bot).where(Bot.iid == 'loadtest'))
+        session.commit()
+
+
+def start_app(args: argparse.Namespace, env: dict) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'uvicorn', 'src.main:app', '--host', '127.0.0.1', '--port', str(args.app_port),
+            '--workers', str(args.workers), '--log-level', 'warning', '--no-access-log'
+        ],
+        env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.post(f'http://127.0.0.1:{args.app_port}/mattermost/ping').raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Приложение не запустилось')
+
+
+async def fire(args: argparse.Namespace, generator: WebhookGenerator) -> tuple[dict[int, float], list[float], int, int]:
+    """
+    Отправка вебхуков в приложение
+    :return: момент отправки каждого вебхука, задержки приема, кол-во ошибок и ожидаемых сообщений
+    """
+    url = f'http://127.0.0.1:{args.app_port}/gitlab/webhook'
+    headers = {'X-Gitlab-Token': SECRET, 'X-Gitlab-Event': 'Pipeline Hook'}
+    sent_at: dict[int, float] = {}
+    latencies: list[float] = []
+    errors = expected = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    interval = 1 / args.rate if args.rate else 0
+    start = time.monotonic()
+
+    async def send(client: httpx.AsyncClient, seq: int, payload: dict):
+        nonlocal errors
+        async with semaphore:
+            began = time.monotonic()
+            sent_at[seq] = began
+            try:
+                response = await client.post(url, json=payload, headers=headers)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.monotonic() - began)
+
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        tasks = []
+        for index in range(args.requests):
+            seq, payload = generator.make()
+            expected += generator.expected_posts(payload)
+            if interval:
+                await asyncio.sleep(max(0.0, start + index * interval - time.monotonic()))
+            tasks.append(asyncio.create_task(send(client, seq, payload)))
+        await asyncio.gather(*tasks)
+    return sent_at, latencies, errors, expected
+
+
+def main() -> None:
+    args = parse_args()
+    log = DeliveryLog()
+    mm_faults = Faults(latency=args.mm_latency, jitter=args.mm_jitter, error_rate=args.mm_error_rate)
+    gl_faults = Faults(latency=args.gl_latency, error_rate=args.gl_error_rate)
+    gl_url = f'http://127.0.0.1:{args.gl_port}'
+
+    env = {
+        **os.environ,
+        'MATTERMOST_HOST': f'http://127.0.0.1:{args.mm_port}/',
+        'GITLAB_URL': gl_url,
+        'GITLAB_SECRET': SECRET,
+        'DIGEST_THRESHOLD': str(args.digest_threshold),
+    }
+    os.environ.update(env)
+    generator = WebhookGenerator(
+        gitlab_url=gl_url,
+        projects=args.projects,
+        channels_per_project=args.channels,
+        jobs=args.jobs,
+        status_mix=parse_status_mix(args.status_mix),
+        seed=args.seed
+    )
+
+    with StubServer(create_mattermost_stub(log, mm_faults), args.mm_port), \
+            StubServer(create_gitlab_stub(gl_url, gl_faults), args.gl_port):
+        seed_database(generator)
+        app = start_app(args, env)
+        try:
+            start = time.monotonic()
+            sent_at, ingest, ingest_errors, expected = asyncio.run(fire(args, generator))
+            ingest_elapsed = time.monotonic() - start
+            deadline = time.monotonic() + args.drain_timeout
+            while log.total < expected and time.monotonic() < deadline:
+                time.sleep(0.05)
+            delivery_elapsed = time.monotonic() - start
+        finally:
+            app.terminate()
+            app.wait()
+            cleanup_database(generator)
+
+    delivery = [
+        moment - sent_at[seq] for seq, moments in log.received.items() if seq in sent_at for moment in moments
+    ]
+    report = {
+        'ingest': {**summary(ingest, ingest_elapsed), 'errors': ingest_errors},
+        'delivery': {
+            **summary(delivery, delivery_elapsed),
+            'expected': expected,
+            'missing': max(0, expected - len(delivery)),
+            'upstream_errors': log.errors
+        },
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for stage, values in report.items():
+        print(f'{stage}: ' + ', '.join(f'{key}={value}' for key, value in values.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import random
+import re
+from dataclasses import dataclass, field
+
+# Статусы, по которым приложение отправляет сообщения в Mattermost
+NOTIFY_STATUSES = ('success', 'warning', 'failed')
+
+MARKER_RE = re.compile(r'\[lt:(\d+)]')
+
+
+def parse_status_mix(value: str) -> dict[str, float]:
+    """
+    Разбор строки вида "success=0.7,failed=0.2,warning=0.1"
+    :param value: строка с долями статусов
+    :return: словарь статус -> вес
+    """
+    mix = {}
+    for item in value.split(','):
+        status, _, weight = item.partition('=')
+        mix[status.strip()] = float(weight or 1)
+    return mix
+
+
+@dataclass
+class WebhookGenerator:
+    """Генератор синтетических pipeline-вебхуков GitLab"""
+    gitlab_url: str
+    projects: int = 10
+    channels_per_project: int = 1
+    jobs: int = 20
+    status_mix: dict[str, float] = field(default_factory=lambda: {'success': 0.7, 'failed': 0.2, 'warning': 0.1})
+    project_id_offset: int = 900_000_000
+    seed: int | None = None
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._statuses = list(self.status_mix)
+        self._weights = [self.status_mix[item] for item in self._statuses]
+        self._seq = 0
+
+    @property
+    def project_ids(self) -> list[int]:
+        return [self.project_id_offset + index for index in range(self.projects)]
+
+    def channel_iids(self, project_id: int) -> list[str]:
+        """ID каналов Mattermost, на которые подписан проект"""
+        return [f'lt{project_id}c{index}' for index in range(self.channels_per_project)]
+
+    def project_attrs(self, project_id: int) -> dict:
+        path = f'loadtest/project-{project_id}'
+        return {
+            'id': project_id,
+            'name': f'project-{project_id}',
+            'web_url': f'{self.gitlab_url}/{path}',
+            'path_with_namespace': path,
+            'avatar_url': f'{self.gitlab_url}/avatars/project/{project_id}.png'
+        }
+
+    def _builds(self, status: str) -> list[dict]:
+        builds = [
+            {'stage': f'stage-{index % 4}', 'name': f'job-{index}', 'status': 'success', 'allow_failure': False}
+            for index in range(self.jobs)
+        ]
+        if not builds:
+            return builds
+        victim = builds[self._random.randrange(len(builds))]
+        if status == 'failed':
+            victim['status'] = 'failed'
+        elif status == 'warning':
+            victim.update(status='failed', allow_failure=True)
+        elif status not in NOTIFY_STATUSES:
+            victim['status'] = status
+        return builds
+
+    def make(self) -> tuple[int, dict]:
+        """
+        Очередной вебхук
+        :return: порядковый номер (он же маркер в тексте коммита) и тело вебхука
+        """
+        self._seq += 1
+        seq = self._seq
+        project_id = self._random.choice(self.project_ids)
+        status = self._random.choices(self._statuses, self._weights)[0]
+        project = self.project_attrs(project_id)
+        return seq, {
+            'object_kind': 'pipeline',
+            'builds': self._builds(status),
+            'object_attributes': {
+                'id': seq,
+                'iid': seq,
+                'ref': self._random.choice(['main', 'develop', f'feature/{seq % 7}']),
+                'source': 'push',
+                # warning GitLab не присылает: это success с упавшей задачей allow_failure
+                'status': 'success' if status == 'warning' else status,
+                'url': f'{project["web_url"]}/-/pipelines/{seq}'
+            },
+            'user': {
+                'id': 1,
+                'name': 'Load Test',
+                'username': 'loadtest',
+                'avatar_url': f'{self.gitlab_url}/avatars/user/1.png',
+                'email': '[REDACTED]'
+            },
+            'project': project,
+            'commit': {
+                'id': f'{seq:040x}',
+                'title': f'Commit [lt:{seq}]',
+                'url': f'{project["web_url"]}/-/commit/{seq:040x}'
+            }
+        }
+
+    def expected_posts(self, payload: dict) -> int:
+        """Сколько сообщений должно уйти в Mattermost по этому вебхуку"""
+        status = payload['object_attributes']['status']
+        if status not in NOTIFY_STATUSES:
+            return 0
+        return self.channels_per_project
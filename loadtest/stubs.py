@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from .generator import MARKER_RE
+
+# Прозрачный PNG 1x1 для аватарок
+PIXEL_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082'
+)
+
+
+@dataclass
+class Faults:
+    """Вносимые заглушкой задержки и ошибки"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    async def apply(self) -> Response | None:
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return JSONResponse({'message': 'injected error'}, status_code=self.error_status)
+        return None
+
+
+@dataclass
+class DeliveryLog:
+    """Журнал принятых заглушкой Mattermost сообщений: маркер вебхука -> моменты получения"""
+    received: dict[int, list[float]] = field(default_factory=dict)
+    unmarked: int = 0
+    errors: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, message: str) -> None:
+        now = time.monotonic()
+        match = MARKER_RE.search(message)
+        with self._lock:
+            if not match:
+                self.unmarked += 1
+                return
+            self.received.setdefault(int(match.group(1)), []).append(now)
+
+    @property
+    def total(self) -> int:
+        return sum(len(item) for item in self.received.values())
+
+
+def create_mattermost_stub(log: DeliveryLog, faults: Faults | None = None) -> FastAPI:
+    """Заглушка REST API Mattermost: принимает сообщения и пишет их в журнал"""
+    faults = faults or Faults()
+    app = FastAPI()
+
+    @app.post('/api/v4/posts')
+    async def create_post(request: Request):
+        if error := await faults.apply():
+            log.errors += 1
+            return error
+        data = await request.json()
+        log.add(data.get('message', ''))
+        return JSONResponse({'id': f'post{time.monotonic_ns()}', 'channel_id': data.get('channel_id')}, 201)
+
+    @app.post('/api/v4/channels/direct')
+    async def create_direct_channel(request: Request):
+        if error := await faults.apply():
+            return error
+        user_ids = sorted(await request.json())
+        return JSONResponse({'id': 'dm' + ''.join(user_ids)[:24], 'type': 'D'}, 201)
+
+    return app
+
+
+def create_gitlab_stub(base_url: str, faults: Faults | None = None) -> FastAPI:
+    """Заглушка REST API GitLab: отвечает на вызовы, которые делает GitlabAPI"""
+    faults = faults or Faults()
+    app = FastAPI()
+    hooks: dict[int, list[dict]] = {}
+    hook_ids = itertools.count(1)
+
+    def project(project_id: int) -> dict:
+        path = f'loadtest/project-{project_id}'
+        return {
+            'id': project_id,
+            'name': f'project-{project_id}',
+            'web_url': f'{base_url}/{path}',
+            'path_with_namespace': path,
+            'avatar_url': f'{base_url}/avatars/project/{project_id}.png'
+        }
+
+    @app.middleware('http')
+    async def inject_faults(request: Request, call_next):
+        if error := await faults.apply():
+            return error
+        return await call_next(request)
+
+    @app.get('/api/v4/user')
+    async def current_user():
+        return {
+            'id': 1, 'name': 'Load Test', 'username': 'loadtest',
+            'avatar_url': f'{base_url}/avatars/user/1.png', 'email': '[REDACTED]'
+        }
+
+    @app.get('/api/v4/projects')
+    async def list_projects(page: int = 1, per_page: int = 100):
+        start = 900_000_000 + (page - 1) * per_page
+        return [project(project_id) for project_id in range(start, start + min(per_page, 100))] if page <= 3 else []
+
+    @app.get('/api/v4/projects/{project_id}')
+    async def get_project(project_id: int):
+        return project(project_id)
+
+    @app.get('/api/v4/projects/{project_id}/hooks')
+    async def list_hooks(project_id: int):
+        return hooks.get(project_id, [])
+
+    @app.post('/api/v4/projects/{project_id}/hooks')
+    async def create_hook(project_id: int, request: Request):
+        data = await request.json()
+        hook = {'id': next(hook_ids), 'url': data['url'], 'project_id': project_id, 'pipeline_events': True}
+        hooks.setdefault(project_id, []).append(hook)
+        return JSONResponse(hook, 201)
+
+    @app.get('/avatars/{kind}/{name}')
+    async def avatar(kind: str, name: str):
+        return Response(PIXEL_PNG, media_type='image/png')
+
+    return app
+
+
+class StubServer:
+    """Запуск ASGI-приложения через uvicorn в фоновом потоке"""
+
+    def __init__(self, app: FastAPI, port: int, host: str = '127.0.0.1'):
+        self.url = f'http://{host}:{port}'
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level='warning', access_log=False))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> 'StubServer':
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.should_exit = True
+        self.thread.join()
@@ -0,0 +1,189 @@
+"""
+Двухуровневый кэш: LRU в памяти процесса поверх общего Redis.
+
+Значения хранятся в Redis в виде JSON, сериализуемого через TypeAdapter (подходят схемы pydantic, списки схем,
+None для отрицательного кэширования). При удалении ключа по pub/sub рассылается инвалидация, и все воркеры
+сбрасывают его из памяти. Если Redis недоступен, кэш работает только в памяти.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, Generic, TypeVar
+
+from pydantic import TypeAdapter
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config.redis import redis_client
+from src.metrics import Counter
+
+T = TypeVar('T')
+
+INVALIDATION_CHANNEL = 'matterlab:cache:invalidate'
+
+MISSING: Any = object()
+
+cache_requests = Counter(
+    'matterlab_cache_requests_total', 'Обращения к кэшу по уровням', labels=('cache', 'tier', 'result')
+)
+
+
+class MemoryCache:
+    """LRU в памяти процесса с ограничением по кол-ву ключей и временем жизни"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:  # noqa: A003
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """Общий для всех воркеров уровень кэша. Значения - байты"""
+
+    def __init__(self, client: Redis, prefix: str, ttl: float = 300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f'{self.prefix}:{key}'
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(self._key(key))
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None) -> None:  # noqa: A003
+        await self.client.set(self._key(key), value, px=int((self.ttl if ttl is None else ttl) * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self._key(key))
+
+
+class TieredCache(Generic[T]):
+    """
+    Кэш значений одного типа: память процесса -> Redis -> загрузчик.
+    Все экземпляры регистрируются по имени, чтобы принимать инвалидацию от других воркеров
+    """
+
+    instances: dict[str, 'TieredCache'] = {}
+
+    def __init__(
+            self, name: str, type_: Any, ttl: float = 300, memory_ttl: float | None = None, max_size: int = 1024,
+            redis: Redis | None = redis_client
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.adapter: TypeAdapter[T] = TypeAdapter(type_)
+        self.memory = MemoryCache(max_size=max_size, ttl=ttl if memory_ttl is None else memory_ttl)
+        self.redis = RedisCache(redis, prefix=f'matterlab:cache:{name}', ttl=ttl) if redis is not None else None
+        TieredCache.instances[name] = self
+
+    async def get(self, key: str) -> T:
+        """
+        Значение из кэша
+        :return: значение или MISSING, если его нет ни на одном уровне
+        """
+        value = self.memory.get(key)
+        if value is not MISSING:
+            cache_requests.inc(cache=self.name, tier='memory', result='hit')
+            return value
+        cache_requests.inc(cache=self.name, tier='memory', result='miss')
+        if self.redis is None:
+            return MISSING
+        try:
+            raw = await self.redis.get(key)
+        except (RedisError, OSError):
+            logging.debug('Redis недоступен, кэш %s работает только в памяти', self.name)
+            return MISSING
+        if raw is None:
+            cache_requests.inc(cache=self.name, tier='redis', result='miss')
+            return MISSING
+        cache_requests.inc(cache=self.name, tier='redis', result='hit')
+        value = self.adapter.validate_json(raw)
+        self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: T, ttl: float | None = None) -> None:  # noqa: A003
+        self.memory.set(key, value, ttl)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, self.adapter.dump_json(value, by_alias=True), ttl)
+        except (RedisError, OSError):
+            logging.debug('Redis недоступен, значение %s:%s сохранено только в памяти', self.name, key)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[T]], ttl: float | None = None) -> T:
+        value = await self.get(key)
+        if value is MISSING:
+            value = await loader()
+            await self.set(key, value, ttl)
+        return value
+
+    async def delete(self, key: str) -> None:
+        """Удаление ключа на всех уровнях и во всех воркерах"""
+        self.memory.delete(key)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.delete(key)
+            await self.redis.client.publish(INVALIDATION_CHANNEL, f'{self.name}:{key}')
+        except (RedisError, OSError):
+            logging.warning('Не удалось разослать инвалидацию %s:%s', self.name, key)
+
+
+def apply_invalidation(message: str) -> None:
+    name, _, key = message.partition(':')
+    if cache := TieredCache.instances.get(name):
+        cache.memory.delete(key)
+
+
+async def listen_invalidations(client: Redis = redis_client) -> None:
+    """Прием инвалидаций от других воркеров. Работает до отмены задачи, переподключаясь к Redis при сбоях"""
+    while True:
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        apply_invalidation(message['data'].decode())
+        except (RedisError, OSError):
+            # Пока подписки нет, инвалидации могли потеряться: сбрасываем память целиком
+            for cache in TieredCache.instances.values():
+                cache.memory.clear()
+            await asyncio.sleep(1)
+
+
+_listener: asyncio.Task | None = None
+
+
+def start_invalidation_listener() -> None:
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(listen_invalidations())
@@ -1,3 +1,7 @@
+from redis.asyncio import Redis
+
 from .settings import settings
 
 REDIS_URL = settings.redis_url
+
+redis_client = Redis.from_url(REDIS_URL)
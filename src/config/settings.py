@@ -1,3 +1,7 @@
+import tempfile
+from pathlib import Path
+from typing import Literal
+
 from pydantic import Field, HttpUrl
 from pydantic_settings import BaseSettings
 
@@ -10,14 +14,99 @@ class Settings(BaseSettings):
     db_port: int = 5432
     db_user: str
     db_password: str
+    # Реплика для чтения (необязательно). При отставании больше db_replica_max_lag (с) чтение идет с основной базы
+    db_replica_host: str | None = None
+    db_replica_port: int = 5432
+    db_replica_max_lag: float = 5.0
+    db_replica_check_interval: float = 1.0
     
     redis_host: str = 'localhost'
     redis_port: int = 6379
 
+    gitlab_url: HttpUrl = Field(default='https://gitlab.com')
     gitlab_secret: str
 
+    # Бюджет фоновых и массовых запросов к GitLab: запросов в секунду, запас, одновременных запросов
+    gitlab_rate_limit: float = 10.0
+    gitlab_rate_burst: int = 20
+    gitlab_concurrency: int = 10
+    # Максимум проектов группы при прикреплении группы к каналу
+    gitlab_group_max_projects: int = 500
+    # Вебхуки при прикреплении группы: один хук группы (нужен GitLab Premium, иначе - хуки проектов) или хуки проектов
+    gitlab_hook_mode: Literal['group', 'project'] = 'group'
+    # Проекты без каналов: сколько помнить, что события проекта некуда отправлять (с), через сколько после
+    # открепления последнего канала удалять хук проекта (с) и как часто их искать (с)
+    unrouted_project_ttl: int = 10 * 60
+    hook_prune_grace: float = 7 * 24 * 60 * 60
+    hook_prune_interval: float = 60 * 60
+    # Обновление названий, путей и аватаров проектов через GraphQL: как часто (с), через сколько после прошлой
+    # сверки проект проверяется снова (с), проектов в одном запросе (GitLab отдает не больше 100 за страницу)
+    # и максимум проектов за запуск
+    project_sync_interval: float = 60 * 60
+    project_sync_max_age: float = 24 * 60 * 60
+    project_sync_batch_size: int = Field(default=100, ge=1, le=100)
+    project_sync_limit: int = 5000
+    # Проверка сохраненных токенов (с) и за сколько дней до окончания действия предупреждать пользователя
+    token_sweep_interval: float = 6 * 60 * 60
+    token_expiry_warning_days: int = 7
+    token_expiry_notify: bool = True
+
     mattermost_host: HttpUrl
     mattermost_app_root_url: HttpUrl | None = Field(default=None)
+    mattermost_cache_max_age: int = 60
+    # Максимум вариантов в ответе на lookup динамического селекта
+    mattermost_lookup_limit: int = 25
+
+    # Прокси аватаров GitLab: каталог и общий размер дискового кэша, максимальный размер одного аватара (байт),
+    # время (с), после которого аватар загружается заново
+    avatar_cache_dir: Path = Field(default=Path(tempfile.gettempdir()) / 'matterlab-avatars')
+    avatar_cache_size: int = 100 * 1024 * 1024
+    avatar_max_size: int = 1024 * 1024
+    avatar_ttl: int = 24 * 60 * 60
+
+    # Окно (с) и порог событий на канал, после которого уведомления складываются в сводку. 0 - без сводок
+    digest_window: float = 60.0
+    digest_threshold: int = 5
+
+    # Локальная очередь вебхуков на время недоступности базы/Redis. Каталог должен быть общим у API и воркера
+    spool_dir: Path = Field(default=Path(tempfile.gettempdir()) / 'matterlab-spool')
+    spool_segment_size: int = 16 * 1024 * 1024
+    spool_max_bytes: int = 1024 * 1024 * 1024
+    spool_fsync_batch: int = 64
+    spool_fsync_interval: float = 0.2
+    # Сколько ждать (с) перед повторной попыткой обработать вебхук напрямую после сбоя бэкенда
+    spool_retry_interval: float = 5.0
+    spool_drain_interval: float = 1.0
+
+    # Прием вебхуков: выше high water сбрасываются успешные pipeline (429), выше max pending - все (503)
+    admission_high_water: int = 2000
+    admission_max_pending: int = 10000
+    admission_retry_after: int = 30
+
+    # Статистика pipeline: период по умолчанию и максимальный (дни), строк в ответе, проверка секций событий (с)
+    pipeline_stats_days: int = 7
+    pipeline_stats_max_days: int = 90
+    pipeline_stats_limit: int = 20
+    pipeline_partition_interval: float = 6 * 60 * 60
+    # Сколько дней помнить принятые события pipeline для отсева повторных доставок
+    pipeline_event_key_days: int = 7
+    # Максимум веток в ответе команды status
+    pipeline_status_limit: int = 100
+
+    # Личные сообщения автору упавшего pipeline. Время жизни кэша связки аккаунтов (с), для несвязанных - короче
+    author_dm_enabled: bool = True
+    author_cache_ttl: int = 60 * 60
+    author_negative_ttl: int = 10 * 60
+    direct_channel_cache_ttl: int = 7 * 24 * 60 * 60
+
+    delivery_workers: int = 16
+    delivery_retries: int = 2
+
+    reminder_poll_interval: float = 1.0
+    reminder_batch_size: int = 500
+    reminder_concurrency: int = 20
+    # Проверка индекса напоминаний в Redis: потеря данных Redis и напоминания, не принятые им при создании, с
+    reminder_repair_interval: float = 60.0
 
     @property
     def db_url(self) -> str:
@@ -27,6 +116,15 @@ class Settings(BaseSettings):
     def db_async_url(self) -> str:
         return f'postgresql+asyncpg://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/postgres'
     
+    @property
+    def db_replica_async_url(self) -> str | None:
+        if not self.db_replica_host:
+            return None
+        return (
+            f'postgresql+asyncpg://{self.db_user}:{self.db_password}@{self.db_replica_host}:{self.db_replica_port}'
+            f'/postgres'
+        )
+
     @property
     def redis_url(self) -> str:
         return f'redis://{self.redis_host}:{self.redis_port}/0'
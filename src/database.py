@@ -1,14 +1,115 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+import asyncio
+import logging
+import time
+
+from sqlalchemy import Select, create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from .config import settings
+from .metrics import Gauge
 
 engine = create_engine(settings.db_url)
 SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 async_engine = create_async_engine(settings.db_async_url)
-AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+replica_engine = create_async_engine(settings.db_replica_async_url) if settings.db_replica_async_url else None
+
+# Отставание реплики, с. Пока реплика догоняет поток WAL, lag = 0; NULL (не реплика) тоже считается нулем
+REPLICA_LAG_QUERY = text("""
+    SELECT COALESCE(
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END,
+        0
+    )
+""")
+
+# Флаг в Session.info: сессия писала в основную базу и дальше читает только с нее
+WROTE_KEY = 'wrote_to_primary'
+
+
+class ReplicaMonitor:
+    """Периодическая проверка отставания реплики. Без свежей проверки реплика считается недоступной"""
+
+    def __init__(self, engine_: AsyncEngine | None, max_lag: float, interval: float):
+        self.engine = engine_
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lag: float | None = None
+        self.checked_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            self.lag is not None
+            and self.lag <= self.max_lag
+            and time.monotonic() - self.checked_at < self.interval * 3
+        )
+
+    async def check(self) -> None:
+        try:
+            async with self.engine.connect() as connection:
+                self.lag = float((await connection.execute(REPLICA_LAG_QUERY)).scalar_one())
+        except (DBAPIError, OSError):
+            logging.warning('Реплика недоступна, чтение идет с основной базы')
+            self.lag = None
+        self.checked_at = time.monotonic()
+
+    async def run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.engine is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+
+replica_monitor = ReplicaMonitor(
+    replica_engine, max_lag=settings.db_replica_max_lag, interval=settings.db_replica_check_interval
+)
+
+
+class RoutingSession(Session):
+    """
+    Сессия, отправляющая чтение на реплику, а запись - в основную базу.
+    После первой записи сессия читает только с основной базы (read-your-writes)
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = async_engine.sync_engine
+        if replica_engine is None or self.info.get(WROTE_KEY):
+            return primary
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info[WROTE_KEY] = True
+            return primary
+        if not replica_monitor.healthy:
+            return primary
+        return replica_engine.sync_engine
+
+
+def use_primary(session: Session) -> None:
+    """
+    Дальнейшее чтение сессии - только с основной базы. Нужно там, где отстающая реплика недопустима:
+    get-or-create (иначе свежая строка не найдется и вставится дубль) и перезагрузка кэша после его сброса
+    """
+    session.info[WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def mark_written(session: Session, flush_context) -> None:
+    session.info[WROTE_KEY] = True
+
+
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False, sync_session_class=RoutingSession)
+
+if replica_engine is not None:
+    Gauge(
+        'matterlab_db_replica_lag_seconds', 'Отставание реплики, -1 - реплика недоступна',
+        func=lambda: -1 if replica_monitor.lag is None else replica_monitor.lag
+    )
 
 
 class Model(AsyncAttrs, DeclarativeBase):
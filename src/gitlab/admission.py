@@ -0,0 +1,82 @@
+"""
+Контроль приема вебхуков по объему необработанной работы.
+
+Бэклог - вебхуки, которые еще разбираются в фоне, события в сводках и сообщения в очередях доставки.
+Выше settings.admission_high_water сбрасываются успешные и отмененные pipeline (429),
+выше settings.admission_max_pending - все вебхуки (503). В обоих случаях отдается Retry-After,
+чтобы GitLab повторил запрос позже.
+"""
+from collections.abc import Awaitable, Callable
+from typing import ParamSpec
+
+from fastapi import HTTPException, status
+
+from src.config import settings
+from src.mattermost.delivery import delivery_scheduler
+from src.mattermost.digest import channel_digest
+from src.metrics import Counter, Gauge
+
+from .schemas import Status
+
+P = ParamSpec('P')
+
+# Статусы, которые можно сбросить первыми: их потеря почти ничего не стоит
+LOW_PRIORITY_STATUSES = (Status.success, Status.canceled)
+
+webhooks_shed = Counter(
+    'matterlab_webhooks_shed_total', 'Вебхуки, отклоненные из-за перегрузки', labels=('status', 'code')
+)
+
+
+class AdmissionControl:
+
+    def __init__(self, high_water: int, max_pending: int, retry_after: int, backlog: Callable[[], int]):
+        self.high_water = high_water
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._backlog = backlog
+        self.in_flight = 0
+
+    @property
+    def backlog(self) -> int:
+        return self.in_flight + self._backlog()
+
+    def _reject(self, code: int, pipeline_status: str) -> HTTPException:
+        webhooks_shed.inc(status=pipeline_status, code=str(code))
+        return HTTPException(
+            status_code=code, detail='Приложение перегружено', headers={'Retry-After': str(self.retry_after)}
+        )
+
+    def check_capacity(self) -> None:
+        """
+        Проверка до разбора тела: при заполненном бэклоге отказ всем
+        :raises HTTPException: 503 с Retry-After
+        """
+        if self.backlog >= self.max_pending:
+            raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, 'unknown')
+
+    def check(self, event_status: Status | None) -> None:
+        """
+        Проверка разобранного вебхука: выше high water сбрасываются низкоприоритетные статусы
+        :raises HTTPException: 429 с Retry-After
+        """
+        if event_status in LOW_PRIORITY_STATUSES and self.backlog >= self.high_water:
+            raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, event_status)
+
+    async def run(self, func: Callable[P, Awaitable[None]], *args: P.args, **kwargs: P.kwargs) -> None:
+        """Выполнение фоновой обработки с учетом ее в бэклоге"""
+        self.in_flight += 1
+        try:
+            await func(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+
+admission = AdmissionControl(
+    high_water=settings.admission_high_water,
+    max_pending=settings.admission_max_pending,
+    retry_after=settings.admission_retry_after,
+    backlog=lambda: delivery_scheduler.pending + channel_digest.pending
+)
+
+Gauge('matterlab_webhook_backlog', 'Необработанные вебхуки и сообщения', func=lambda: admission.backlog)
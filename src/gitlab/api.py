@@ -1,11 +1,79 @@
+import asyncio
 import enum
+import hashlib
+import time
+from urllib.parse import quote
 
 import httpx
 
+from src.cache import TieredCache
 from src.config import settings
 
 from . import schemas
-from .exceptions import GitlabException
+from .exceptions import GitlabException, InvalidTokenException
+
+# Ключи кэшей включают хэш токена: разные пользователи видят в GitLab разное
+current_user_cache = TieredCache('gitlab_current_user', schemas.GitlabUser, ttl=60)
+project_cache = TieredCache('gitlab_project', schemas.ProjectAttrs, ttl=300)
+webhooks_cache = TieredCache('gitlab_webhooks', list[schemas.HookData], ttl=300)
+
+
+PROJECT_GID_PREFIX = 'gid://gitlab/Project/'
+PROJECTS_METADATA_QUERY = """
+query($ids: [ID!]) {
+  projects(ids: $ids, first: 100) {
+    nodes { id name fullPath webUrl avatarUrl }
+  }
+}
+"""
+
+
+class RateBudget:
+    """
+    Бюджет запросов к GitLab для фоновых и массовых операций: не больше rate запросов в секунду
+    (token bucket с запасом burst) и не больше concurrency одновременных запросов
+    """
+
+    def __init__(self, rate: float, burst: int, concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self) -> 'RateBudget':
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self._semaphore.acquire()
+        try:
+            await self.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._semaphore.release()
+
+
+gitlab_budget = RateBudget(
+    rate=settings.gitlab_rate_limit, burst=settings.gitlab_rate_burst, concurrency=settings.gitlab_concurrency
+)
 
 
 class GitlabAPI:
@@ -13,15 +81,25 @@ class GitlabAPI:
 
     def __init__(self, access_token: str):
         version = 'v4'
-        self.base_url = f'https://gitlab.com/api/{version}'
+        self.base_url = f'{str(settings.gitlab_url).rstrip("/")}/api/{version}'
         self.headers = {'Authorization': f'Bearer {access_token}'}
+        self.cache_prefix = hashlib.sha256(access_token.encode()).hexdigest()[:16]
 
     class Endpoints(enum.StrEnum):
         list_projects = '/projects'
         get_project = '/projects/{id}'
+        get_group = '/groups/{id}'
+        list_group_projects = '/groups/{id}/projects'
+        create_group_webhook = '/groups/{id}/hooks'
+        list_group_webhooks = create_group_webhook
+        delete_webhook = '/projects/{id}/hooks/{hook_id}'
+        update_webhook = delete_webhook
+        update_group_webhook = '/groups/{id}/hooks/{hook_id}'
+        delete_group_webhook = update_group_webhook
         create_webhook = '/projects/{id}/hooks'
         list_webhooks = create_webhook
         get_current_user = '/user'
+        get_token_info = '/personal_access_tokens/self'
 
     @staticmethod
     def _parse_response(response: httpx.Response) -> dict:
@@ -48,12 +126,26 @@ class GitlabAPI:
         Получение информации о пользователе, кому принадлежит access_token
         :return: Объект схемы GitlabUser (src.gitlab.schemas.GitlabUser)
         """
+        return await current_user_cache.get_or_load(self.cache_prefix, self._fetch_current_user)
+
+    async def _fetch_current_user(self) -> schemas.GitlabUser:
         url = self._get_url(self.Endpoints.get_current_user)
         async with httpx.AsyncClient() as client:
             response = await client.get(url, headers=self.headers)
         response = self._parse_response(response)
         return schemas.GitlabUser(**response)
 
+    async def get_token_info(self) -> schemas.TokenInfo:
+        """
+        Информация о токене, которым выполняется запрос
+        :raises InvalidTokenException: токен истек, отозван или не существует
+        """
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(self._get_url(self.Endpoints.get_token_info), headers=self.headers)
+        if response.status_code == 401:
+            raise InvalidTokenException(response.json())
+        return schemas.TokenInfo(**self._parse_response(response))
+
     async def get_projects(self, search: str | None = None) -> list[schemas.ProjectAttrs]:
         """
         Получение списка активных проектов, в которых пользователь является участником
@@ -87,7 +179,70 @@ class GitlabAPI:
                 page += 1
         return result
 
+    async def get_group(self, group_path: str) -> schemas.GroupAttrs:
+        url = self._get_url(self.Endpoints.get_group).replace('{id}', quote(group_path.strip('/'), safe=''))
+        async with httpx.AsyncClient(timeout=10) as client:
+            response = await client.get(url, headers=self.headers, params={'with_projects': False})
+        return schemas.GroupAttrs(**self._parse_response(response))
+
+    async def get_group_projects(self, group_path: str, limit: int) -> list[schemas.ProjectAttrs]:
+        """
+        Получение активных проектов группы и ее подгрупп
+        :param group_path: путь группы (например, my-group/backend)
+        :param limit: максимум проектов
+        :return: список объектов схемы ProjectAttrs (src.gitlab.schemas.ProjectAttrs)
+        """
+        url = self._get_url(self.Endpoints.list_group_projects).replace('{id}', quote(group_path.strip('/'), safe=''))
+        per_page = 100
+        page = 1
+        result = []
+        async with httpx.AsyncClient(timeout=10) as client:
+            while len(result) < limit:
+                params = {
+                    'archived': False,
+                    'include_subgroups': True,
+                    'simple': True,
+                    'order_by': 'path',
+                    'sort': 'asc',
+                    'per_page': per_page,
+                    'page': page
+                }
+                response = await client.get(url, headers=self.headers, params=params)
+                response = self._parse_response(response)
+                result.extend([schemas.ProjectAttrs(**item) for item in response])
+                if len(response) < per_page:
+                    break
+                page += 1
+        return result[:limit]
+
+    async def get_projects_metadata(self, project_ids: list[int]) -> list[schemas.ProjectAttrs]:
+        """
+        Получение метаданных нескольких проектов одним запросом GraphQL. https://docs.gitlab.com/ee/api/graphql/
+        :param project_ids: ID проектов, не больше 100 (размер страницы GraphQL)
+        :return: список объектов схемы ProjectAttrs; удаленных и недоступных токену проектов в нем нет
+        """
+        url = f'{str(settings.gitlab_url).rstrip("/")}/api/graphql'
+        variables = {'ids': [f'{PROJECT_GID_PREFIX}{project_id}' for project_id in project_ids]}
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.post(
+                url, headers=self.headers, json={'query': PROJECTS_METADATA_QUERY, 'variables': variables}
+            )
+        response = self._parse_response(response)
+        if response.get('errors'):
+            raise GitlabException(response['errors'])
+        return [
+            schemas.ProjectAttrs(
+                id=int(node['id'].removeprefix(PROJECT_GID_PREFIX)), name=node['name'], web_url=node['webUrl'],
+                path_with_namespace=node['fullPath'], avatar_url=node['avatarUrl']
+            ) for node in response['data']['projects']['nodes']
+        ]
+
     async def get_project_detail(self, project_id: int) -> schemas.ProjectAttrs:
+        return await project_cache.get_or_load(
+            f'{self.cache_prefix}:{project_id}', lambda: self._fetch_project_detail(project_id)
+        )
+
+    async def _fetch_project_detail(self, project_id: int) -> schemas.ProjectAttrs:
         url = self._get_url(self.Endpoints.get_project)
         url = url.replace('{id}', str(project_id))
         async with httpx.AsyncClient() as session:
@@ -96,6 +251,11 @@ class GitlabAPI:
         return schemas.ProjectAttrs(**response)
 
     async def get_webhooks(self, project_id: int) -> list[schemas.HookData]:
+        return await webhooks_cache.get_or_load(
+            f'{self.cache_prefix}:{project_id}', lambda: self._fetch_webhooks(project_id)
+        )
+
+    async def _fetch_webhooks(self, project_id: int) -> list[schemas.HookData]:
         url = self._get_url(self.Endpoints.list_webhooks)
         url = url.replace('{id}', str(project_id))
         async with httpx.AsyncClient() as session:
@@ -103,16 +263,75 @@ class GitlabAPI:
         response = self._parse_response(response)
         return [schemas.HookData(**item) for item in response]
 
-    async def create_webhook(self, project_id: int, webhook_url: str) -> None:
-        url = self._get_url(self.Endpoints.create_webhook)
-        url = url.replace('{id}', str(project_id))
-        data = {
+    @staticmethod
+    def webhook_data(webhook_url: str) -> dict:
+        """Настройки хука приложения: одинаковые для хуков проектов и групп"""
+        return {
             'url': webhook_url,
             'enable_ssl_verification': False,
             'pipeline_events': True,
+            'merge_requests_events': True,
+            'deployment_events': True,
             'push_events': False,
             'token': settings.gitlab_secret
         }
+
+    async def create_webhook(self, project_id: int, webhook_url: str) -> None:
+        url = self._get_url(self.Endpoints.create_webhook)
+        url = url.replace('{id}', str(project_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.post(url, headers=self.headers, json=self.webhook_data(webhook_url))
+        self._parse_response(response)
+        await webhooks_cache.delete(f'{self.cache_prefix}:{project_id}')
+
+    async def update_webhook(self, project_id: int, hook_id: int, webhook_url: str) -> None:
+        """Приведение настроек существующего хука проекта к webhook_data"""
+        url = self._get_url(self.Endpoints.update_webhook)
+        url = url.replace('{id}', str(project_id)).replace('{hook_id}', str(hook_id))
         async with httpx.AsyncClient() as session:
-            response = await session.post(url, headers=self.headers, json=data)
+            response = await session.put(url, headers=self.headers, json=self.webhook_data(webhook_url))
         self._parse_response(response)
+        await webhooks_cache.delete(f'{self.cache_prefix}:{project_id}')
+
+    async def delete_webhook(self, project_id: int, hook_id: int) -> None:
+        url = self._get_url(self.Endpoints.delete_webhook)
+        url = url.replace('{id}', str(project_id)).replace('{hook_id}', str(hook_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.delete(url, headers=self.headers)
+        # 404 - хук уже удален
+        if response.status_code >= 400 and response.status_code != 404:
+            raise GitlabException(response.json())
+        await webhooks_cache.delete(f'{self.cache_prefix}:{project_id}')
+
+    async def get_group_webhooks(self, group_id: int) -> list[schemas.HookData]:
+        url = self._get_url(self.Endpoints.list_group_webhooks).replace('{id}', str(group_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.get(url, headers=self.headers)
+        response = self._parse_response(response)
+        return [schemas.HookData(**item) for item in response]
+
+    async def update_group_webhook(self, group_id: int, hook_id: int, webhook_url: str) -> None:
+        url = self._get_url(self.Endpoints.update_group_webhook)
+        url = url.replace('{id}', str(group_id)).replace('{hook_id}', str(hook_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.put(url, headers=self.headers, json=self.webhook_data(webhook_url))
+        self._parse_response(response)
+
+    async def delete_group_webhook(self, group_id: int, hook_id: int) -> None:
+        url = self._get_url(self.Endpoints.delete_group_webhook)
+        url = url.replace('{id}', str(group_id)).replace('{hook_id}', str(hook_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.delete(url, headers=self.headers)
+        # 404 - хук или группа уже удалены
+        if response.status_code >= 400 and response.status_code != 404:
+            raise GitlabException(response.json())
+
+    async def create_group_webhook(self, group_id: int, webhook_url: str) -> schemas.HookData:
+        """
+        Создание хука группы: события всех проектов группы и подгрупп приходят через один хук.
+        Доступно в GitLab Premium, иначе GitLab отвечает 403/404
+        """
+        url = self._get_url(self.Endpoints.create_group_webhook).replace('{id}', str(group_id))
+        async with httpx.AsyncClient() as session:
+            response = await session.post(url, headers=self.headers, json=self.webhook_data(webhook_url))
+        return schemas.HookData(**self._parse_response(response))
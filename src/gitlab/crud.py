@@ -1,12 +1,20 @@
-from sqlalchemy import select
+from datetime import date, datetime, time, timezone
+
+from sqlalchemy import Row, bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session, selectinload
 
+from src.database import use_primary
+from src.mattermost import crud as mm_crud
 from src.mattermost import models as mm_models
 
 from . import models, schemas
 
 
-async def get_or_create_project(session: Session, project_data: schemas.ProjectAttrs) -> models.Project:
+async def get_or_create_project(
+        session: Session, project_data: schemas.ProjectAttrs | schemas.WebHookProject
+) -> models.Project:
+    use_primary(session)
     result = await session.scalars(select(models.Project).where(models.Project.id == project_data.id_).options(
         selectinload(models.Project.mattermost_channels)))
     project = result.first()
@@ -18,6 +26,206 @@ async def get_or_create_project(session: Session, project_data: schemas.ProjectA
     return project
 
 
+async def get_project_channel_iids(session: Session, project_id: int) -> list[str]:
+    """ID каналов Mattermost, прикрепленных к проекту. Только чтение: неизвестный проект - пустой список"""
+    association = mm_models.GitlabProjectChannel
+    result = await session.scalars(
+        select(mm_models.Channel.iid)
+        .join(association, association.mattermost_channel_id == mm_models.Channel.id)
+        .where(association.gitlab_project_id == project_id)
+    )
+    return list(result.all())
+
+
+async def set_project_hooks(
+        session: Session, project_ids: list[int], owner_id: int, hook_url: str | None
+) -> None:
+    """
+    Запоминание хуков приложения на проектах и пользователя, прикрепившего проекты
+    :param hook_url: URL хука проекта, None - события проекта приходят через хук группы
+    """
+    if not project_ids:
+        return
+    await session.execute(
+        update(models.Project)
+        .where(models.Project.id.in_(project_ids))
+        .values(hook_owner_id=owner_id, hook_url=hook_url)
+    )
+    await session.commit()  # noqa
+
+
+async def get_recorded_hook_url(session: Session) -> str | None:
+    """URL хука приложения, записанный при последнем прикреплении проектов"""
+    result = await session.scalars(
+        select(models.Project.hook_url).where(models.Project.hook_url.is_not(None))
+        .order_by(models.Project.id.desc()).limit(1)
+    )
+    return result.first()
+
+
+async def get_orphan_hooks(session: Session, before: datetime) -> list[Row[tuple[int, str, str]]]:
+    """
+    Хуки проектов, от которых последний канал открепился раньше before. Хук удаляется только токеном
+    пользователя, прикрепившего проект: проекты без записанного владельца (прикрепленные до появления
+    hook_owner_id) пропускаются
+    :return: строки (ID проекта, URL хука, токен владельца хука)
+    """
+    result = await session.execute(
+        select(models.Project.id, models.Project.hook_url, models.GitlabUser.access_token)
+        .join(models.GitlabUser, models.GitlabUser.id == models.Project.hook_owner_id)
+        .where(
+            models.Project.unsubscribed_at < before,
+            models.Project.hook_url.is_not(None),
+            models.GitlabUser.token_status.is_distinct_from(schemas.TokenStatus.invalid)
+        )
+    )
+    return list(result.all())
+
+
+async def clear_project_hooks(session: Session, project_ids: list[int]) -> None:
+    """Хуки проектов удалены. Владелец остается: его токеном сверяются метаданные проекта"""
+    if not project_ids:
+        return
+    await session.execute(update(models.Project).where(models.Project.id.in_(project_ids)).values(hook_url=None))
+    await session.commit()  # noqa
+
+
+async def get_orphan_groups(session: Session, before: datetime) -> list[Row[tuple[int, int, str]]]:
+    """
+    Группы с хуком, ни один проект которых не прикреплен к каналу и не откреплялся позже before.
+    Хук удаляется токеном пользователя, поставившего его; группы без владельца пропускаются
+    :return: строки (ID группы, ID хука, токен владельца хука)
+    """
+    group = models.Group
+    project = models.Project
+    subscribed = select(project.id).where(
+        func.starts_with(func.lower(project.path_with_namespace), func.lower(group.full_path).concat('/')),
+        project.unsubscribed_at.is_(None) | (project.unsubscribed_at >= before)
+    )
+    result = await session.execute(
+        select(group.id, group.hook_id, models.GitlabUser.access_token)
+        .join(models.GitlabUser, models.GitlabUser.id == group.owner_id)
+        .where(
+            group.created_at < before,
+            ~subscribed.exists(),
+            models.GitlabUser.token_status.is_distinct_from(schemas.TokenStatus.invalid)
+        )
+    )
+    return list(result.all())
+
+
+async def delete_groups(session: Session, group_ids: list[int]) -> None:
+    """Хуки групп удалены: события их проектов снова приходят через хуки проектов"""
+    if not group_ids:
+        return
+    await session.execute(delete(models.Group).where(models.Group.id.in_(group_ids)))
+    await session.commit()  # noqa
+
+
+PROJECT_METADATA = ('name', 'web_url', 'path_with_namespace', 'avatar_url')
+
+
+async def get_projects_to_sync(session: Session, before: datetime, limit: int) -> list[Row]:
+    """
+    Проекты, чьи метаданные не сверялись с GitLab после before, сначала давно не сверявшиеся.
+    Запрашиваются только токеном пользователя, прикрепившего проект; проекты без владельца пропускаются
+    :return: строки (id, name, web_url, path_with_namespace, avatar_url, access_token)
+    """
+    project = models.Project
+    result = await session.execute(
+        select(*(getattr(project, name) for name in ('id', *PROJECT_METADATA)), models.GitlabUser.access_token)
+        .join(models.GitlabUser, models.GitlabUser.id == project.hook_owner_id)
+        .where(
+            (project.synced_at.is_(None)) | (project.synced_at < before),
+            models.GitlabUser.token_status.is_distinct_from(schemas.TokenStatus.invalid)
+        )
+        .order_by(project.synced_at.asc().nulls_first())
+        .limit(limit)
+    )
+    return list(result.all())
+
+
+async def save_projects_metadata(
+        session: Session, changed: list[schemas.ProjectAttrs], synced_ids: list[int], synced_at: datetime
+) -> None:
+    """
+    Запись результатов сверки в одной транзакции: метаданные - только изменившихся проектов (одним executemany),
+    время сверки - всех запрошенных
+    """
+    table = models.Project.__table__
+    if changed:
+        await session.execute(
+            update(table).where(table.c.id == bindparam('project_id')).values(
+                {name: bindparam(f'new_{name}') for name in PROJECT_METADATA}
+            ),
+            [
+                {'project_id': item.id_, **{f'new_{name}': value for name, value in project_metadata(item).items()}}
+                for item in changed
+            ]
+        )
+    if synced_ids:
+        await session.execute(update(table).where(table.c.id.in_(synced_ids)).values(synced_at=synced_at))
+    await session.commit()  # noqa
+
+
+def project_metadata(project: schemas.ProjectAttrs) -> dict:
+    """Метаданные проекта в том виде, в котором они хранятся в gitlab_project"""
+    data = project.model_dump(mode='json', by_alias=True)
+    return {name: data[name] for name in PROJECT_METADATA}
+
+
+async def save_group_hook(session: Session, group: schemas.GroupAttrs, hook_id: int, owner_id: int) -> None:
+    table = models.Group.__table__
+    statement = insert(table).values(
+        id=group.id_, full_path=group.full_path, web_url=str(group.web_url), hook_id=hook_id, owner_id=owner_id
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={
+            'full_path': statement.excluded.full_path, 'web_url': statement.excluded.web_url, 'hook_id': hook_id,
+            'owner_id': owner_id
+        }
+    )
+    await session.execute(statement)
+    await session.commit()  # noqa
+
+
+async def get_hooked_group_paths(session: Session) -> list[str]:
+    """Пути групп, чьи события приходят через хук группы"""
+    result = await session.scalars(select(models.Group.full_path))
+    return list(result.all())
+
+
+async def get_hooked_groups(session: Session) -> list[Row[tuple[str, int, str]]]:
+    """
+    Сохраненные группы с хуком и токен пользователя, поставившего хук. Группы без владельца пропускаются
+    :return: строки (путь группы, ID владельца хука, токен владельца)
+    """
+    group = models.Group
+    result = await session.execute(
+        select(group.full_path, models.GitlabUser.id, models.GitlabUser.access_token)
+        .join(models.GitlabUser, models.GitlabUser.id == group.owner_id)
+        .where(models.GitlabUser.token_status.is_distinct_from(schemas.TokenStatus.invalid))
+        .order_by(group.id)
+    )
+    return list(result.all())
+
+
+async def get_group_project_hooks(session: Session, group_path: str) -> list[Row[tuple[int, str]]]:
+    """
+    Хуки проектов группы (с подгруппами), поставленные до хука группы
+    :return: строки (ID проекта, URL хука)
+    """
+    project = models.Project
+    result = await session.execute(
+        select(project.id, project.hook_url).where(
+            func.starts_with(func.lower(project.path_with_namespace), f'{group_path.lower()}/'),
+            project.hook_url.is_not(None)
+        )
+    )
+    return list(result.all())
+
+
 async def get_project_by_id(session: Session, project_id: int) -> models.Project:
     result = await session.scalars(select(models.Project).where(models.Project.id == project_id).options(
         selectinload(models.Project.mattermost_channels)))
@@ -27,6 +235,205 @@ async def get_project_by_id(session: Session, project_id: int) -> models.Project
     return project
 
 
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+async def get_channel_projects(
+        session: Session,
+        channel_iid: str,
+        query: str | None = None,
+        limit: int = 25
+) -> list[Row[tuple[int, str, str | None]]]:
+    """
+    Первые limit проектов канала, отсортированные по пути. Lookup Mattermost не листается: пользователь
+    сужает выборку, дописывая query
+    :param channel_iid: ID канала Mattermost
+    :param query: подстрока пути проекта, без учета регистра
+    :param limit: максимум проектов
+    :return: строки (id, path_with_namespace, avatar_url)
+    """
+    statement = (
+        select(models.Project.id, models.Project.path_with_namespace, models.Project.avatar_url)
+        .join(mm_models.GitlabProjectChannel, mm_models.GitlabProjectChannel.gitlab_project_id == models.Project.id)
+        .join(mm_models.Channel, mm_models.Channel.id == mm_models.GitlabProjectChannel.mattermost_channel_id)
+        .where(mm_models.Channel.iid == channel_iid, models.Project.path_with_namespace.is_not(None))
+        .order_by(models.Project.path_with_namespace, models.Project.id)
+        .limit(limit)
+    )
+    if query:
+        statement = statement.where(models.Project.path_with_namespace.ilike(f'%{escape_like(query)}%'))
+    result = await session.execute(statement)
+    return list(result.all())
+
+
+STATS_COUNTERS = ('total', 'success', 'warning', 'failed', 'canceled', 'flaky', 'duration_total', 'duration_count')
+
+
+async def record_pipeline_event(session: Session, data: schemas.PipelineWebHook) -> bool:
+    """
+    Сохранение события pipeline, инкремент дневных счетчиков и последнего статуса ветки в одной транзакции.
+    Повтор уже принятого события (тот же pipeline и статус) ничего не меняет. Дневные счетчики учитывают
+    только первый за сутки завершенный статус pipeline
+    :return: True, если событие сохранено впервые
+    """
+    attrs = data.object_attributes
+    received_at = datetime.now(timezone.utc)
+    key = models.PipelineEventKey.__table__
+    result = await session.execute(
+        insert(key)
+        .values(project_id=data.project.id_, pipeline_id=attrs.id_, status=attrs.status, received_at=received_at)
+        .on_conflict_do_nothing()
+        .returning(key.c.pipeline_id)
+    )
+    if result.first() is None:
+        await session.rollback()  # noqa
+        return False
+    # Статусы одного pipeline учитываются по очереди: параллельные транзакции не видят ключи друг друга и обе
+    # сочли бы свой статус первым. Блокировка после вставки ключа - запрос уже идет в основную базу
+    await session.execute(select(func.pg_advisory_xact_lock(attrs.id_)))
+    statuses_today = await session.scalar(
+        select(func.count()).select_from(key).where(
+            key.c.project_id == data.project.id_,
+            key.c.pipeline_id == attrs.id_,
+            key.c.received_at >= datetime.combine(received_at.date(), time.min, timezone.utc)
+        )
+    )
+    failed_job = data.failed_job or data.allowed_failed_job
+    duration = round(attrs.duration) if attrs.duration is not None else None
+    event = models.PipelineEvent(
+        received_at=received_at,
+        project_id=data.project.id_,
+        pipeline_id=attrs.id_,
+        pipeline_iid=attrs.iid,
+        ref=attrs.ref,
+        status=attrs.status,
+        source=attrs.source,
+        failed_stage=failed_job.stage if failed_job else None,
+        failed_job=failed_job.name if failed_job else None,
+        has_allowed_failures=data.allowed_failed_job is not None,
+        created_at=attrs.created_at,
+        finished_at=attrs.finished_at,
+        duration=duration
+    )
+    session.add(event)
+
+    if statuses_today == 1:
+        counters = dict.fromkeys(STATS_COUNTERS, 0)
+        counters['total'] = 1
+        if attrs.status in counters:
+            counters[attrs.status] = 1
+        counters['flaky'] = int(event.has_allowed_failures)
+        if duration is not None:
+            counters['duration_total'] = duration
+            counters['duration_count'] = 1
+        table = models.PipelineDailyStats.__table__
+        statement = insert(table).values(
+            project_id=event.project_id, ref=event.ref, day=event.received_at.date(), **counters
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.project_id, table.c.ref, table.c.day],
+            set_={name: table.c[name] + statement.excluded[name] for name in STATS_COUNTERS}
+        )
+        await session.execute(statement)
+
+    latest = models.PipelineLatest.__table__
+    statement = insert(latest).values(
+        project_id=event.project_id, ref=event.ref, pipeline_id=event.pipeline_id, pipeline_iid=event.pipeline_iid,
+        pipeline_url=attrs.url, status=event.status, failed_stage=event.failed_stage, failed_job=event.failed_job,
+        updated_at=event.received_at
+    )
+    # Вебхуки могут прийти не по порядку: более старый pipeline ветки не перезаписывает новый
+    statement = statement.on_conflict_do_update(
+        index_elements=[latest.c.project_id, latest.c.ref],
+        set_={
+            name: statement.excluded[name] for name in (
+                'pipeline_id', 'pipeline_iid', 'pipeline_url', 'status', 'failed_stage', 'failed_job', 'updated_at'
+            )
+        },
+        where=latest.c.pipeline_id <= statement.excluded.pipeline_id
+    )
+    await session.execute(statement)
+    await session.commit()  # noqa
+    return True
+
+
+async def get_channel_branch_statuses(
+        session: Session, channel_iid: str, limit: int = 100
+) -> list[schemas.BranchStatus]:
+    """
+    Последние pipeline веток проектов канала, по проектам, внутри проекта - сначала свежие
+    :param channel_iid: ID канала Mattermost
+    :param limit: максимум веток
+    """
+    latest = models.PipelineLatest
+    statement = (
+        select(
+            latest.project_id, models.Project.path_with_namespace.label('project_path'),
+            models.Project.web_url.label('project_url'), latest.ref, latest.status, latest.pipeline_iid,
+            latest.pipeline_url, latest.failed_stage, latest.failed_job, latest.updated_at
+        )
+        .join(models.Project, models.Project.id == latest.project_id)
+        .join(mm_models.GitlabProjectChannel, mm_models.GitlabProjectChannel.gitlab_project_id == latest.project_id)
+        .join(mm_models.Channel, mm_models.Channel.id == mm_models.GitlabProjectChannel.mattermost_channel_id)
+        .where(mm_models.Channel.iid == channel_iid)
+        .order_by(models.Project.path_with_namespace, latest.updated_at.desc())
+        .limit(limit)
+    )
+    result = await session.execute(statement)
+    return [schemas.BranchStatus.model_validate(row) for row in result.all()]
+
+
+async def get_channel_pipeline_stats(
+        session: Session, channel_iid: str, since: date, limit: int = 25
+) -> list[Row]:
+    """
+    Статистика pipeline по проектам и веткам канала из дневных счетчиков
+    :param channel_iid: ID канала Mattermost
+    :param since: первый учитываемый день (UTC)
+    :param limit: максимум строк, сначала ветки с наибольшим кол-вом падений
+    :return: строки (path_with_namespace, web_url, ref, total, failed, warning, flaky, duration_total, duration_count)
+    """
+    stats = models.PipelineDailyStats
+    failed = func.sum(stats.failed)
+    total = func.sum(stats.total)
+    statement = (
+        select(
+            models.Project.path_with_namespace, models.Project.web_url, stats.ref,
+            total.label('total'), failed.label('failed'), func.sum(stats.warning).label('warning'),
+            func.sum(stats.flaky).label('flaky'), func.sum(stats.duration_total).label('duration_total'),
+            func.sum(stats.duration_count).label('duration_count')
+        )
+        .join(models.Project, models.Project.id == stats.project_id)
+        .join(mm_models.GitlabProjectChannel, mm_models.GitlabProjectChannel.gitlab_project_id == stats.project_id)
+        .join(mm_models.Channel, mm_models.Channel.id == mm_models.GitlabProjectChannel.mattermost_channel_id)
+        .where(mm_models.Channel.iid == channel_iid, stats.day >= since)
+        .group_by(models.Project.id, stats.ref)
+        .order_by(failed.desc(), total.desc(), models.Project.path_with_namespace, stats.ref)
+        .limit(limit)
+    )
+    result = await session.execute(statement)
+    return list(result.all())
+
+
+async def delete_event_keys(session: Session, before: datetime) -> None:
+    """Удаление ключей защиты от повторов, принятых раньше before"""
+    await session.execute(delete(models.PipelineEventKey).where(models.PipelineEventKey.received_at < before))
+    await session.commit()  # noqa
+
+
+async def create_event_partition(session: Session, month: date) -> None:
+    """Секция gitlab_pipeline_event на календарный месяц UTC, если ее еще нет"""
+    start = month.replace(day=1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    await session.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {models.PipelineEvent.__tablename__}_{start:y%Ym%m} '
+        f'PARTITION OF {models.PipelineEvent.__tablename__} '
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00+00') TO ('{end.isoformat()} 00:00+00')"
+    ))
+    await session.commit()  # noqa
+
+
 async def get_or_create_gl_user_by_mm_user(session: Session, mm_user: mm_models.User, data: dict) -> models.GitlabUser:
     gl_user = mm_user.gitlab_user
     if gl_user:
@@ -42,6 +449,9 @@ async def get_or_create_gl_user_by_mm_user(session: Session, mm_user: mm_models.
 async def update_gl_user(session: Session, user: models.GitlabUser, data: dict) -> models.GitlabUser:
     for key, value in data.items():
         setattr(user, key, value)
+    if 'access_token' in data:
+        # Новый токен еще не проверялся
+        user.token_status = user.token_expires_at = user.token_checked_at = None
     session.add(user)
     await session.commit()  # noqa
     await session.refresh(user)  # noqa
@@ -66,4 +476,43 @@ async def update_gl_user_from_schema(
     session.add(user)
     await session.commit()  # noqa
     await session.refresh(user)  # noqa
+    # Аккаунт мог попасть в отрицательный кэш авторов до привязки
+    await mm_crud.author_cache.delete(str(schema.id_))
     return user
+
+
+async def get_gl_users_with_tokens(session: Session) -> list[Row[tuple[int, str, str | None, str | None]]]:
+    """
+    Пользователи GitLab с сохраненными токенами для фоновой проверки
+    :return: строки (id, access_token, token_status, ID пользователя Mattermost)
+    """
+    result = await session.execute(
+        select(
+            models.GitlabUser.id, models.GitlabUser.access_token, models.GitlabUser.token_status,
+            mm_models.User.id
+        )
+        .outerjoin(mm_models.User, mm_models.User.gitlab_user_id == models.GitlabUser.id)
+        .where(models.GitlabUser.access_token != '')
+    )
+    return list(result.all())
+
+
+async def update_token_statuses(session: Session, statuses: list[dict]) -> None:
+    """
+    Сохранение результатов проверки токенов одним executemany. Строка не меняется, если токен успели заменить
+    :param statuses: словари с ключами user_id, checked_token, status, expires_at, checked_at
+    """
+    if not statuses:
+        return
+    table = models.GitlabUser.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam('user_id'), table.c.access_token == bindparam('checked_token'))
+        .values(
+            token_status=bindparam('status'),
+            token_expires_at=bindparam('expires_at'),
+            token_checked_at=bindparam('checked_at')
+        )
+    )
+    await session.execute(statement, statuses)
+    await session.commit()  # noqa
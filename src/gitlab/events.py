@@ -0,0 +1,166 @@
+"""
+Обработчики событий GitLab по типам (object_kind) и фильтр подписок каналов.
+
+Обработчик решает, принимается ли событие, достает из него ветку и статус для фильтра, сохраняет нужное при приеме
+и отправляет сообщение. Подписка канала компилируется в SubscriptionMatcher один раз: маски веток склеиваются
+в одно регулярное выражение, и проверка события не зависит от кол-ва масок.
+"""
+import fnmatch
+import functools
+import re
+from typing import ClassVar, Generic, NamedTuple, TypeVar
+
+from src.database import AsyncSession
+from src.mattermost import crud as mm_crud
+from src.mattermost.api import MattermostAPI
+from src.mattermost.delivery import delivery_scheduler
+from src.mattermost.digest import channel_digest
+from src.mattermost.services import MERGE_REQUEST_ACTIONS, render_deployment, render_merge_request, render_message
+
+from . import crud
+from .schemas import (
+    DeploymentWebHook,
+    EventKind,
+    MergeRequestWebHook,
+    PipelineSummary,
+    PipelineWebHook,
+    Status,
+    Subscription,
+)
+
+T = TypeVar('T')
+
+NOTIFY_STATUSES = (Status.success, Status.warning, Status.failed)
+# Завершенные pipeline: попадают в статистику, в каналы - по подписке
+FINAL_STATUSES = (*NOTIFY_STATUSES, Status.canceled)
+DEPLOYMENT_STATUSES = (Status.running, Status.success, Status.failed, Status.canceled)
+
+# Подписка канала, который ее не настраивал: результаты pipeline всех веток
+DEFAULT_SUBSCRIPTION = Subscription(kinds=(EventKind.pipeline,), statuses=NOTIFY_STATUSES)
+
+
+class Event(NamedTuple):
+    """Поля события, по которым фильтруют подписки"""
+    kind: EventKind
+    ref: str
+    status: Status | None
+
+
+class SubscriptionMatcher:
+
+    def __init__(self, subscription: Subscription):
+        self.kinds = frozenset(subscription.kinds)
+        self.statuses = frozenset(subscription.statuses)
+        self.branches = None
+        if subscription.branches:
+            self.branches = re.compile('|'.join(f'(?:{fnmatch.translate(glob)})' for glob in subscription.branches))
+
+    def matches(self, event: Event) -> bool:
+        if event.kind not in self.kinds:
+            return False
+        if event.status is not None and self.statuses and event.status not in self.statuses:
+            return False
+        return self.branches is None or self.branches.match(event.ref) is not None
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_subscription(subscription: Subscription) -> SubscriptionMatcher:
+    return SubscriptionMatcher(subscription)
+
+
+class EventHandler(Generic[T]):
+    """Обработка событий одного типа"""
+    kind: ClassVar[EventKind]
+
+    def accepts(self, data: T) -> bool:
+        """Событие нужно обрабатывать (например, pipeline завершился)"""
+        return True
+
+    def event(self, data: T) -> Event:
+        raise NotImplementedError
+
+    async def store(self, data: T, channel_iids: list[str]) -> None:
+        """Сохранение события при приеме, до фильтра подписок"""
+
+    def notifies_author(self, data: T) -> bool:
+        """Событие отправляется автору личным сообщением (независимо от подписок каналов)"""
+        return False
+
+    def render(self, data: T) -> str:
+        raise NotImplementedError
+
+    def notify(self, api: MattermostAPI, channel_iids: list[str], data: T) -> None:
+        """Отправка сообщения в каналы, чья подписка приняла событие. Сообщение отрисовывается один раз"""
+        message = self.render(data)
+        for channel_iid in channel_iids:
+            delivery_scheduler.submit(api, channel_iid, message)
+
+
+# object_kind -> обработчик
+handlers: dict[str, EventHandler] = {}
+
+
+def register(handler_class: type[EventHandler]) -> type[EventHandler]:
+    handlers[handler_class.kind] = handler_class()
+    return handler_class
+
+
+@register
+class PipelineHandler(EventHandler[PipelineWebHook]):
+    kind = EventKind.pipeline
+
+    def accepts(self, data: PipelineWebHook) -> bool:
+        return data.object_attributes.status in FINAL_STATUSES
+
+    def event(self, data: PipelineWebHook) -> Event:
+        return Event(self.kind, data.object_attributes.ref, data.object_attributes.status)
+
+    async def store(self, data: PipelineWebHook, channel_iids: list[str]) -> None:
+        async with AsyncSession() as session:
+            recorded = await crud.record_pipeline_event(session, data)
+        if not recorded:
+            return
+        for channel_iid in channel_iids:
+            await mm_crud.channel_status_cache.delete(channel_iid)
+
+    def notifies_author(self, data: PipelineWebHook) -> bool:
+        return data.object_attributes.status == Status.failed
+
+    def render(self, data: PipelineWebHook) -> str:
+        return render_message(PipelineSummary.from_webhook(data))
+
+    def notify(self, api: MattermostAPI, channel_iids: list[str], data: PipelineWebHook) -> None:
+        # Pipeline при шторме уведомлений складываются в сводку
+        summary = PipelineSummary.from_webhook(data)
+        message = render_message(summary)
+        for channel_iid in channel_iids:
+            channel_digest.submit(api, channel_iid, summary, message)
+
+
+@register
+class MergeRequestHandler(EventHandler[MergeRequestWebHook]):
+    kind = EventKind.merge_request
+
+    def accepts(self, data: MergeRequestWebHook) -> bool:
+        # Обновления MR (новые коммиты, правки описания) слишком частые для канала
+        return data.object_attributes.action in MERGE_REQUEST_ACTIONS
+
+    def event(self, data: MergeRequestWebHook) -> Event:
+        return Event(self.kind, data.object_attributes.target_branch, None)
+
+    def render(self, data: MergeRequestWebHook) -> str:
+        return render_merge_request(data)
+
+
+@register
+class DeploymentHandler(EventHandler[DeploymentWebHook]):
+    kind = EventKind.deployment
+
+    def accepts(self, data: DeploymentWebHook) -> bool:
+        return data.status in DEPLOYMENT_STATUSES
+
+    def event(self, data: DeploymentWebHook) -> Event:
+        return Event(self.kind, data.ref, Status(data.status))
+
+    def render(self, data: DeploymentWebHook) -> str:
+        return render_deployment(data)
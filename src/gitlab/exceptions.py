@@ -1,2 +1,6 @@
 class GitlabException(BaseException):
     pass
+
+
+class InvalidTokenException(GitlabException):
+    """Токен доступа истек, отозван или не существует (401)"""
@@ -1,3 +1,6 @@
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Identity, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.database import Model
@@ -6,12 +9,29 @@ from src.mattermost.models import Channel, GitlabProjectChannel, User
 
 class Project(Model):
     __tablename__ = 'gitlab_project'
+    __table_args__ = (
+        # Поиск по подстроке пути (ILIKE '%...%') в lookup'ах
+        Index(
+            'ix_gitlab_project_path_with_namespace_trgm', 'path_with_namespace',
+            postgresql_using='gin', postgresql_ops={'path_with_namespace': 'gin_trgm_ops'}
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(index=True)
     web_url: Mapped[str] = mapped_column(unique=True, index=True)
     path_with_namespace: Mapped[str | None] = mapped_column(nullable=True)
     avatar_url: Mapped[str | None] = mapped_column(nullable=True)
+    # Когда от проекта открепился последний канал, None - проект прикреплен хотя бы к одному каналу
+    unsubscribed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Хук приложения на проекте (для удаления хука без подписчиков) и пользователь, прикрепивший проект:
+    # его токеном удаляется хук и сверяются метаданные проекта
+    hook_url: Mapped[str | None] = mapped_column(nullable=True)
+    hook_owner_id: Mapped[int | None] = mapped_column(
+        ForeignKey('gitlab_user.id', ondelete='SET NULL'), nullable=True
+    )
+    # Последняя сверка метаданных с GitLab (services.sync_projects_metadata)
+    synced_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     mattermost_channels: Mapped[list['Channel']] = relationship(
         back_populates='gitlab_projects', secondary='gitlab_project_mattermost_channel',
@@ -22,6 +42,19 @@ class Project(Model):
     )
 
 
+class Group(Model):
+    """Группа GitLab с хуком приложения: события всех ее проектов (с подгруппами) приходят через один хук"""
+    __tablename__ = 'gitlab_group'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    full_path: Mapped[str] = mapped_column(unique=True)
+    web_url: Mapped[str]
+    hook_id: Mapped[int] = mapped_column(BigInteger)
+    # Пользователь, поставивший хук: его токеном хук удаляется, когда у проектов группы не останется каналов
+    owner_id: Mapped[int | None] = mapped_column(ForeignKey('gitlab_user.id', ondelete='SET NULL'), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
 class GitlabUser(Model):
     __tablename__ = 'gitlab_user'
 
@@ -29,6 +62,85 @@ class GitlabUser(Model):
     iid: Mapped[int | None] = mapped_column(unique=True, nullable=True)
     name: Mapped[str | None] = mapped_column(nullable=True)
     username: Mapped[str | None] = mapped_column(nullable=True)
-    access_token: Mapped[str] = mapped_column(index=True)
+    access_token: Mapped[str]
+    # Результат фоновой проверки токена (schemas.TokenStatus), None - еще не проверялся
+    token_status: Mapped[str | None] = mapped_column(nullable=True)
+    token_expires_at: Mapped[date | None] = mapped_column(nullable=True)
+    token_checked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     mattermost_user: Mapped['User'] = relationship(back_populates='gitlab_user')
+
+
+class PipelineEvent(Model):
+    """
+    Завершенный pipeline. Таблица секционирована по месяцам по времени приема, секции создает
+    services.ensure_event_partitions. Выборки статистики читают только PipelineDailyStats
+    """
+    __tablename__ = 'gitlab_pipeline_event'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (received_at)'}
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    # Ключ секционирования обязан входить в первичный ключ
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    project_id: Mapped[int]
+    pipeline_id: Mapped[int] = mapped_column(BigInteger)
+    pipeline_iid: Mapped[int]
+    ref: Mapped[str]
+    status: Mapped[str]
+    source: Mapped[str | None] = mapped_column(nullable=True)
+    failed_stage: Mapped[str | None] = mapped_column(nullable=True)
+    failed_job: Mapped[str | None] = mapped_column(nullable=True)
+    has_allowed_failures: Mapped[bool] = mapped_column(default=False)
+    created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    duration: Mapped[int | None] = mapped_column(nullable=True)
+
+
+class PipelineEventKey(Model):
+    """
+    Принятые события pipeline для защиты от повторов (GitLab повторяет доставку, spool воспроизводит вебхуки).
+    Уникальность нельзя задать в секционированной gitlab_pipeline_event: ключ обязан включать received_at.
+    Ключи старше pipeline_event_key_days удаляет services.ensure_event_partitions
+    """
+    __tablename__ = 'gitlab_pipeline_event_key'
+
+    project_id: Mapped[int] = mapped_column(primary_key=True)
+    pipeline_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(primary_key=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class PipelineDailyStats(Model):
+    """
+    Счетчики pipeline проекта и ветки за сутки (UTC). Pipeline учитывается один раз в сутки, по первому
+    завершенному статусу: перезапуск упавшего pipeline не добавляет второй прогон
+    """
+    __tablename__ = 'gitlab_pipeline_daily_stats'
+
+    project_id: Mapped[int] = mapped_column(primary_key=True)
+    ref: Mapped[str] = mapped_column(primary_key=True)
+    day: Mapped[date] = mapped_column(primary_key=True)
+    total: Mapped[int] = mapped_column(server_default='0')
+    success: Mapped[int] = mapped_column(server_default='0')
+    warning: Mapped[int] = mapped_column(server_default='0')
+    failed: Mapped[int] = mapped_column(server_default='0')
+    canceled: Mapped[int] = mapped_column(server_default='0')
+    # Pipeline, в которых упали задачи с allow_failure: мера нестабильности тестов
+    flaky: Mapped[int] = mapped_column(server_default='0')
+    duration_total: Mapped[int] = mapped_column(BigInteger, server_default='0')
+    duration_count: Mapped[int] = mapped_column(server_default='0')
+
+
+class PipelineLatest(Model):
+    """Последний завершенный pipeline каждой ветки проекта, обновляется при приеме события"""
+    __tablename__ = 'gitlab_pipeline_latest'
+
+    project_id: Mapped[int] = mapped_column(primary_key=True)
+    ref: Mapped[str] = mapped_column(primary_key=True)
+    pipeline_id: Mapped[int] = mapped_column(BigInteger)
+    pipeline_iid: Mapped[int]
+    pipeline_url: Mapped[str]
+    status: Mapped[str]
+    failed_stage: Mapped[str | None] = mapped_column(nullable=True)
+    failed_job: Mapped[str | None] = mapped_column(nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
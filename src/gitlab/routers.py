@@ -1,12 +1,17 @@
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, Body, Header
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
 from src.config import settings
+from src.spool import spool_writer
 
-from .schemas import WebHook
-from .services import parse_webhook
+from .admission import admission
+from .events import handlers
+from .schemas import webhook_adapter
+from .services import ingest_state, process_webhook
 
 router = APIRouter(prefix='/gitlab', tags=['GitLab'])
 
@@ -14,15 +19,45 @@ router = APIRouter(prefix='/gitlab', tags=['GitLab'])
 @router.post('/webhook', summary='Обработка вебхуков с GitLab')
 async def gitlab_webhook(
         x_gitlab_token: Annotated[str, Header()],
-        data: Annotated[WebHook, Body()],
+        request: Request,
         bg_tasks: BackgroundTasks
 ):
     """
     Присутствует обработка следующих хуков:
 
     - pipeline events
+    - merge request events
+    - deployment events
+
+    Вебхуки других типов принимаются и игнорируются.
+    Пока база недоступна, вебхуки сохраняются в локальный spool и позже воспроизводятся воркером.
+    При перегрузке отвечает 429 (сбрасываются успешные и отмененные pipeline) или 503 с заголовком Retry-After.
+    Тело разбирается напрямую из байтов облегченными схемами (для pipeline - PipelineWebHook, поля описаны
+    в схеме WebHook), схема выбирается по object_kind
     """
     if x_gitlab_token != settings.gitlab_secret:
         logging.warning('Несанкционированный доступ')
         return
-    bg_tasks.add_task(parse_webhook, data)
+    admission.check_capacity()
+    body = await request.body()
+    try:
+        data = webhook_adapter.validate_json(body)
+    except ValidationError as exc:
+        errors = exc.errors()
+        # Неподдерживаемый тип события
+        if errors[0]['type'] == 'union_tag_invalid':
+            return
+        raise RequestValidationError([{**error, 'loc': ('body', *error['loc'])} for error in errors]) from exc
+    handler = handlers[data.object_kind]
+    if not handler.accepts(data):
+        return
+    admission.check(handler.event(data).status)
+    if ingest_state.spooling:
+        if spool_writer.full:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Очередь вебхуков переполнена',
+                headers={'Retry-After': str(settings.admission_retry_after)}
+            )
+        await spool_writer.append(body)
+        return
+    bg_tasks.add_task(admission.run, process_webhook, data, body)
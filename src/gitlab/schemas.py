@@ -1,6 +1,9 @@
+from datetime import date, datetime
 from enum import StrEnum
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, ConfigDict, Field, HttpUrl, field_validator
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, PrivateAttr, TypeAdapter, field_validator
+from typing_extensions import NotRequired, TypedDict
 
 
 class Source(StrEnum):
@@ -9,6 +12,13 @@ class Source(StrEnum):
     web = 'web'
 
 
+class EventKind(StrEnum):
+    """Типы событий GitLab, на которые можно подписать канал"""
+    pipeline = 'pipeline'
+    merge_request = 'merge_request'
+    deployment = 'deployment'
+
+
 class Status(StrEnum):
     """Статусы билда"""
     success = 'success'
@@ -20,6 +30,13 @@ class Status(StrEnum):
     canceled = 'canceled'
 
 
+class TokenStatus(StrEnum):
+    """Состояние персонального токена по последней проверке"""
+    active = 'active'
+    expiring = 'expiring'
+    invalid = 'invalid'
+
+
 class ObjectAttrs(BaseModel):
     """Аттрибуты объекта оповещения"""
     id_: int = Field(title='ID', alias='id')
@@ -108,8 +125,253 @@ class WebHook(BaseModel):
         return allowed_fail[0]
 
 
+class WebHookBuild(TypedDict):
+    """Job у pipeline: только поля, нужные для сообщения. Словарь валидируется заметно быстрее модели"""
+    stage: str
+    name: str
+    status: str
+    allow_failure: NotRequired[bool]
+
+
+# noinspection PyNestedDecorators
+class WebHookObjectAttrs(BaseModel):
+    id_: int = Field(alias='id')
+    iid: int
+    ref: str
+    status: Status
+    url: str
+    source: str | None = None
+    created_at: datetime | None = None
+    finished_at: datetime | None = None
+    duration: float | None = None
+
+    @field_validator('created_at', 'finished_at', mode='before')
+    @classmethod
+    def parse_gitlab_datetime(cls, value):
+        # GitLab отдает время pipeline в виде '2016-08-12 15:23:28 UTC'
+        if isinstance(value, str) and value.endswith(' UTC'):
+            value = value[:-4] + 'Z'
+        return value
+
+
+class WebHookProject(BaseModel):
+    id_: int = Field(alias='id')
+    name: str
+    web_url: str
+    path_with_namespace: str | None = None
+    avatar_url: str | None = None
+
+
+class WebHookCommit(BaseModel):
+    title: str
+    url: str
+
+
+class WebHookUser(BaseModel):
+    id_: int | None = Field(default=None, alias='id')
+    name: str
+    username: str
+    avatar_url: str | None = None
+
+
+class PipelineWebHook(BaseModel):
+    """
+    Облегченный вебхук pipeline для горячего пути: валидируются только используемые поля, ссылки остаются
+    строками, задачи - словари. Остальные атрибуты те же, что у WebHook. Разбирается из сырого тела запроса
+    через webhook_adapter
+    """
+    object_kind: Literal['pipeline']
+    builds: list[WebHookBuild]
+    object_attributes: WebHookObjectAttrs
+    user: WebHookUser
+    project: WebHookProject
+    commit: WebHookCommit
+
+    _failed_job: Build | None = PrivateAttr(default=None)
+    _allowed_failed_job: Build | None = PrivateAttr(default=None)
+
+    def model_post_init(self, __context) -> None:
+        # Один проход по задачам: первая упавшая и первая упавшая с allow_failure
+        for build in self.builds:
+            if build['status'] != Status.failed:
+                continue
+            if build.get('allow_failure'):
+                if self._allowed_failed_job is None:
+                    self._allowed_failed_job = Build(**build)
+            elif self._failed_job is None:
+                self._failed_job = Build(**build)
+            if self._failed_job is not None and self._allowed_failed_job is not None:
+                break
+        if self.object_attributes.status == Status.success and self._allowed_failed_job is not None:
+            self.object_attributes.status = Status.warning
+
+    @property
+    def failed_job(self) -> Build | None:
+        return self._failed_job
+
+    @property
+    def allowed_failed_job(self) -> Build | None:
+        return self._allowed_failed_job
+
+
+class WebHookMergeRequestAttrs(BaseModel):
+    iid: int
+    title: str
+    url: str
+    source_branch: str
+    target_branch: str
+    state: str
+    action: str | None = None
+
+
+class MergeRequestWebHook(BaseModel):
+    """Облегченный вебхук merge request"""
+    object_kind: Literal['merge_request']
+    object_attributes: WebHookMergeRequestAttrs
+    user: WebHookUser
+    project: WebHookProject
+
+
+class DeploymentWebHook(BaseModel):
+    """Облегченный вебхук деплоя"""
+    object_kind: Literal['deployment']
+    # Не Status: GitLab шлет и другие статусы деплоя (blocked, skipped), их отбрасывает DeploymentHandler.accepts
+    status: str
+    deployment_id: int
+    deployable_url: str | None = None
+    environment: str
+    ref: str
+    short_sha: str
+    commit_url: str
+    commit_title: str
+    user: WebHookUser
+    project: WebHookProject
+
+
+WebHookEvent = Annotated[PipelineWebHook | MergeRequestWebHook | DeploymentWebHook, Field(discriminator='object_kind')]
+
+# Разбор любого поддерживаемого вебхука: модель выбирается по object_kind
+webhook_adapter = TypeAdapter(WebHookEvent)
+
+
+class PipelineSummary(BaseModel):
+    """Поля pipeline, которые попадают в сообщение Mattermost"""
+    project_id: int
+    project_name: str
+    project_url: str
+    project_path: str | None
+    status: Status
+    pipeline_iid: int
+    pipeline_url: str
+    ref: str
+    commit_title: str
+    commit_url: str
+    user_name: str
+    user_username: str
+    user_avatar_url: str | None = None
+    failed_stage: str | None = None
+    failed_job: str | None = None
+
+    @property
+    def branch_url(self) -> str:
+        return f'{self.project_url}/-/tree/{self.ref}'
+
+    @classmethod
+    def from_webhook(cls, data: WebHook | PipelineWebHook) -> 'PipelineSummary':
+        failed_job = None
+        if data.object_attributes.status in [Status.failed, Status.warning]:
+            failed_job = data.failed_job or data.allowed_failed_job
+        return cls(
+            project_id=data.project.id_,
+            project_name=data.project.name,
+            project_url=str(data.project.web_url),
+            project_path=data.project.path_with_namespace,
+            status=data.object_attributes.status,
+            pipeline_iid=data.object_attributes.iid,
+            pipeline_url=str(data.object_attributes.url),
+            ref=data.object_attributes.ref,
+            commit_title=data.commit.title,
+            commit_url=str(data.commit.url),
+            user_name=data.user.name,
+            user_username=data.user.username,
+            user_avatar_url=str(data.user.avatar_url) if data.user.avatar_url else None,
+            failed_stage=failed_job.stage if failed_job else None,
+            failed_job=failed_job.name if failed_job else None
+        )
+
+
+class BranchStatus(BaseModel):
+    """Последний pipeline ветки проекта"""
+    model_config = ConfigDict(from_attributes=True)
+
+    project_id: int
+    project_path: str | None
+    project_url: str
+    ref: str
+    status: Status
+    pipeline_iid: int
+    pipeline_url: str
+    failed_stage: str | None = None
+    failed_job: str | None = None
+    updated_at: datetime
+
+    @property
+    def branch_url(self) -> str:
+        return f'{self.project_url}/-/tree/{self.ref}'
+
+
+class Subscription(BaseModel):
+    """
+    Подписка канала: типы событий, маски веток (fnmatch) и статусы. Пустые маски и статусы - без ограничений.
+    Статусы не проверяются у событий без статуса (merge request)
+    """
+    model_config = ConfigDict(frozen=True, from_attributes=True)
+
+    kinds: tuple[EventKind, ...]
+    branches: tuple[str, ...] = ()
+    statuses: tuple[Status, ...] = ()
+
+
+class TokenInfo(BaseModel):
+    """Персональный токен доступа (GET /personal_access_tokens/self)"""
+    id_: int = Field(title='ID', alias='id')
+    name: str
+    active: bool
+    revoked: bool
+    expires_at: date | None = Field(default=None, title='Дата окончания действия')
+    scopes: list[str] = Field(default_factory=list)
+
+
 class HookData(BaseModel):
-    """Хук, подключенный на проекте"""
+    """Хук, подключенный на проекте или группе"""
+    id_: int | None = Field(default=None, alias='id')
     url: HttpUrl
-    project_id: int
+    project_id: int | None = None
+    group_id: int | None = None
     pipeline_events: bool
+    merge_requests_events: bool = False
+    deployment_events: bool = False
+    push_events: bool = False
+    enable_ssl_verification: bool | None = None
+
+    def differs_from(self, data: dict) -> bool:
+        """Флаги хука отличаются от настроек data (GitlabAPI.webhook_data). Токен GitLab не возвращает"""
+        return any(getattr(self, key, value) != value for key, value in data.items() if isinstance(value, bool))
+
+
+class GroupAttrs(BaseModel):
+    """Аттрибуты группы"""
+    id_: int = Field(title='ID', alias='id')
+    name: str
+    full_path: str = Field(title='Путь группы с родительскими группами')
+    web_url: HttpUrl = Field(title='Ссылка')
+
+
+class ConnectResult(BaseModel):
+    """Итог массового прикрепления репозиториев к каналу"""
+    linked: list[str] = Field(default_factory=list, title='Пути прикрепленных проектов')
+    existing: list[str] = Field(default_factory=list, title='Пути проектов, уже прикрепленных к каналу')
+    hooks_created: int = Field(default=0, title='Кол-во созданных вебхуков')
+    hooks_removed: int = Field(default=0, title='Кол-во хуков проектов, замененных хуком группы')
+    group_hook: bool = Field(default=False, title='События группы приходят через хук группы')
+    failed: list[str] = Field(default_factory=list, title='Проекты и группы, которые не удалось обработать, с ошибкой')
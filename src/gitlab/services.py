@@ -1,20 +1,482 @@
-from src.database import AsyncSession
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy.exc import DBAPIError
+
+from src.cache import MISSING
+from src.config import settings
+from src.database import AsyncSession, use_primary
 from src.mattermost import crud as mm_crud
+from src.mattermost import direct
+from src.mattermost import models as mm_models
 from src.mattermost.api import MattermostAPI
-from src.mattermost.services import prepare_message
+from src.spool import drain, spool_writer
 
 from . import crud
-from .schemas import Status, WebHook
+from .api import GitlabAPI, gitlab_budget
+from .events import DEFAULT_SUBSCRIPTION, SubscriptionMatcher, compile_subscription, handlers
+from .exceptions import GitlabException
+from .schemas import BranchStatus, ConnectResult, ProjectAttrs, Subscription, WebHookEvent, webhook_adapter
+
+# Недоступность базы: asyncpg отдает ошибки соединения как OSError, SQLAlchemy оборачивает остальные в DBAPIError
+BACKEND_ERRORS = (DBAPIError, OSError)
+# Ошибки запроса к GitLab по одному проекту при массовом прикреплении
+GITLAB_ERRORS = (GitlabException, httpx.HTTPError)
+
+
+class IngestState:
+    """
+    Режим приема вебхуков. После сбоя бэкенда вебхуки пишутся в spool, пока не пройдет retry_interval;
+    затем следующий вебхук снова обрабатывается напрямую и при успехе режим сбрасывается
+    """
+
+    def __init__(self, retry_interval: float):
+        self.retry_interval = retry_interval
+        self.failed_at: float | None = None
+
+    @property
+    def spooling(self) -> bool:
+        return self.failed_at is not None and time.monotonic() - self.failed_at < self.retry_interval
+
+    def fail(self) -> None:
+        self.failed_at = time.monotonic()
+
+    def recover(self) -> None:
+        self.failed_at = None
+
+
+ingest_state = IngestState(retry_interval=settings.spool_retry_interval)
+
+
+async def get_channel_iids(project_id: int) -> list[str]:
+    """
+    ID каналов Mattermost, подписанных на проект (через кэш маршрутизации). Пустой список тоже кэшируется
+    (на unrouted_project_ttl, не дольше непустого): события проектов без каналов отбрасываются без запросов к базе.
+    Чтение идет с основной базы: отстающая реплика сразу после прикрепления канала закэшировала бы пустой список
+    """
+    cache = mm_crud.project_channels_cache
+    channel_iids = await cache.get(str(project_id))
+    if channel_iids is not MISSING:
+        return channel_iids
+    async with AsyncSession() as session:
+        use_primary(session)
+        channel_iids = await crud.get_project_channel_iids(session, project_id)
+    ttl = None if channel_iids else min(settings.unrouted_project_ttl, cache.ttl)
+    await cache.set(str(project_id), channel_iids, ttl)
+    return channel_iids
+
+
+async def get_channel_matcher(channel_iid: str) -> SubscriptionMatcher:
+    """
+    Скомпилированная подписка канала (через кэш подписок). Кэш сбрасывается при сохранении подписки,
+    поэтому перезагрузка читает основную базу: реплика может отдать прежнюю подписку
+    """
+    async def load() -> Subscription | None:
+        async with AsyncSession() as session:
+            use_primary(session)
+            return await mm_crud.get_channel_subscription(session, channel_iid)
+
+    subscription = await mm_crud.channel_subscription_cache.get_or_load(channel_iid, load)
+    return compile_subscription(subscription or DEFAULT_SUBSCRIPTION)
+
+
+async def get_channel_statuses(channel_iid: str) -> list[BranchStatus]:
+    """
+    Последние pipeline веток проектов канала из кэша, без обращений к GitLab. Кэш сбрасывается каждым событием,
+    поэтому перезагрузка читает основную базу: реплика может вернуть состояние до события
+    """
+    async def load() -> list[BranchStatus]:
+        async with AsyncSession() as session:
+            use_primary(session)
+            return await crud.get_channel_branch_statuses(session, channel_iid, limit=settings.pipeline_status_limit)
+
+    return await mm_crud.channel_status_cache.get_or_load(channel_iid, load)
+
+
+async def fetch_project(api: GitlabAPI, project_id: int) -> ProjectAttrs:
+    async with gitlab_budget:
+        return await api.get_project_detail(project_id)
+
+
+async def ensure_webhook(api: GitlabAPI, project_id: int, webhook_url: str) -> bool:
+    """
+    Создание вебхука на проекте, если его еще нет. Хук, созданный с другими флагами событий (например, до
+    подписок на merge request и деплои), обновляется
+    :return: True, если вебхук создан
+    """
+    async with gitlab_budget:
+        hooks = await api.get_webhooks(project_id)
+    hook = next((item for item in hooks if str(item.url) == webhook_url), None)
+    if hook is None:
+        async with gitlab_budget:
+            await api.create_webhook(project_id, webhook_url)
+        return True
+    if hook.id_ is not None and hook.differs_from(api.webhook_data(webhook_url)):
+        async with gitlab_budget:
+            await api.update_webhook(project_id, hook.id_, webhook_url)
+    return False
+
+
+async def remove_webhook(api: GitlabAPI, project_id: int, webhook_url: str) -> int:
+    """
+    Удаление хуков приложения с проекта, чьи события приходят через хук группы (иначе события дублируются)
+    :return: кол-во удаленных хуков
+    """
+    async with gitlab_budget:
+        hooks = await api.get_webhooks(project_id)
+    hook_ids = [item.id_ for item in hooks if str(item.url) == webhook_url and item.id_ is not None]
+    for hook_id in hook_ids:
+        async with gitlab_budget:
+            await api.delete_webhook(project_id, hook_id)
+    return len(hook_ids)
+
+
+async def ensure_group_webhook(api: GitlabAPI, group_path: str, webhook_url: str, owner_id: int) -> bool:
+    """
+    Создание хука группы, если его еще нет, и сохранение группы
+    :param owner_id: ID пользователя GitLab, чьим токеном ставится хук
+    :return: True, если хук создан
+    :raises GitlabException: хуки групп недоступны (GitLab без Premium) или нет прав владельца группы
+    """
+    async with gitlab_budget:
+        group = await api.get_group(group_path)
+    async with gitlab_budget:
+        hooks = await api.get_group_webhooks(group.id_)
+    hook = next((item for item in hooks if str(item.url) == webhook_url), None)
+    created = hook is None
+    if created:
+        async with gitlab_budget:
+            hook = await api.create_group_webhook(group.id_, webhook_url)
+    elif hook.id_ is not None and hook.differs_from(api.webhook_data(webhook_url)):
+        async with gitlab_budget:
+            await api.update_group_webhook(group.id_, hook.id_, webhook_url)
+    if hook.id_ is None:
+        raise GitlabException({'message': f'GitLab не вернул ID хука группы {group_path}'})
+    async with AsyncSession() as session:
+        await crud.save_group_hook(session, group, hook.id_, owner_id)
+    return created
+
+
+def is_under_group(project: ProjectAttrs, group_paths: list[str]) -> bool:
+    path = (project.path_with_namespace or '').lower()
+    return any(path.startswith(f'{group_path.lower()}/') for group_path in group_paths)
+
+
+async def collect_results(result: ConnectResult, projects: list[ProjectAttrs], coroutines: list) -> dict[int, int]:
+    """
+    Параллельное выполнение операций с хуками проектов; ошибки GitLab попадают в итог, не прерывая остальные
+    :return: ID проекта -> результат операции, только для успешных
+    """
+    counts = await asyncio.gather(*coroutines, return_exceptions=True)
+    done = {}
+    for project, count in zip(projects, counts, strict=True):
+        if isinstance(count, GITLAB_ERRORS):
+            result.failed.append(f'{project.path_with_namespace or project.name}: ошибка настройки вебхука ({count})')
+        elif isinstance(count, BaseException):
+            raise count
+        else:
+            done[project.id_] = count
+    return done
+
+
+async def connect_projects(
+        api: GitlabAPI,
+        owner_id: int,
+        channel: mm_models.Channel,
+        webhook_url: str,
+        project_ids: list[int],
+        group_path: str | None
+) -> ConnectResult:
+    """
+    Прикрепление выбранных проектов и проектов группы к каналу. Запросы к GitLab идут параллельно в пределах
+    бюджета gitlab_budget, проекты и связи с каналом сохраняются одной транзакцией.
+    В режиме gitlab_hook_mode=group на группу ставится один хук, а хуки ее проектов удаляются
+    :param owner_id: ID пользователя GitLab, чьим токеном создаются хуки
+    :param project_ids: ID выбранных проектов
+    :param group_path: путь группы GitLab, все ее проекты (с подгруппами) прикрепляются к каналу
+    """
+    result = ConnectResult()
+    projects: dict[int, ProjectAttrs] = {}
+    if group_path:
+        try:
+            async with gitlab_budget:
+                group_projects = await api.get_group_projects(group_path, limit=settings.gitlab_group_max_projects)
+        except GITLAB_ERRORS as exc:
+            result.failed.append(f'{group_path}: {exc}')
+            group_path = None
+        else:
+            projects.update((project.id_, project) for project in group_projects)
+    project_ids = [project_id for project_id in dict.fromkeys(project_ids) if project_id not in projects]
+    details = await asyncio.gather(
+        *(fetch_project(api, project_id) for project_id in project_ids), return_exceptions=True
+    )
+    for project_id, detail in zip(project_ids, details, strict=True):
+        if isinstance(detail, GITLAB_ERRORS):
+            result.failed.append(f'{project_id}: {detail}')
+        elif isinstance(detail, BaseException):
+            raise detail
+        else:
+            projects[project_id] = detail
+
+    if group_path and settings.gitlab_hook_mode == 'group':
+        try:
+            result.hooks_created += await ensure_group_webhook(api, group_path, webhook_url, owner_id)
+        except GITLAB_ERRORS as exc:
+            logging.info('Хук группы %s не создан, используются хуки проектов: %s', group_path, exc)
+
+    async with AsyncSession() as session:
+        created, linked = await mm_crud.link_gl_projects_to_channel(session, channel, list(projects.values()))
+        hooked_groups = await crud.get_hooked_group_paths(session)
+    for project in projects.values():
+        path = project.path_with_namespace or project.name
+        (result.linked if project.id_ in linked else result.existing).append(path)
+
+    covered = [project for project in projects.values() if is_under_group(project, hooked_groups)]
+    uncovered = [project for project in projects.values() if not is_under_group(project, hooked_groups)]
+    result.group_hook = bool(covered)
+    # Хук проекта мог появиться только у проекта, который уже был в базе
+    hooked = [project for project in covered if project.id_ not in created]
+    hooks_created, hooks_removed = await asyncio.gather(
+        collect_results(result, uncovered, [ensure_webhook(api, item.id_, webhook_url) for item in uncovered]),
+        collect_results(result, hooked, [remove_webhook(api, item.id_, webhook_url) for item in hooked])
+    )
+    result.hooks_created += sum(hooks_created.values())
+    result.hooks_removed = sum(hooks_removed.values())
+    async with AsyncSession() as session:
+        await crud.set_project_hooks(session, list(hooks_created), owner_id, webhook_url)
+        # Под хуком группы своего хука у проекта нет, но токен владельца нужен для сверки метаданных
+        await crud.set_project_hooks(session, [project.id_ for project in covered], owner_id, None)
+    return result
+
+
+async def prune_orphan_hooks() -> int:
+    """
+    Удаление хуков приложения с проектов, от которых последний канал открепился раньше, чем hook_prune_grace назад,
+    и с групп, у проектов которых за это время не осталось каналов
+    :return: кол-во проектов и групп, с которых сняты хуки
+    """
+    before = datetime.now(timezone.utc) - timedelta(seconds=settings.hook_prune_grace)
+    async with AsyncSession() as session:
+        orphans = await crud.get_orphan_hooks(session, before)
+        groups = await crud.get_orphan_groups(session, before)
+    if not orphans and not groups:
+        return 0
+    results = await asyncio.gather(
+        *(remove_webhook(GitlabAPI(token), project_id, hook_url) for project_id, hook_url, token in orphans),
+        return_exceptions=True
+    )
+    pruned = []
+    for (project_id, _, _), removed in zip(orphans, results, strict=True):
+        if isinstance(removed, GITLAB_ERRORS):
+            logging.warning('Не удалось удалить хук проекта %s: %s', project_id, removed)
+        elif isinstance(removed, BaseException):
+            raise removed
+        else:
+            pruned.append(project_id)
+    pruned_groups = await prune_group_hooks(groups)
+    async with AsyncSession() as session:
+        await crud.clear_project_hooks(session, pruned)
+        await crud.delete_groups(session, pruned_groups)
+    if pruned or pruned_groups:
+        logging.info('Сняты хуки с проектов без каналов: %s, с групп: %s', len(pruned), len(pruned_groups))
+    return len(pruned) + len(pruned_groups)
+
+
+async def remove_group_webhook(api: GitlabAPI, group_id: int, hook_id: int) -> None:
+    async with gitlab_budget:
+        await api.delete_group_webhook(group_id, hook_id)
+
+
+async def prune_group_hooks(groups: list) -> list[int]:
+    """
+    Удаление хуков групп
+    :param groups: строки (ID группы, ID хука, токен владельца хука)
+    :return: ID групп, с которых сняты хуки
+    """
+    results = await asyncio.gather(
+        *(remove_group_webhook(GitlabAPI(token), group_id, hook_id) for group_id, hook_id, token in groups),
+        return_exceptions=True
+    )
+    pruned = []
+    for (group_id, _, _), removed in zip(groups, results, strict=True):
+        if isinstance(removed, GITLAB_ERRORS):
+            logging.warning('Не удалось удалить хук группы %s: %s', group_id, removed)
+        elif isinstance(removed, BaseException):
+            raise removed
+        else:
+            pruned.append(group_id)
+    return pruned
+
+
+async def migrate_group_hooks() -> int:
+    """
+    Перевод сохраненных групп на хук группы: хук группы ставится заново или обновляется, хуки ее проектов,
+    поставленные раньше (например, при прикреплении проектов по одному), удаляются, иначе события приходят дважды.
+    Выполняется при старте воркера; после первого прохода хуков проектов под группами не остается
+    :return: кол-во удаленных хуков проектов
+    """
+    async with AsyncSession() as session:
+        use_primary(session)
+        groups = await crud.get_hooked_groups(session)
+        recorded_url = await crud.get_recorded_hook_url(session)
+        project_hooks = [await crud.get_group_project_hooks(session, group_path) for group_path, _, _ in groups]
+    if not groups:
+        return 0
+    removed = await asyncio.gather(
+        *(
+            migrate_group_hook(GitlabAPI(token), group_path, owner_id, hooks, recorded_url)
+            for (group_path, owner_id, token), hooks in zip(groups, project_hooks, strict=True)
+        ),
+        return_exceptions=True
+    )
+    total = 0
+    pruned = []
+    for (group_path, _, _), hooks, result in zip(groups, project_hooks, removed, strict=True):
+        if isinstance(result, GITLAB_ERRORS):
+            logging.warning('Не удалось перевести группу %s на хук группы: %s', group_path, result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            total += result
+            pruned.extend(project_id for project_id, _ in hooks)
+    async with AsyncSession() as session:
+        await crud.clear_project_hooks(session, pruned)
+    if total:
+        logging.info('Удалены хуки проектов под хуками групп: %s', total)
+    return total
+
+
+async def migrate_group_hook(
+        api: GitlabAPI, group_path: str, owner_id: int, project_hooks: list, recorded_url: str | None
+) -> int:
+    """
+    Хук одной группы и удаление хуков ее проектов. Хуки проектов удаляются, только если хук группы на месте
+    :param project_hooks: строки (ID проекта, URL хука)
+    :param recorded_url: URL хука приложения, если у проектов группы хуков не осталось
+    :return: кол-во удаленных хуков проектов
+    """
+    webhook_url = next((hook_url for _, hook_url in project_hooks), recorded_url)
+    if webhook_url is None:
+        return 0
+    await ensure_group_webhook(api, group_path, webhook_url, owner_id)
+    removed = await asyncio.gather(
+        *(remove_webhook(api, project_id, hook_url) for project_id, hook_url in project_hooks)
+    )
+    return sum(removed)
 
 
-async def parse_webhook(data: WebHook):
-    if data.object_attributes.status not in [Status.success, Status.warning, Status.failed]:
+async def parse_webhook(data: WebHookEvent):
+    handler = handlers[data.object_kind]
+    if not handler.accepts(data):
+        return
+    channel_iids = await get_channel_iids(data.project.id_)
+    notify_author = settings.author_dm_enabled and handler.notifies_author(data)
+    if not channel_iids and not notify_author:
+        # Проект не прикреплен ни к одному каналу: событие отбрасывается без записи в базу
+        return
+    if channel_iids:
+        await handler.store(data, channel_iids)
+    # События, которые не нужны ни одному каналу, отбрасываются до отрисовки и запросов в Mattermost
+    event = handler.event(data)
+    subscribed = []
+    for channel_iid in channel_iids:
+        if (await get_channel_matcher(channel_iid)).matches(event):
+            subscribed.append(channel_iid)
+    if not subscribed and not notify_author:
         return
     async with AsyncSession() as session:
-        project = await crud.get_or_create_project(session, data.project)
-        channels = project.mattermost_channels
         bot = await mm_crud.get_last_bot(session)
-    message = await prepare_message(data)
-    instance = MattermostAPI(bot.access_token)
-    for channel in channels:
-        await instance.create_post(channel.iid, message)
+    api = MattermostAPI(bot.access_token)
+    if subscribed:
+        handler.notify(api, subscribed, data)
+    if notify_author:
+        await direct.notify_author(api, bot.iid, data.user.id_, lambda: handler.render(data))
+
+
+async def process_webhook(data: WebHookEvent, body: bytes) -> None:
+    """Обработка принятого вебхука. Если бэкенд недоступен, сырое тело уходит в spool"""
+    try:
+        await parse_webhook(data)
+    except BACKEND_ERRORS:
+        logging.exception('Бэкенд недоступен, вебхук сохранен в spool')
+        ingest_state.fail()
+        await spool_writer.append(body)
+        return
+    ingest_state.recover()
+
+
+async def replay_webhook(body: bytes) -> None:
+    await parse_webhook(webhook_adapter.validate_json(body))
+
+
+async def drain_spool() -> None:
+    """Воспроизведение вебхуков из spool. Прерывается до следующего запуска, пока бэкенд недоступен"""
+    if replayed := await drain(settings.spool_dir, replay_webhook, BACKEND_ERRORS):
+        logging.info('Из spool воспроизведено вебхуков: %s', replayed)
+
+
+async def ensure_event_partitions() -> None:
+    """Секции событий pipeline на текущий и следующий месяц и удаление устаревших ключей защиты от повторов"""
+    now = datetime.now(timezone.utc)
+    month = now.date().replace(day=1)
+    async with AsyncSession() as session:
+        for _ in range(2):
+            await crud.create_event_partition(session, month)
+            month = (month + timedelta(days=31)).replace(day=1)
+        await crud.delete_event_keys(session, now - timedelta(days=settings.pipeline_event_key_days))
+
+
+async def fetch_projects_metadata(access_token: str, project_ids: list[int]) -> list[ProjectAttrs]:
+    async with gitlab_budget:
+        return await GitlabAPI(access_token).get_projects_metadata(project_ids)
+
+
+async def sync_projects_metadata() -> int:
+    """
+    Сверка названий, путей и аватаров проектов с GitLab. Проекты запрашиваются пачками по project_sync_batch_size
+    одним запросом GraphQL на пачку, проекты, сверенные позже project_sync_max_age назад, не запрашиваются.
+    Признака изменения метаданных GitLab не отдает (lastActivityAt не меняется при переименовании и смене аватара),
+    поэтому записываются только проекты, чьи метаданные отличаются от сохраненных
+    :return: кол-во обновленных проектов
+    """
+    now = datetime.now(timezone.utc)
+    before = now - timedelta(seconds=settings.project_sync_max_age)
+    async with AsyncSession() as session:
+        rows = await crud.get_projects_to_sync(session, before, limit=settings.project_sync_limit)
+    if not rows:
+        return 0
+    stored: dict[int, dict] = {}
+    by_token: dict[str, list[int]] = {}
+    for project_id, *metadata, access_token in rows:
+        stored[project_id] = dict(zip(crud.PROJECT_METADATA, metadata, strict=True))
+        by_token.setdefault(access_token, []).append(project_id)
+    size = settings.project_sync_batch_size
+    batches = [
+        (access_token, project_ids[start:start + size])
+        for access_token, project_ids in by_token.items() for start in range(0, len(project_ids), size)
+    ]
+    results = await asyncio.gather(
+        *(fetch_projects_metadata(access_token, project_ids) for access_token, project_ids in batches),
+        return_exceptions=True
+    )
+    changed = []
+    synced_ids = []
+    for (_, project_ids), projects in zip(batches, results, strict=True):
+        if isinstance(projects, GITLAB_ERRORS):
+            logging.warning('Не удалось получить метаданные проектов: %s', projects)
+            continue
+        if isinstance(projects, BaseException):
+            raise projects
+        # Проекты, которых нет в ответе (удалены или не видны владельцу), не считаются сверенными
+        synced_ids.extend(project.id_ for project in projects if project.id_ in stored)
+        if missing := len(project_ids) - len(projects):
+            logging.warning('GitLab не вернул метаданные проектов: %s', missing)
+        changed.extend(project for project in projects if crud.project_metadata(project) != stored.get(project.id_))
+    async with AsyncSession() as session:
+        await crud.save_projects_metadata(session, changed, synced_ids, now)
+    if changed:
+        logging.info('Обновлены метаданные проектов: %s', len(changed))
+    return len(changed)
@@ -0,0 +1,94 @@
+"""
+Фоновая проверка сохраненных персональных токенов GitLab.
+
+Все токены проверяются параллельно через GET /personal_access_tokens/self в пределах бюджета запросов gitlab_budget.
+Недействительный токен помечается, и интерактивные обработчики отказывают сразу, не обращаясь к GitLab.
+При переходе токена в состояние expiring или invalid пользователь получает личное сообщение (token_expiry_notify).
+Сетевые ошибки и ответы 5xx/429 состояние токена не меняют.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+
+from src.config import settings
+from src.database import AsyncSession
+from src.mattermost import crud as mm_crud
+from src.mattermost import direct
+from src.mattermost.api import MattermostAPI
+
+from . import crud
+from .api import GitlabAPI, gitlab_budget
+from .exceptions import GitlabException, InvalidTokenException
+from .schemas import TokenStatus
+
+NOTIFY_STATUSES = (TokenStatus.expiring, TokenStatus.invalid)
+
+
+async def check_token(access_token: str, today: date) -> tuple[TokenStatus, date | None] | None:
+    """
+    Проверка одного токена
+    :return: состояние и дата окончания действия или None, если GitLab не ответил
+    """
+    async with gitlab_budget:
+        try:
+            info = await GitlabAPI(access_token).get_token_info()
+        except InvalidTokenException:
+            return TokenStatus.invalid, None
+        except (GitlabException, httpx.HTTPError) as exc:
+            logging.warning('Не удалось проверить токен: %s', exc)
+            return None
+    if not info.active or info.revoked:
+        return TokenStatus.invalid, info.expires_at
+    if info.expires_at and info.expires_at - today <= timedelta(days=settings.token_expiry_warning_days):
+        return TokenStatus.expiring, info.expires_at
+    return TokenStatus.active, info.expires_at
+
+
+def render_token_warning(status: TokenStatus, expires_at: date | None) -> str:
+    if status == TokenStatus.invalid:
+        text = 'Персональный токен GitLab больше не действует'
+    else:
+        text = f'Персональный токен GitLab перестанет действовать {expires_at:%d.%m.%Y}'
+    return f'{text}. Укажите новый токен командой `/matterlab connect`'
+
+
+async def sweep_tokens() -> int:
+    """
+    Проверка всех сохраненных токенов
+    :return: кол-во токенов, чье состояние изменилось
+    """
+    async with AsyncSession() as session:
+        users = await crud.get_gl_users_with_tokens(session)
+    if not users:
+        return 0
+    today = datetime.now(timezone.utc).date()
+    results = await asyncio.gather(*(check_token(access_token, today) for _, access_token, _, _ in users))
+    checked_at = datetime.now(timezone.utc)
+    updates = []
+    warnings: list[tuple[str, str]] = []
+    changed = 0
+    for (user_id, access_token, previous, mm_user_id), result in zip(users, results, strict=True):
+        if result is None:
+            continue
+        status, expires_at = result
+        updates.append({
+            'user_id': user_id, 'checked_token': access_token, 'status': status, 'expires_at': expires_at,
+            'checked_at': checked_at
+        })
+        if status == previous:
+            continue
+        changed += 1
+        if status in NOTIFY_STATUSES and mm_user_id:
+            warnings.append((mm_user_id, render_token_warning(status, expires_at)))
+    async with AsyncSession() as session:
+        await crud.update_token_statuses(session, updates)
+        bot = await mm_crud.get_last_bot(session) if warnings and settings.token_expiry_notify else None
+    if bot is not None:
+        api = MattermostAPI(bot.access_token)
+        for mm_user_id, message in warnings:
+            await direct.notify_user(api, bot.iid, mm_user_id, message)
+    if changed:
+        logging.info('Токенов GitLab с новым состоянием: %s', changed)
+    return changed
@@ -1,8 +1,14 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
+from src.cache import start_invalidation_listener
+from src.database import replica_monitor
 from src.gitlab.routers import router as gitlab_router
+from src.mattermost.avatars import router as avatars_router
+from src.mattermost.badges import router as badges_router
 from src.mattermost.routers import router as mattermost_router
+from src.metrics import router as metrics_router
+from src.spool import spool_writer
 
 from .config import settings
 
@@ -13,9 +19,25 @@ app = FastAPI(
     docs_url='/openapi'
 )
 app.openapi_version = '3.0.3'
+# Значки отдаются из-под /static, поэтому их роуты должны стоять раньше StaticFiles
+app.include_router(badges_router)
 app.mount('/static', StaticFiles(directory='static'), name='static')
 app.mount('/mattermost/static', StaticFiles(directory='static'), name='mm_static')
 
 # Роутеры
 app.include_router(gitlab_router)
 app.include_router(mattermost_router)
+app.include_router(avatars_router)
+app.include_router(metrics_router)
+
+
+@app.on_event('startup')
+async def startup():
+    start_invalidation_listener()
+    replica_monitor.start()
+    spool_writer.start_sync(settings.spool_fsync_interval)
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await spool_writer.close()
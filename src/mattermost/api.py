@@ -14,11 +14,16 @@ class MattermostAPI:
 
     class Endpoints(enum.StrEnum):
         create_post = '/posts'
+        create_direct_channel = '/channels/direct'
 
     def _get_url(self, endpoint: str) -> str:
         return f'{str(self.base_url)}{endpoint}'
 
-    async def create_post(self, channel_id: str, content: str):
+    async def create_post(self, channel_id: str, content: str) -> bool:
+        """
+        Отправка сообщения в канал
+        :return: True, если Mattermost принял сообщение
+        """
         data = {
             'channel_id': channel_id,
             'message': content
@@ -27,3 +32,19 @@ class MattermostAPI:
             response = await session.post(self._get_url(self.Endpoints.create_post), json=data, headers=self.headers)
         if response.status_code >= 400:
             logging.error(response.json())
+            return False
+        return True
+
+    async def create_direct_channel(self, user_id: str, other_user_id: str) -> str | None:
+        """
+        Получение (или создание) канала личных сообщений между двумя пользователями
+        :return: ID канала или None, если Mattermost вернул ошибку
+        """
+        async with httpx.AsyncClient() as session:
+            response = await session.post(
+                self._get_url(self.Endpoints.create_direct_channel), json=[user_id, other_user_id], headers=self.headers
+            )
+        if response.status_code >= 400:
+            logging.error(response.json())
+            return None
+        return response.json()['id']
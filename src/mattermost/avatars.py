@@ -0,0 +1,198 @@
+"""
+Прокси аватаров GitLab для сообщений и lookup'ов.
+
+Картинки хранятся на диске в LRU, ограниченном по суммарному размеру. Одновременные запросы одного URL ждут
+одну общую загрузку. Прокси отдает только URL, подписанные приложением (HMAC от gitlab_secret), поэтому через
+него нельзя скачать произвольный адрес.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from src.config import settings
+
+MEDIA_TYPES = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+    'image/svg+xml': 'svg',
+    'image/x-icon': 'ico',
+}
+EXTENSIONS = {extension: media_type for media_type, extension in MEDIA_TYPES.items()}
+
+
+class AvatarError(Exception):
+    """Аватар не удалось получить из GitLab"""
+
+
+def sign(url: str) -> str:
+    return hmac.new(settings.gitlab_secret.encode(), url.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def proxy_path(url: str) -> str:
+    """Путь прокси для URL аватара относительно корня приложения"""
+    return f'avatars?{urlencode({"url": url, "sig": sign(url)})}'
+
+
+class AvatarEntry(NamedTuple):
+    path: Path
+    size: int
+    etag: str
+    media_type: str
+    fetched_at: float
+
+
+class AvatarCache:
+    """
+    LRU аватаров на диске. Файл называется <sha256 URL>.<хэш содержимого>.<расширение>,
+    поэтому индекс восстанавливается сканированием каталога
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, max_image_size: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_image_size = max_image_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, AvatarEntry] | None = None
+        self._total = 0
+        self._inflight: dict[str, asyncio.Task[AvatarEntry]] = {}
+
+    @property
+    def entries(self) -> OrderedDict[str, AvatarEntry]:
+        if self._entries is None:
+            self._entries = OrderedDict()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for path in sorted(self.directory.iterdir(), key=lambda item: item.stat().st_mtime):
+                key, _, rest = path.name.partition('.')
+                etag, _, extension = rest.partition('.')
+                if extension not in EXTENSIONS:
+                    continue
+                stat = path.stat()
+                self._add(key, AvatarEntry(path, stat.st_size, f'"{etag}"', EXTENSIONS[extension], stat.st_mtime))
+        return self._entries
+
+    def _add(self, key: str, entry: AvatarEntry) -> None:
+        self._remove(key, keep=entry.path)
+        self._entries[key] = entry
+        self._total += entry.size
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: str, keep: Path | None = None) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total -= entry.size
+        if entry.path != keep:
+            entry.path.unlink(missing_ok=True)
+
+    async def get(self, url: str) -> AvatarEntry:
+        """
+        Аватар из кэша или из GitLab. Устаревший аватар отдается, если GitLab не ответил
+        :raises AvatarError: аватара нет в кэше и его не удалось загрузить
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        entry = self.entries.get(key)
+        if entry and time.time() - entry.fetched_at < self.ttl:
+            self.entries.move_to_end(key)
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, url, entry))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Отмена одного запроса не должна прерывать загрузку, которую ждут остальные
+        return await asyncio.shield(task)
+
+    def forget(self, url: str) -> None:
+        """Удаление записи, файл которой пропал (например, вытеснен другим воркером)"""
+        key = hashlib.sha256(url.encode()).hexdigest()
+        if key in self.entries:
+            self._remove(key)
+
+    async def _fetch(self, key: str, url: str, stale: AvatarEntry | None) -> AvatarEntry:
+        try:
+            content, media_type = await self._download(url)
+        except (AvatarError, httpx.HTTPError) as exc:
+            if stale is not None:
+                logging.warning('Не удалось обновить аватар %s: %s', url, exc)
+                return stale
+            raise AvatarError(str(exc)) from exc
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        path = self.directory / f'{key}.{etag}.{MEDIA_TYPES[media_type]}'
+        await asyncio.to_thread(self._write, path, content)
+        entry = AvatarEntry(path, len(content), f'"{etag}"', media_type, time.time())
+        self._add(key, entry)
+        return entry
+
+    async def _download(self, url: str) -> tuple[bytes, str]:
+        async with (
+            httpx.AsyncClient(timeout=10, follow_redirects=True) as client,
+            client.stream('GET', url) as response
+        ):
+            if response.status_code != 200:
+                raise AvatarError(f'GitLab ответил {response.status_code}')
+            media_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            if media_type not in MEDIA_TYPES:
+                raise AvatarError(f'Неподдерживаемый тип {media_type!r}')
+            if int(response.headers.get('Content-Length', 0)) > self.max_image_size:
+                raise AvatarError('Аватар больше допустимого размера')
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                content.extend(chunk)
+                if len(content) > self.max_image_size:
+                    raise AvatarError('Аватар больше допустимого размера')
+        return bytes(content), media_type
+
+    @staticmethod
+    def _write(path: Path, content: bytes) -> None:
+        temp_path = path.with_name(f'.{path.name}.tmp')
+        temp_path.write_bytes(content)
+        os.replace(temp_path, path)
+
+
+avatar_cache = AvatarCache(
+    directory=settings.avatar_cache_dir,
+    max_bytes=settings.avatar_cache_size,
+    max_image_size=settings.avatar_max_size,
+    ttl=settings.avatar_ttl
+)
+
+router = APIRouter(tags=['Avatars'])
+
+
+@router.get('/avatars', include_in_schema=False)
+@router.get('/mattermost/avatars', include_in_schema=False)
+async def avatar(request: Request, url: str, sig: str):
+    # responses -> schemas -> services -> avatars: импорт на уровне модуля был бы циклическим
+    from .responses import etag_matches
+
+    if not hmac.compare_digest(sign(url), sig):
+        raise HTTPException(status_code=403)
+    for _ in range(2):
+        try:
+            entry = await avatar_cache.get(url)
+        except AvatarError as exc:
+            raise HTTPException(status_code=502, detail=str(exc)) from exc
+        headers = {'ETag': entry.etag, 'Cache-Control': f'public, max-age={settings.avatar_ttl}'}
+        if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+            return Response(status_code=304, headers=headers)
+        try:
+            content = await asyncio.to_thread(entry.path.read_bytes)
+        except FileNotFoundError:
+            avatar_cache.forget(url)
+            continue
+        return Response(content=content, media_type=entry.media_type, headers=headers)
+    raise HTTPException(status_code=502)
@@ -0,0 +1,138 @@
+"""
+Значки (badges) для сообщений в стиле shields.io, отрисованные локально.
+
+URL значка содержит хэш его содержимого, поэтому ответы кэшируются клиентами навсегда. Значок восстанавливается
+по URL в любом воркере, так что хранить выданные значки не нужно: статусы отрисовываются один раз при импорте,
+значки репозиториев - по запросу с LRU-кэшем.
+"""
+import functools
+import hashlib
+from dataclasses import dataclass
+from html import escape
+from urllib.parse import quote
+
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import RedirectResponse
+
+from src.gitlab.schemas import Status
+
+STATUS_COLORS = {
+    Status.success: '#4c1',
+    Status.failed: '#f00',
+    Status.warning: '#dfb317',
+}
+DEFAULT_COLOR = '#9f9f9f'
+REPOSITORY_COLOR = '#fff'
+
+# Ширина символов Verdana 11px, px. Остальные символы считаются по средней ширине
+CHAR_WIDTHS = {
+    **dict.fromkeys('ijl.,:;|!\'', 3.5),
+    **dict.fromkeys('frtI()[]/ -', 4.5),
+    **dict.fromkeys('mwMW', 10.5),
+    **dict.fromkeys('ABCDGHKNOQRUVXY', 8),
+}
+AVERAGE_CHAR_WIDTH = 7
+PADDING = 10
+
+TEMPLATE = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="20" role="img" aria-label="{title}">'
+    '<title>{title}</title>'
+    '<linearGradient id="s" x2="0" y2="100%"><stop offset="0" stop-color="#bbb" stop-opacity=".1"/>'
+    '<stop offset="1" stop-opacity=".1"/></linearGradient>'
+    '<clipPath id="r"><rect width="{width}" height="20" rx="3" fill="#fff"/></clipPath>'
+    '<g clip-path="url(#r)"><rect width="{label_width}" height="20" fill="#555"/>'
+    '<rect x="{label_width}" width="{message_width}" height="20" fill="{color}"/>'
+    '<rect width="{width}" height="20" fill="url(#s)"/></g>'
+    '<g fill="#fff" text-anchor="middle" font-family="Verdana,Geneva,DejaVu Sans,sans-serif" font-size="11">'
+    '<text x="{label_x}" y="14">{label}</text>'
+    '<text x="{message_x}" y="14" fill="{text_color}">{message}</text></g></svg>'
+)
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def text_width(text: str) -> int:
+    return round(sum(CHAR_WIDTHS.get(char, AVERAGE_CHAR_WIDTH) for char in text))
+
+
+def is_light(color: str) -> bool:
+    digits = color.lstrip('#')
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    red, green, blue = (int(digits[index:index + 2], 16) for index in (0, 2, 4))
+    return 0.299 * red + 0.587 * green + 0.114 * blue > 186
+
+
+def render_svg(label: str, message: str, color: str) -> str:
+    label_width = text_width(label) + PADDING
+    message_width = text_width(message) + PADDING
+    return TEMPLATE.format(
+        width=label_width + message_width,
+        label_width=label_width,
+        message_width=message_width,
+        label_x=label_width / 2,
+        message_x=label_width + message_width / 2,
+        color=color,
+        text_color='#333' if is_light(color) else '#fff',
+        title=escape(f'{label}: {message}'),
+        label=escape(label),
+        message=escape(message)
+    )
+
+
+@dataclass(frozen=True)
+class Badge:
+    kind: str
+    value: str
+    content: bytes
+    digest: str
+
+    @classmethod
+    def render(cls, kind: str, value: str, label: str, color: str) -> 'Badge':
+        content = render_svg(label, value, color).encode()
+        return cls(kind=kind, value=value, content=content, digest=hashlib.sha256(content).hexdigest()[:16])
+
+    @property
+    def path(self) -> str:
+        """Путь значка относительно корня приложения"""
+        return f'static/badges/{self.kind}/{quote(self.value, safe="")}.{self.digest}.svg'
+
+
+status_badges = {
+    status: Badge.render('status', status, 'build', STATUS_COLORS.get(status, DEFAULT_COLOR)) for status in Status
+}
+
+
+@functools.lru_cache(maxsize=1024)
+def repository_badge(name: str) -> Badge:
+    return Badge.render('repository', name, 'repository', REPOSITORY_COLOR)
+
+
+def get_badge(kind: str, value: str) -> Badge | None:
+    if kind == 'status':
+        try:
+            return status_badges[Status(value)]
+        except ValueError:
+            return None
+    if kind == 'repository':
+        return repository_badge(value)
+    return None
+
+
+router = APIRouter(tags=['Badges'])
+
+
+@router.get('/static/badges/{kind}/{value}.{digest}.svg', include_in_schema=False)
+@router.get('/mattermost/static/badges/{kind}/{value}.{digest}.svg', include_in_schema=False)
+async def badge(kind: str, value: str, digest: str):
+    badge_obj = get_badge(kind, value)
+    if badge_obj is None:
+        raise HTTPException(status_code=404)
+    if badge_obj.digest != digest:
+        # Значок из старого сообщения, отрисованный прежней версией: отдаем актуальный
+        return RedirectResponse(badge_obj.path.rsplit('/', 1)[-1])
+    return Response(
+        content=badge_obj.content,
+        media_type='image/svg+xml',
+        headers={'Cache-Control': CACHE_CONTROL, 'ETag': f'"{badge_obj.digest}"'}
+    )
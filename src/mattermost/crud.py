@@ -1,17 +1,36 @@
+from datetime import datetime, timezone
 from typing import TYPE_CHECKING
 
-from sqlalchemy import select
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session, selectinload
 
+from src.cache import TieredCache
+from src.config import settings
+from src.database import use_primary
+from src.gitlab import models as gl_models
+from src.gitlab.schemas import BranchStatus, ProjectAttrs, Subscription
+
 from . import models
 
 if TYPE_CHECKING:
-    from src.gitlab import models as gl_models
-
     from . import schemas
 
 
+# ID проекта GitLab -> ID каналов Mattermost, куда уходят его уведомления
+project_channels_cache = TieredCache('project_channels', list[str], ttl=600)
+# ID канала Mattermost -> последние pipeline веток его проектов. Сбрасывается при каждом событии проекта канала
+channel_status_cache = TieredCache('channel_status', list[BranchStatus], ttl=600)
+# ID канала Mattermost -> подписка канала, None - подписка по умолчанию
+channel_subscription_cache = TieredCache('channel_subscription', Subscription | None, ttl=600)
+# ID пользователя GitLab -> ID пользователя Mattermost, None - аккаунты не связаны
+author_cache = TieredCache('gitlab_author', str | None, ttl=settings.author_cache_ttl)
+# ID бота:ID пользователя Mattermost -> ID канала личных сообщений. Канал между двумя пользователями не меняется
+direct_channel_cache = TieredCache('direct_channel', str, ttl=settings.direct_channel_cache_ttl)
+
+
 async def get_or_create_user(session: Session, user: 'schemas.User') -> models.User:
+    use_primary(session)
     result = await session.scalars(select(models.User).where(models.User.id == user.id_).options(
         selectinload(models.User.gitlab_user)
     ))
@@ -27,6 +46,7 @@ async def get_or_create_user(session: Session, user: 'schemas.User') -> models.U
 async def get_or_create_channel(
         session: Session, channel: 'schemas.Channel', gl_projects: list['gl_models.Project'] | None = None
 ) -> models.Channel:
+    use_primary(session)
     result = await session.scalars(select(models.Channel).where(models.Channel.iid == channel.iid).options(
         selectinload(models.Channel.gitlab_projects)
     ))
@@ -49,19 +69,68 @@ async def add_gl_project_to_channel(
     ))
     channel = result.first()
     channel.gitlab_projects.extend(gl_projects)
+    for gl_project in gl_projects:
+        gl_project.unsubscribed_at = None
     session.add(channel)
     await session.commit()  # noqa
     await session.refresh(channel)  # noqa
+    for gl_project in gl_projects:
+        await project_channels_cache.delete(str(gl_project.id))
+    await channel_status_cache.delete(channel.iid)
     return channel
 
 
+async def link_gl_projects_to_channel(
+        session: Session, channel: models.Channel, projects: list[ProjectAttrs]
+) -> tuple[set[int], set[int]]:
+    """
+    Массовое прикрепление проектов к каналу в одной транзакции: проекты и связи вставляются одним INSERT каждые,
+    существующие строки не меняются
+    :return: ID проектов, которых еще не было в базе, и ID проектов, которые не были прикреплены к каналу раньше
+    """
+    if not projects:
+        return set(), set()
+    result = await session.execute(
+        insert(gl_models.Project)
+        .values([project.model_dump(mode='json', by_alias=True) for project in projects])
+        .on_conflict_do_nothing()
+        .returning(gl_models.Project.id)
+    )
+    created = set(result.scalars().all())
+    association = models.GitlabProjectChannel.__table__
+    result = await session.execute(
+        insert(association)
+        .values([
+            {'gitlab_project_id': project.id_, 'mattermost_channel_id': channel.id} for project in projects
+        ])
+        .on_conflict_do_nothing()
+        .returning(association.c.gitlab_project_id)
+    )
+    linked = set(result.scalars().all())
+    if linked:
+        await session.execute(
+            update(gl_models.Project).where(gl_models.Project.id.in_(linked)).values(unsubscribed_at=None)
+        )
+    await session.commit()  # noqa
+    for project_id in linked:
+        await project_channels_cache.delete(str(project_id))
+    if linked:
+        await channel_status_cache.delete(channel.iid)
+    return created, linked
+
+
 async def delete_gl_project_from_channel(
         session: Session, channel: models.Channel, gl_project: 'gl_models.Project'
 ) -> models.Channel:
     channel.gitlab_projects.remove(gl_project)
+    if not gl_project.mattermost_channels:
+        # Хук проекта удалит services.prune_orphan_hooks, если канал не появится за hook_prune_grace
+        gl_project.unsubscribed_at = datetime.now(timezone.utc)
     session.add(channel)
     await session.commit()  # noqa
     await session.refresh(channel)  # noqa
+    await project_channels_cache.delete(str(gl_project.id))
+    await channel_status_cache.delete(channel.iid)
     return channel
 
 
@@ -74,6 +143,7 @@ async def get_last_bot(session: Session) -> models.Bot:
 
 
 async def get_or_create_bot(session: Session, bot: 'schemas.CommandRequestContext') -> tuple[models.Bot, bool]:
+    use_primary(session)
     result = await session.scalars(select(models.Bot).where(models.Bot.iid == bot.bot_user_id))
     bot_obj = result.first()
     created = False
@@ -95,3 +165,97 @@ async def update_bot(session: Session, bot: models.Bot, data: 'schemas.CommandRe
     await session.commit()  # noqa
     await session.refresh(bot)  # noqa
     return bot
+
+
+async def create_reminder(
+        session: Session, user: models.User, post: 'schemas.Post', due_at: datetime
+) -> models.Reminder:
+    reminder = models.Reminder(
+        user_id=user.id, channel_id=post.channel_id, post_id=post.id_, message=post.message, due_at=due_at
+    )
+    session.add(reminder)
+    await session.commit()  # noqa
+    return reminder
+
+
+async def get_pending_reminders(session: Session, ids: list[int]) -> list[models.Reminder]:
+    result = await session.scalars(
+        select(models.Reminder).where(models.Reminder.id.in_(ids), models.Reminder.sent_at.is_(None))
+    )
+    return list(result)
+
+
+async def get_pending_reminder_batch(
+        session: Session, after_id: int, limit: int
+) -> list[tuple[int, datetime]]:
+    """Пачка неотправленных напоминаний (id, due_at) с id больше after_id"""
+    result = await session.execute(
+        select(models.Reminder.id, models.Reminder.due_at)
+        .where(models.Reminder.sent_at.is_(None), models.Reminder.id > after_id)
+        .order_by(models.Reminder.id)
+        .limit(limit)
+    )
+    return list(result.tuples())
+
+
+async def mark_reminder_unindexed(session: Session, reminder_id: int) -> None:
+    await session.execute(
+        update(models.Reminder).where(models.Reminder.id == reminder_id).values(unindexed=True)
+    )
+    await session.commit()  # noqa
+
+
+async def get_unindexed_reminders(session: Session, limit: int) -> list[tuple[int, datetime | None]]:
+    """Напоминания, не попавшие в индекс Redis: (id, due_at), due_at = None - напоминание уже отправлено"""
+    result = await session.execute(
+        select(models.Reminder.id, models.Reminder.due_at, models.Reminder.sent_at)
+        .where(models.Reminder.unindexed)
+        .order_by(models.Reminder.id)
+        .limit(limit)
+    )
+    return [(item_id, None if sent_at else due_at) for item_id, due_at, sent_at in result.tuples()]
+
+
+async def clear_unindexed(session: Session, ids: list[int]) -> None:
+    if not ids:
+        return
+    await session.execute(update(models.Reminder).where(models.Reminder.id.in_(ids)).values(unindexed=False))
+    await session.commit()  # noqa
+
+
+async def mark_reminders_sent(session: Session, ids: list[int]) -> None:
+    if not ids:
+        return
+    await session.execute(update(models.Reminder).where(models.Reminder.id.in_(ids)).values(sent_at=func.now()))
+    await session.commit()  # noqa
+
+
+async def get_channel_subscription(session: Session, channel_iid: str) -> Subscription | None:
+    result = await session.scalars(
+        select(models.ChannelSubscription)
+        .join(models.Channel, models.Channel.id == models.ChannelSubscription.channel_id)
+        .where(models.Channel.iid == channel_iid)
+    )
+    subscription = result.first()
+    return Subscription.model_validate(subscription) if subscription else None
+
+
+async def save_channel_subscription(session: Session, channel: models.Channel, subscription: Subscription) -> None:
+    values = subscription.model_dump(mode='json')
+    statement = insert(models.ChannelSubscription).values(channel_id=channel.id, **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.ChannelSubscription.channel_id], set_=values
+    )
+    await session.execute(statement)
+    await session.commit()  # noqa
+    await channel_subscription_cache.delete(channel.iid)
+
+
+async def get_user_id_by_gitlab_iid(session: Session, gitlab_iid: int) -> str | None:
+    """ID пользователя Mattermost, связанного с пользователем GitLab (по уникальному индексу gitlab_user.iid)"""
+    result = await session.scalars(
+        select(models.User.id)
+        .join(gl_models.GitlabUser, gl_models.GitlabUser.id == models.User.gitlab_user_id)
+        .where(gl_models.GitlabUser.iid == gitlab_iid)
+    )
+    return result.first()
@@ -0,0 +1,92 @@
+"""
+Доставка сообщений в Mattermost по полосам каналов.
+
+У каждого канала своя очередь (полоса): сообщения одного канала уходят строго по порядку, по одному за раз.
+Разные каналы обслуживаются параллельно общим пулом воркеров. Полоса с ожидающими сообщениями стоит в очереди
+готовых ровно один раз; после отправки одного сообщения она встает в конец, поэтому занятой канал не задерживает
+остальные больше, чем на одно сообщение.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import NamedTuple
+
+import httpx
+
+from src.config import settings
+
+from .api import MattermostAPI
+
+
+class Delivery(NamedTuple):
+    api: MattermostAPI
+    message: str
+
+
+class DeliveryScheduler:
+
+    def __init__(self, workers: int, retries: int = 0, retry_delay: float = 1.0):
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._lanes: dict[str, deque[Delivery]] = {}
+        self._ready: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Кол-во сообщений, ожидающих отправки (включая отправляемые сейчас)"""
+        return self._pending
+
+    def _ensure_started(self) -> asyncio.Queue[str]:
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self._ready
+
+    def submit(self, api: MattermostAPI, channel_id: str, message: str) -> None:
+        """
+        Постановка сообщения в полосу канала. Не ждет отправки
+        :param api: клиент Mattermost от имени бота
+        :param channel_id: ID канала Mattermost
+        :param message: текст сообщения
+        """
+        ready = self._ensure_started()
+        self._pending += 1
+        lane = self._lanes.get(channel_id)
+        if lane is not None:
+            # Полоса уже стоит в очереди готовых или обрабатывается воркером
+            lane.append(Delivery(api, message))
+            return
+        self._lanes[channel_id] = deque([Delivery(api, message)])
+        ready.put_nowait(channel_id)
+
+    async def _send(self, channel_id: str, delivery: Delivery) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                if await delivery.api.create_post(channel_id, delivery.message):
+                    return
+            except httpx.HTTPError:
+                logging.exception('Ошибка отправки сообщения в канал %s', channel_id)
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+        logging.error('Сообщение в канал %s не доставлено', channel_id)
+
+    async def _worker(self) -> None:
+        while True:
+            channel_id = await self._ready.get()
+            lane = self._lanes[channel_id]
+            try:
+                await self._send(channel_id, lane.popleft())
+            except Exception:
+                logging.exception('Ошибка доставки в канал %s', channel_id)
+            finally:
+                self._pending -= 1
+                if lane:
+                    self._ready.put_nowait(channel_id)
+                else:
+                    del self._lanes[channel_id]
+
+
+delivery_scheduler = DeliveryScheduler(workers=settings.delivery_workers, retries=settings.delivery_retries)
@@ -0,0 +1,142 @@
+"""
+Сводные сообщения при шторме уведомлений.
+
+Пока в канал приходит не больше settings.digest_threshold событий за окно settings.digest_window,
+каждое событие отправляется отдельным сообщением. Как только порог превышен, канал переходит в режим шторма:
+события копятся и раз в окно уходят одним сводным сообщением. Когда поток событий за окно снова укладывается
+в порог, канал возвращается к обычным сообщениям.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from mdutils import MdUtils
+
+from src.config import settings
+from src.gitlab.schemas import PipelineSummary, Status
+
+from .api import MattermostAPI
+from .delivery import DeliveryScheduler, delivery_scheduler
+
+DIGEST_STATUSES = (Status.failed, Status.warning, Status.success)
+
+
+def render_digest(events: list[PipelineSummary], window: float) -> str:
+    """Сводка по проектам: кол-во событий по статусам и последняя ошибка"""
+    md_file = MdUtils(file_name='mattermost_digest')
+    by_project: dict[int, list[PipelineSummary]] = {}
+    for event in events:
+        by_project.setdefault(event.project_id, []).append(event)
+    failed_total = sum(1 for event in events if event.status == Status.failed)
+    md_file.new_line(
+        f'**Сводка за {round(window / 60) or 1} мин: {len(events)} pipeline, из них упало {failed_total}, '
+        f'проектов {len(by_project)}**'
+    )
+
+    table_data = ['Проект', 'Упало', 'С предупреждениями', 'Успешно', 'Последняя ошибка']
+    columns = len(table_data)
+    # Сначала проекты с наибольшим кол-вом падений
+    projects = sorted(
+        by_project.values(), key=lambda items: sum(1 for item in items if item.status == Status.failed), reverse=True
+    )
+    for items in projects:
+        last = items[-1]
+        counts = {status: sum(1 for item in items if item.status == status) for status in DIGEST_STATUSES}
+        last_failed = next((item for item in reversed(items) if item.status == Status.failed), None)
+        failure = ''
+        if last_failed:
+            failure = md_file.new_inline_link(last_failed.pipeline_url, f'#{last_failed.pipeline_iid}')
+            failure += f' {last_failed.ref}'
+            if last_failed.failed_job:
+                failure += f': {last_failed.failed_stage} / {last_failed.failed_job}'
+        table_data.extend([
+            md_file.new_inline_link(last.project_url, last.project_path or last.project_name),
+            str(counts[Status.failed]),
+            str(counts[Status.warning]),
+            str(counts[Status.success]),
+            failure
+        ])
+    md_file.new_line()
+    md_file.new_table(columns=columns, rows=len(table_data) // columns, text=table_data, text_align='left')
+    return md_file.file_data_text.lstrip(' \n')
+
+
+class ChannelDigest:
+    """Агрегация уведомлений по каналам в пределах процесса"""
+
+    def __init__(self, window: float, threshold: int, delivery: DeliveryScheduler):
+        self.window = window
+        self.threshold = threshold
+        self.delivery = delivery
+        self._arrivals: dict[str, deque[float]] = {}
+        self._buffers: dict[str, list[tuple[PipelineSummary, str]]] = {}
+        self._apis: dict[str, MattermostAPI] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Кол-во событий, накопленных для сводок"""
+        return sum(len(events) for events in self._buffers.values())
+
+    def _count_arrivals(self, channel_id: str, now: float) -> int:
+        arrivals = self._arrivals.setdefault(channel_id, deque())
+        while arrivals and arrivals[0] <= now - self.window:
+            arrivals.popleft()
+        return len(arrivals)
+
+    def submit(self, api: MattermostAPI, channel_id: str, summary: PipelineSummary, message: str) -> None:
+        """
+        Отправка события в канал: сразу в полосу доставки или позже в составе сводки
+        :param api: клиент Mattermost от имени бота
+        :param channel_id: ID канала Mattermost
+        :param summary: поля pipeline для сводки
+        :param message: готовое одиночное сообщение
+        """
+        if not self.threshold:
+            self.delivery.submit(api, channel_id, message)
+            return
+        now = time.monotonic()
+        self._count_arrivals(channel_id, now)
+        self._arrivals[channel_id].append(now)
+        self._apis[channel_id] = api
+        if channel_id in self._buffers:
+            self._buffers[channel_id].append((summary, message))
+            return
+        if len(self._arrivals[channel_id]) <= self.threshold:
+            self.delivery.submit(api, channel_id, message)
+            return
+        self._buffers[channel_id] = [(summary, message)]
+        task = asyncio.create_task(self._flush_loop(channel_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_loop(self, channel_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            events = self._buffers[channel_id]
+            storm_over = self._count_arrivals(channel_id, time.monotonic()) <= self.threshold
+            if storm_over:
+                del self._buffers[channel_id]
+            else:
+                self._buffers[channel_id] = []
+            try:
+                self._send(channel_id, events)
+            except Exception:
+                logging.exception('Не удалось собрать сводку для канала %s', channel_id)
+            if storm_over:
+                return
+
+    def _send(self, channel_id: str, events: list[tuple[PipelineSummary, str]]) -> None:
+        if not events:
+            return
+        api = self._apis[channel_id]
+        if len(events) == 1:
+            self.delivery.submit(api, channel_id, events[0][1])
+            return
+        self.delivery.submit(api, channel_id, render_digest([summary for summary, _ in events], self.window))
+
+
+channel_digest = ChannelDigest(
+    window=settings.digest_window, threshold=settings.digest_threshold, delivery=delivery_scheduler
+)
@@ -0,0 +1,75 @@
+"""
+Личные сообщения автору события GitLab.
+
+Автор ищется по связке аккаунтов (gitlab_user.iid -> mattermost_user), канал личных сообщений создается
+через Mattermost один раз. Оба ответа кэшируются, в том числе отсутствие связки, поэтому при прогретом кэше
+сообщение стоит одного запроса к Mattermost - самой отправки.
+"""
+import logging
+from collections.abc import Callable
+
+import httpx
+
+from src.cache import MISSING
+from src.config import settings
+from src.database import AsyncSession
+
+from . import crud
+from .api import MattermostAPI
+from .delivery import delivery_scheduler
+
+
+async def get_author_user_id(gitlab_user_id: int) -> str | None:
+    """ID пользователя Mattermost автора или None, если аккаунт GitLab не привязан"""
+    user_id = await crud.author_cache.get(str(gitlab_user_id))
+    if user_id is not MISSING:
+        return user_id
+    async with AsyncSession() as session:
+        user_id = await crud.get_user_id_by_gitlab_iid(session, gitlab_user_id)
+    ttl = settings.author_cache_ttl if user_id else settings.author_negative_ttl
+    await crud.author_cache.set(str(gitlab_user_id), user_id, ttl)
+    return user_id
+
+
+async def get_direct_channel(api: MattermostAPI, bot_user_id: str, user_id: str) -> str | None:
+    """ID канала личных сообщений бота и пользователя. Ошибки Mattermost не кэшируются"""
+    key = f'{bot_user_id}:{user_id}'
+    channel_id = await crud.direct_channel_cache.get(key)
+    if channel_id is not MISSING:
+        return channel_id
+    try:
+        channel_id = await api.create_direct_channel(bot_user_id, user_id)
+    except httpx.HTTPError:
+        logging.exception('Не удалось получить канал личных сообщений с %s', user_id)
+        return None
+    if channel_id:
+        await crud.direct_channel_cache.set(key, channel_id)
+    return channel_id
+
+
+async def notify_author(
+        api: MattermostAPI, bot_user_id: str, gitlab_user_id: int | None, render: Callable[[], str]
+) -> bool:
+    """
+    Постановка личного сообщения автору в очередь доставки
+    :param render: отрисовка сообщения, вызывается только для найденного автора
+    :return: True, если автор найден и сообщение поставлено в очередь
+    """
+    if gitlab_user_id is None:
+        return False
+    user_id = await get_author_user_id(gitlab_user_id)
+    if not user_id:
+        return False
+    return await notify_user(api, bot_user_id, user_id, render())
+
+
+async def notify_user(api: MattermostAPI, bot_user_id: str, user_id: str, message: str) -> bool:
+    """
+    Постановка личного сообщения пользователю Mattermost в очередь доставки
+    :return: True, если канал личных сообщений получен
+    """
+    channel_id = await get_direct_channel(api, bot_user_id, user_id)
+    if not channel_id:
+        return False
+    delivery_scheduler.submit(api, channel_id, message)
+    return True
@@ -1,6 +1,7 @@
+from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey
+from sqlalchemy import ARRAY, DateTime, ForeignKey, Index, String, false, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.database import Model
@@ -17,7 +18,7 @@ class User(Model):
     username: Mapped[str | None] = mapped_column(nullable=True)
     email: Mapped[str | None] = mapped_column(nullable=True)
 
-    gitlab_user_id: Mapped[int | None] = mapped_column(ForeignKey('gitlab_user.id'))
+    gitlab_user_id: Mapped[int | None] = mapped_column(ForeignKey('gitlab_user.id'), index=True)
     gitlab_user: Mapped['GitlabUser'] = relationship(back_populates='mattermost_user')
 
 
@@ -25,7 +26,7 @@ class Channel(Model):
     __tablename__ = 'mattermost_channel'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    iid: Mapped[str]
+    iid: Mapped[str] = mapped_column(unique=True, index=True)
     name: Mapped[str]
     display_name: Mapped[str | None] = mapped_column(nullable=True)
 
@@ -42,7 +43,10 @@ class GitlabProjectChannel(Model):
     __tablename__ = 'gitlab_project_mattermost_channel'
 
     gitlab_project_id: Mapped[int] = mapped_column(ForeignKey('gitlab_project.id'), primary_key=True)
-    mattermost_channel_id: Mapped[int] = mapped_column(ForeignKey('mattermost_channel.id'), primary_key=True)
+    # Первичный ключ начинается с gitlab_project_id, для выборок по каналу нужен отдельный индекс
+    mattermost_channel_id: Mapped[int] = mapped_column(
+        ForeignKey('mattermost_channel.id'), primary_key=True, index=True
+    )
 
     gitlab_project: Mapped['Project'] = relationship(
         back_populates='mattermost_channel_associations', overlaps='gitlab_projects'
@@ -56,5 +60,36 @@ class Bot(Model):
     __tablename__ = 'mattermost_bot'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    iid: Mapped[str]
+    iid: Mapped[str] = mapped_column(index=True)
     access_token: Mapped[str]
+
+
+class Reminder(Model):
+    __tablename__ = 'mattermost_reminder'
+    __table_args__ = (
+        # Восстановление индекса в Redis читает только неотправленные напоминания
+        Index('ix_mattermost_reminder_pending', 'id', postgresql_where=text('sent_at IS NULL')),
+        # Периодическая починка индекса читает только напоминания, не попавшие в Redis
+        Index('ix_mattermost_reminder_unindexed', 'id', postgresql_where=text('unindexed')),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey('mattermost_user.id'))
+    channel_id: Mapped[str]
+    post_id: Mapped[str]
+    message: Mapped[str | None] = mapped_column(nullable=True)
+    due_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # ZADD в индекс Redis при создании не удался: напоминание добавит reminders.repair_index
+    unindexed: Mapped[bool] = mapped_column(server_default=false())
+
+
+class ChannelSubscription(Model):
+    """Фильтр уведомлений канала. Канал без подписки получает pipeline по умолчанию"""
+    __tablename__ = 'mattermost_channel_subscription'
+
+    channel_id: Mapped[int] = mapped_column(ForeignKey('mattermost_channel.id', ondelete='CASCADE'), primary_key=True)
+    kinds: Mapped[list[str]] = mapped_column(ARRAY(String))
+    branches: Mapped[list[str]] = mapped_column(ARRAY(String), server_default='{}')
+    statuses: Mapped[list[str]] = mapped_column(ARRAY(String), server_default='{}')
@@ -0,0 +1,210 @@
+"""
+Напоминания о сообщениях ("Напомнить мне" в меню сообщения).
+
+Напоминания хранятся в Postgres, а в Redis лежит индекс по времени срабатывания (sorted set id -> timestamp).
+Воркер забирает пачку наступивших напоминаний Lua-скриптом, переносит их в множество "в обработке" с арендой
+и после доставки удаляет. Если воркер упал посреди доставки, по истечении аренды напоминания возвращаются в очередь.
+При старте воркера индекс сверяется с базой целиком. Дальше полная сверка повторяется, только если Redis потерял
+данные (пропал ключ INDEXED_KEY), а напоминания, не принятые Redis при создании, помечаются в базе и добавляются
+в индекс по этой пометке.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from redis.exceptions import RedisError
+
+from src.config import settings
+from src.config.redis import redis_client
+from src.database import AsyncSession, use_primary
+
+from . import crud, models
+from .api import MattermostAPI
+from .schemas import Post, ReminderPeriod, User
+
+REMINDERS_KEY = 'matterlab:reminders'
+PROCESSING_KEY = 'matterlab:reminders:processing'
+# Есть, пока индекс полон: ставится после полной сверки, пропадает вместе с данными Redis
+INDEXED_KEY = 'matterlab:reminders:indexed'
+LEASE_SECONDS = 300
+RETRY_DELAY_SECONDS = 60
+RECONCILE_BATCH_SIZE = 5000
+
+DATETIME_FORMAT = '%d.%m.%Y %H:%M'
+
+INTERVALS = {
+    ReminderPeriod.min_15: timedelta(minutes=15),
+    ReminderPeriod.min_30: timedelta(minutes=30),
+    ReminderPeriod.hour_1: timedelta(hours=1),
+    ReminderPeriod.hour_2: timedelta(hours=2),
+    ReminderPeriod.hour_4: timedelta(hours=4),
+}
+
+# KEYS[1] - очередь, KEYS[2] - в обработке; ARGV[1] - сейчас, ARGV[2] - размер пачки, ARGV[3] - конец аренды
+CLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(expired) do
+    redis.call('ZADD', KEYS[1], ARGV[1], id)
+end
+if #expired > 0 then
+    redis.call('ZREM', KEYS[2], unpack(expired))
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(due) do
+    redis.call('ZADD', KEYS[2], ARGV[3], id)
+end
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+return due
+"""
+
+# KEYS[1] - очередь, KEYS[2] - в обработке; ARGV - пары id, время срабатывания.
+# Взятые в обработку напоминания не возвращаются в очередь, иначе их доставят дважды
+RECONCILE_SCRIPT = """
+local added = 0
+for i = 1, #ARGV, 2 do
+    if not redis.call('ZSCORE', KEYS[2], ARGV[i]) then
+        added = added + redis.call('ZADD', KEYS[1], 'NX', ARGV[i + 1], ARGV[i])
+    end
+end
+return added
+"""
+
+claim_due = redis_client.register_script(CLAIM_SCRIPT)
+add_missing = redis_client.register_script(RECONCILE_SCRIPT)
+
+
+def compute_due_at(values: dict, user: User) -> datetime:
+    """
+    Время срабатывания напоминания по значениям формы
+    :param values: значения формы (interval и, для конкретной даты, datetime)
+    :param user: пользователь, в чьем часовом поясе указана дата
+    :return: время в UTC
+    """
+    now = datetime.now(timezone.utc)
+    interval = (values.get('interval') or {}).get('value')
+    if interval != ReminderPeriod.spec_datetime:
+        if interval not in INTERVALS:
+            raise ValueError('Не выбрано, когда напомнить')
+        return now + INTERVALS[ReminderPeriod(interval)]
+    try:
+        local = datetime.strptime((values.get('datetime') or '').strip(), DATETIME_FORMAT)
+    except ValueError:
+        raise ValueError('Неверный формат даты и времени. Пример: "01.01.1970 09:00"') from None
+    due_at = local.replace(tzinfo=user.tzinfo).astimezone(timezone.utc)
+    if due_at <= now:
+        raise ValueError('Указанное время уже прошло')
+    return due_at
+
+
+async def schedule_reminder(session: AsyncSession, user: models.User, post: Post, due_at: datetime) -> models.Reminder:
+    reminder = await crud.create_reminder(session, user, post, due_at)
+    try:
+        await redis_client.zadd(REMINDERS_KEY, {reminder.id: due_at.timestamp()})
+    except (RedisError, OSError):
+        # Напоминание уже в базе, в индекс его добавит repair_index
+        logging.exception('Напоминание %s не добавлено в индекс Redis', reminder.id)
+        await crud.mark_reminder_unindexed(session, reminder.id)
+    return reminder
+
+
+def render_reminder(reminder: models.Reminder) -> str:
+    text = f'Напоминание о сообщении: {settings.mattermost_host}_redirect/pl/{reminder.post_id}'
+    if reminder.message:
+        text += '\n' + '\n'.join(f'> {line}' for line in reminder.message.splitlines()[:10])
+    return text
+
+
+async def send_reminder(
+        api: MattermostAPI, bot_user_id: str, reminder: models.Reminder, semaphore: asyncio.Semaphore
+) -> bool:
+    async with semaphore:
+        try:
+            channel_id = await api.create_direct_channel(bot_user_id, reminder.user_id)
+            if not channel_id:
+                return False
+            return await api.create_post(channel_id, render_reminder(reminder))
+        except httpx.HTTPError:
+            logging.exception('Не удалось отправить напоминание %s', reminder.id)
+            return False
+
+
+async def deliver_due_reminders() -> int:
+    """
+    Доставка всех наступивших напоминаний пачками по settings.reminder_batch_size
+    :return: кол-во доставленных напоминаний
+    """
+    delivered = 0
+    semaphore = asyncio.Semaphore(settings.reminder_concurrency)
+    while True:
+        now = time.time()
+        ids = await claim_due(
+            keys=[REMINDERS_KEY, PROCESSING_KEY], args=[now, settings.reminder_batch_size, now + LEASE_SECONDS]
+        )
+        ids = [int(item) for item in ids]
+        if not ids:
+            return delivered
+        async with AsyncSession() as session:
+            # Реплика может еще не видеть только что созданное или уже отправленное напоминание
+            use_primary(session)
+            reminders = await crud.get_pending_reminders(session, ids)
+            bot = await crud.get_last_bot(session)
+        api = MattermostAPI(bot.access_token)
+        results = await asyncio.gather(*(send_reminder(api, bot.iid, item, semaphore) for item in reminders))
+        sent = [item.id for item, ok in zip(reminders, results, strict=True) if ok]
+        failed = [item.id for item, ok in zip(reminders, results, strict=True) if not ok]
+        async with AsyncSession() as session:
+            await crud.mark_reminders_sent(session, sent)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(PROCESSING_KEY, *ids)
+            if failed:
+                pipe.zadd(REMINDERS_KEY, {item: now + RETRY_DELAY_SECONDS for item in failed})
+            await pipe.execute()
+        delivered += len(sent)
+        if len(ids) < settings.reminder_batch_size:
+            return delivered
+
+
+async def reconcile_index() -> int:
+    """
+    Полная сверка индекса в Redis с Postgres: неотправленные напоминания, которых нет ни в очереди, ни в обработке,
+    добавляются в очередь. Читает все неотправленные напоминания, поэтому выполняется при старте воркера и после
+    потери данных Redis
+    :return: кол-во добавленных напоминаний
+    """
+    added = last_id = 0
+    async with AsyncSession() as session:
+        use_primary(session)
+        # Ключ ставится до чтения: напоминания, созданные во время сверки, попадут в индекс сами или через пометку
+        await redis_client.set(INDEXED_KEY, 1)
+        while batch := await crud.get_pending_reminder_batch(session, last_id, RECONCILE_BATCH_SIZE):
+            args = [value for item_id, due_at in batch for value in (item_id, due_at.timestamp())]
+            added += await add_missing(keys=[REMINDERS_KEY, PROCESSING_KEY], args=args)
+            last_id = batch[-1][0]
+    if added:
+        logging.info('Добавлено в индекс Redis напоминаний: %s', added)
+    return added
+
+
+async def repair_index() -> int:
+    """
+    Починка индекса: напоминания, не принятые Redis при создании, добавляются по пометке в базе (частичный индекс,
+    без обхода остальных). Если Redis потерял данные, выполняется полная сверка
+    :return: кол-во добавленных напоминаний
+    """
+    if not await redis_client.exists(INDEXED_KEY):
+        return await reconcile_index()
+    added = 0
+    async with AsyncSession() as session:
+        use_primary(session)
+        while batch := await crud.get_unindexed_reminders(session, RECONCILE_BATCH_SIZE):
+            args = [value for item_id, due_at in batch if due_at for value in (item_id, due_at.timestamp())]
+            if args:
+                added += await add_missing(keys=[REMINDERS_KEY, PROCESSING_KEY], args=args)
+            await crud.clear_unindexed(session, [item_id for item_id, _ in batch])
+    if added:
+        logging.info('Добавлено в индекс Redis напоминаний: %s', added)
+    return added
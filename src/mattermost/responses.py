@@ -0,0 +1,103 @@
+import hashlib
+import json
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from src.config import settings
+
+from .schemas import Form, FormResponse, Manifest
+
+APP_VERSION = Manifest.model_fields['version'].default
+
+
+def settings_fingerprint() -> str:
+    """Отпечаток настроек и версии приложения. Настройки читаются один раз при запуске, поэтому и отпечаток тоже"""
+    return hashlib.sha1(f'{APP_VERSION}:{settings.model_dump_json()}'.encode()).hexdigest()  # noqa: S324
+
+
+# ETag меняется вместе с версией и настройками, даже если тело ответа совпало
+SETTINGS_FINGERPRINT = settings_fingerprint()
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class PrecomputedResponse:
+    """
+    Ответ, который собирается и сериализуется один раз на каждый request.base_url.
+    Отдается с ETag, на совпадающий If-None-Match отвечает 304 без тела
+    """
+
+    # base_url берется из заголовка Host, поэтому кол-во вариантов ограничено
+    max_entries = 32
+
+    def __init__(self, builder: Callable[[str], BaseModel]):
+        self._builder = builder
+        self._entries: dict[str, CachedBody] = {}
+
+    def get(self, base_url: str) -> CachedBody:
+        entry = self._entries.get(base_url)
+        if entry is None:
+            body = self._builder(base_url).model_dump_json(exclude_none=True, by_alias=True).encode()
+            digest = hashlib.sha256(SETTINGS_FINGERPRINT.encode() + body).hexdigest()
+            entry = CachedBody(body=body, etag=f'"{digest[:32]}"')
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[base_url] = entry
+        return entry
+
+    def response(self, request: Request) -> Response:
+        entry = self.get(str(request.base_url))
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': f'public, max-age={settings.mattermost_cache_max_age}, must-revalidate'
+        }
+        if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type='application/json', headers=headers)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip().removeprefix('W/')
+        if candidate in ('*', etag):
+            return True
+    return False
+
+
+class FormTemplate:
+    """
+    Скелет формы, сериализованный один раз при импорте.
+    На каждый запрос копируются только поля, в которые подставляются значения
+    """
+
+    def __init__(self, form: Form):
+        self._form = FormResponse(form=form).model_dump(mode='json', exclude_none=True, by_alias=True)['form']
+        self._field_index = {field['name']: index for index, field in enumerate(self._form['fields'])}
+        self._body = self._dumps(self._form)
+
+    @staticmethod
+    def _dumps(form: dict) -> bytes:
+        return json.dumps({'type': 'form', 'form': form}, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def render(self, values: dict[str, Any] | None = None) -> Response:
+        """
+        Ответ с формой
+        :param values: значения полей по имени; значения должны быть уже приведены к JSON (Select -> dict)
+        :return: готовый ответ, повторной сериализации FastAPI не требуется
+        """
+        values = {key: value for key, value in (values or {}).items() if value is not None}
+        if not values:
+            return Response(content=self._body, media_type='application/json')
+        fields = list(self._form['fields'])
+        for name, value in values.items():
+            index = self._field_index[name]
+            fields[index] = {**fields[index], 'value': value}
+        return Response(content=self._dumps({**self._form, 'fields': fields}), media_type='application/json')
@@ -1,18 +1,27 @@
+from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, Body, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, Request, Response
+from pydantic import ValidationError
 
+from src.config import settings
 from src.database import AsyncSession, get_db_session
 from src.gitlab import crud as gl_crud
 from src.gitlab.api import GitlabAPI
+from src.gitlab.events import DEFAULT_SUBSCRIPTION
 from src.gitlab.exceptions import GitlabException
+from src.gitlab.schemas import EventKind, Status, Subscription, TokenStatus
+from src.gitlab.services import connect_projects, get_channel_statuses
 
 from . import crud
 from .models import User
+from .reminders import compute_due_at, schedule_reminder
+from .responses import FormTemplate, PrecomputedResponse
 from .schemas import (
     Binding,
     BindingResponse,
     Call,
+    CallResponseType,
     CommandRequest,
     DynamicFieldChoice,
     Expand,
@@ -20,23 +29,40 @@ from .schemas import (
     Form,
     FormField,
     FormFieldType,
+    FormResponse,
     Location,
+    LookupData,
+    LookupResponse,
     Manifest,
     ReminderPeriod,
     Select,
     TextFieldSubtype,
+    TextResponse,
     TopLevelBinding,
 )
-from .services import update_bot_access_token
+from .services import (
+    avatar_proxy_url,
+    render_connect_summary,
+    render_stats,
+    render_status,
+    update_bot_access_token,
+)
 
 router = APIRouter(prefix='/mattermost', tags=['Mattermost'])
 
 
-@router.get('/manifest', response_model=Manifest, response_model_exclude_none=True, response_model_by_alias=True)
-async def manifest():
+def build_manifest(base_url: str) -> Manifest:
     return Manifest(icon='creonit.png')
 
 
+manifest_response = PrecomputedResponse(build_manifest)
+
+
+@router.get('/manifest', response_model=Manifest, response_model_exclude_none=True, response_model_by_alias=True)
+async def manifest(request: Request):
+    return manifest_response.response(request)
+
+
 @router.post('/ping')
 async def ping():
     return {'type': 'ok'}
@@ -97,10 +123,7 @@ def generate_reminder_form():
     )
 
 
-@router.post(
-    '/bindings', response_model=BindingResponse, response_model_exclude_none=True, response_model_by_alias=True
-)
-async def bindings(request: Request):
+def build_bindings(base_url: str) -> BindingResponse:
     return BindingResponse(
         data=[
             TopLevelBinding(
@@ -108,7 +131,7 @@ async def bindings(request: Request):
                 bindings=[
                     Binding(
                         label='matterlab',
-                        icon=f'{str(request.base_url)}static/creonit.png',
+                        icon=f'{base_url}static/creonit.png',
                         description='Управление связкой с gitlab',
                         hint='[command]',
                         bindings=[
@@ -132,6 +155,50 @@ async def bindings(request: Request):
                                         channel=ExpandLevel.id
                                     )
                                 )
+                            ),
+                            Binding(
+                                label='subscribe',
+                                description='Настроить, какие события приходят в канал',
+                                submit=Call(
+                                    path='/subscription',
+                                    expand=Expand(
+                                        channel=ExpandLevel.summary
+                                    )
+                                )
+                            ),
+                            Binding(
+                                label='status',
+                                description='Последние pipeline веток проектов канала',
+                                submit=Call(
+                                    path='/pipeline_status',
+                                    expand=Expand(
+                                        channel=ExpandLevel.summary
+                                    )
+                                )
+                            ),
+                            Binding(
+                                label='stats',
+                                description='Статистика pipeline проектов канала',
+                                hint='[дней]',
+                                form=Form(
+                                    title='Статистика pipeline',
+                                    submit=Call(
+                                        path='/pipeline_stats',
+                                        expand=Expand(
+                                            channel=ExpandLevel.summary
+                                        )
+                                    ),
+                                    fields=[
+                                        FormField(
+                                            name='days',
+                                            type=FormFieldType.text,
+                                            subtype=TextFieldSubtype.number,
+                                            label='days',
+                                            description=f'За сколько дней, по умолчанию {settings.pipeline_stats_days}',
+                                            position=1
+                                        )
+                                    ]
+                                )
                             )
                         ]
                     ),
@@ -143,7 +210,7 @@ async def bindings(request: Request):
                     Binding(
                         location='send-button',
                         label='Напомнить мне',
-                        icon=f'{str(request.base_url)}static/reminder.svg',
+                        icon=f'{base_url}static/reminder.svg',
                         form=generate_reminder_form()
                     )
                 ]
@@ -152,69 +219,96 @@ async def bindings(request: Request):
     )
 
 
-def generate_connect_gitlab_form(user: User) -> dict:
-    access_token_default = None
-    if user.gitlab_user:
-        access_token_default = user.gitlab_user.access_token
-    return {
-        'type': 'form',
-        'form': Form(
-            title='Прикрепление репозитория к каналу',
-            submit=Call(
-                path='/connect_gitlab_complete',
-                expand=Expand(
-                    acting_user=ExpandLevel.id,
-                    channel=ExpandLevel.summary
-                )
+bindings_response = PrecomputedResponse(build_bindings)
+
+
+@router.post(
+    '/bindings', response_model=BindingResponse, response_model_exclude_none=True, response_model_by_alias=True
+)
+async def bindings(request: Request):
+    return bindings_response.response(request)
+
+
+connect_gitlab_form = FormTemplate(
+    Form(
+        title='Прикрепление репозиториев к каналу',
+        submit=Call(
+            path='/connect_gitlab_complete',
+            expand=Expand(
+                acting_user=ExpandLevel.id,
+                channel=ExpandLevel.summary
+            )
+        ),
+        fields=[
+            FormField(
+                name='access_token',
+                type=FormFieldType.text,
+                is_required=True,
+                label='personal_access_token',
+                description='Персональный токен Gitlab',
+                refresh=True,
+                subtype=TextFieldSubtype.input,
+                position=1
             ),
-            fields=[
-                FormField(
-                    name='access_token',
-                    type=FormFieldType.text,
-                    is_required=True,
-                    label='personal_access_token',
-                    description='Персональный токен Gitlab',
-                    refresh=True,
-                    value=access_token_default,
-                    subtype=TextFieldSubtype.input,
-                    position=1
-                ),
-                FormField(
-                    name='repo',
-                    type=FormFieldType.dynamic_select,
-                    is_required=True,
-                    description='Выбор репозитория. Для поиска введите не менее 3 символов',
-                    label='Репозиторий',
-                    position=2,
-                    lookup=Call(
-                        path='/get_repos',
-                        expand=Expand(
-                            acting_user=ExpandLevel.summary
-                        )
+            FormField(
+                name='repo',
+                type=FormFieldType.dynamic_select,
+                description='Выбор репозиториев. Для поиска введите не менее 3 символов',
+                label='Репозиторий',
+                position=2,
+                multiselect=True,
+                lookup=Call(
+                    path='/get_repos',
+                    expand=Expand(
+                        acting_user=ExpandLevel.summary
                     )
                 )
-            ],
-            source=Call(
-                path='/connect_gitlab_refresh',
-                expand=Expand(
-                    acting_user=ExpandLevel.summary
-                )
             ),
-            header='Для прикрепления репозитория к каналу нужно один раз создать и указать персональный токен доступа '
-                   'к профилю GitLab. Создать его можно так:\n'
-                   '1. Быть авторизованным на gitlab.com и перейти по ссылке '
-                   'https://gitlab.com/-/profile/personal_access_tokens\n'
-                   '2. Жмакаем "Add new token"\n'
-                   '3. Поле "Token name" заполняем как угодно\n'
-                   '4. Поле "Expiration date" заполняем любой датой в будущем (не больше, чем на 1 год)\n'
-                   '5. Среди чекбоксов выбираем "api" и "read_user"\n'
-                   '6. Жмем на кнопку "Create personal access token"\n'
-                   '7. Копируем токен и вставляем в поле формы\n'
-        )
-    }
+            FormField(
+                name='group',
+                type=FormFieldType.text,
+                description='Путь группы GitLab (например, my-group/backend): прикрепить все ее репозитории',
+                label='group',
+                subtype=TextFieldSubtype.input,
+                position=3
+            )
+        ],
+        source=Call(
+            path='/connect_gitlab_refresh',
+            expand=Expand(
+                acting_user=ExpandLevel.summary
+            )
+        ),
+        header='Для прикрепления репозитория к каналу нужно один раз создать и указать персональный токен доступа '
+               'к профилю GitLab. Создать его можно так:\n'
+               '1. Быть авторизованным на gitlab.com и перейти по ссылке '
+               'https://gitlab.com/-/profile/personal_access_tokens\n'
+               '2. Жмакаем "Add new token"\n'
+               '3. Поле "Token name" заполняем как угодно\n'
+               '4. Поле "Expiration date" заполняем любой датой в будущем (не больше, чем на 1 год)\n'
+               '5. Среди чекбоксов выбираем "api" и "read_user"\n'
+               '6. Жмем на кнопку "Create personal access token"\n'
+               '7. Копируем токен и вставляем в поле формы\n'
+    )
+)
 
 
-@router.post('/connect_gitlab', response_model_exclude_none=True, response_model_by_alias=True)
+INVALID_TOKEN_TEXT = 'Персональный токен недействителен, укажите новый через `/matterlab connect`'
+
+
+def has_invalid_token(user: User) -> bool:
+    """Фоновая проверка пометила токен недействительным: запрос в GitLab не нужен"""
+    return bool(user.gitlab_user) and user.gitlab_user.token_status == TokenStatus.invalid
+
+
+def generate_connect_gitlab_form(user: User) -> Response:
+    access_token_default = None
+    if user.gitlab_user:
+        access_token_default = user.gitlab_user.access_token
+    return connect_gitlab_form.render({'access_token': access_token_default})
+
+
+@router.post('/connect_gitlab', response_model=FormResponse)
 async def connect_gitlab(
         data: Annotated[CommandRequest, Body()],
         bg_tasks: BackgroundTasks,
@@ -225,7 +319,7 @@ async def connect_gitlab(
     return generate_connect_gitlab_form(user)
 
 
-@router.post('/connect_gitlab_refresh', response_model_exclude_none=True, response_model_by_alias=True)
+@router.post('/connect_gitlab_refresh', response_model=FormResponse)
 async def connect_gitlab_refresh(
         data: Annotated[CommandRequest, Body()],
         bg_tasks: BackgroundTasks,
@@ -239,7 +333,7 @@ async def connect_gitlab_refresh(
     return generate_connect_gitlab_form(mm_user)
 
 
-@router.post('/connect_gitlab_complete')
+@router.post('/connect_gitlab_complete', response_model=TextResponse, response_model_exclude_none=True)
 async def connect_gitlab_complete(
         data: Annotated[CommandRequest, Body()],
         request: Request,
@@ -249,62 +343,67 @@ async def connect_gitlab_complete(
     from src.main import app
 
     bg_tasks.add_task(update_bot_access_token, data.context)
+    repos = data.values.get('repo') or []
+    if isinstance(repos, dict):
+        repos = [repos]
+    project_ids = [int(item['value']) for item in repos]
+    group_path = (data.values.get('group') or '').strip() or None
+    if not project_ids and not group_path:
+        return TextResponse(type=CallResponseType.error, text='Выберите репозитории или укажите группу')
     mm_user = await crud.get_or_create_user(db_session, data.context.acting_user)
+    if has_invalid_token(mm_user):
+        return TextResponse(type=CallResponseType.error, text=INVALID_TOKEN_TEXT)
     instance = GitlabAPI(mm_user.gitlab_user.access_token)
     gl_user_schema = await instance.get_current_user()
     gl_user = await gl_crud.get_or_create_gl_user_by_mm_user(db_session, mm_user, data.values)
     await gl_crud.update_gl_user_from_schema(db_session, gl_user, gl_user_schema)
-    project_schema = await instance.get_project_detail(data.values['repo']['value'])
-    project = await gl_crud.get_or_create_project(db_session, project_schema)
     channel = await crud.get_or_create_channel(db_session, data.context.channel)
-    await crud.add_gl_project_to_channel(db_session, channel, [project])
     base_url = str(request.base_url).strip('/')
     base_url = base_url.replace('http', request.headers.get('X-Forwarded-Proto', 'http'))
     webhook_url = base_url + app.url_path_for('gitlab_webhook')
-    hooks = await instance.get_webhooks(project.id)
-    urls = [str(item.url) for item in hooks]
-    if webhook_url not in urls:
-        await instance.create_webhook(project.id, webhook_url)
-    return {'type': 'ok', 'text': f'Этот канал теперь будет получать хуки с проекта {project.path_with_namespace}'}
+    result = await connect_projects(instance, gl_user.id, channel, webhook_url, project_ids, group_path)
+    return TextResponse(text=render_connect_summary(result))
 
 
-@router.post('/disconnect_gitlab', response_model_by_alias=True, response_model_exclude_none=True)
+disconnect_gitlab_form = FormTemplate(
+    Form(
+        title='Открепить репозиторий от канала',
+        submit=Call(
+            path='/disconnect_gitlab_complete',
+            expand=Expand(
+                channel=ExpandLevel.summary
+            )
+        ),
+        fields=[
+            FormField(
+                name='repo',
+                type=FormFieldType.dynamic_select,
+                is_required=True,
+                description='Выбор репозитория',
+                label='Репозиторий',
+                position=1,
+                lookup=Call(
+                    path='/get_channel_repos',
+                    expand=Expand(
+                        channel=ExpandLevel.summary
+                    )
+                )
+            )
+        ]
+    )
+)
+
+
+@router.post('/disconnect_gitlab', response_model=FormResponse)
 async def disconnect_gitlab(
         data: Annotated[CommandRequest, Body()],
         bg_tasks: BackgroundTasks
 ):
     bg_tasks.add_task(update_bot_access_token, data.context)
-    return {
-        'type': 'form',
-        'form': Form(
-            title='Открепить репозиторий от канала',
-            submit=Call(
-                path='/disconnect_gitlab_complete',
-                expand=Expand(
-                    channel=ExpandLevel.summary
-                )
-            ),
-            fields=[
-                FormField(
-                    name='repo',
-                    type=FormFieldType.dynamic_select,
-                    is_required=True,
-                    description='Выбор репозитория',
-                    label='Репозиторий',
-                    position=1,
-                    lookup=Call(
-                        path='/get_channel_repos',
-                        expand=Expand(
-                            channel=ExpandLevel.summary
-                        )
-                    )
-                )
-            ]
-        )
-    }
+    return disconnect_gitlab_form.render()
 
 
-@router.post('/disconnect_gitlab_complete')
+@router.post('/disconnect_gitlab_complete', response_model=TextResponse, response_model_exclude_none=True)
 async def disconnect_gitlab_complete(
         data: Annotated[CommandRequest, Body()],
         bg_tasks: BackgroundTasks,
@@ -314,76 +413,207 @@ async def disconnect_gitlab_complete(
     channel = await crud.get_or_create_channel(db_session, data.context.channel)
     project = await gl_crud.get_project_by_id(db_session, int(data.values['repo']['value']))
     await crud.delete_gl_project_from_channel(db_session, channel, project)
-    return {'type': 'ok', 'text': f'Этот канал больше не будет получать хуки с проекта {data.values["repo"]["label"]}'}
+    return TextResponse(text=f'Этот канал больше не будет получать хуки с проекта {data.values["repo"]["label"]}')
 
 
-@router.post('/get_repos', response_model_exclude_none=True, response_model_by_alias=True)
+@router.post('/get_repos', response_model=LookupResponse | TextResponse, response_model_exclude_none=True)
 async def get_repos(
         data: Annotated[CommandRequest, Body()],
         db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
 ):
     mm_user = await crud.get_or_create_user(db_session, data.context.acting_user)
     if not mm_user.gitlab_user or not mm_user.gitlab_user.access_token:
-        return {'type': 'error', 'text': 'Нужно сначала указать персональный токен'}
+        return TextResponse(type=CallResponseType.error, text='Нужно сначала указать персональный токен')
+    if has_invalid_token(mm_user):
+        return TextResponse(type=CallResponseType.error, text=INVALID_TOKEN_TEXT)
     instance = GitlabAPI(mm_user.gitlab_user.access_token)
     try:
         projects = await instance.get_projects(data.query)
     except GitlabException:
-        return {'type': 'error', 'text': 'Неверный персональный токен'}
+        return TextResponse(type=CallResponseType.error, text='Неверный персональный токен')
     choices = [
         DynamicFieldChoice(
-            label=project.path_with_namespace, value=str(project.id_), icon_data=str(project.avatar_url)
+            label=project.path_with_namespace, value=str(project.id_),
+            icon_data=avatar_proxy_url(project.avatar_url and str(project.avatar_url))
         ) for project in projects
     ]
-    return {'type': 'ok', 'data': {'items': choices}}
+    return LookupResponse(data=LookupData(items=choices))
 
 
-@router.post('/get_channel_repos', response_model_by_alias=True, response_model_exclude_none=True)
+@router.post('/get_channel_repos', response_model=LookupResponse, response_model_exclude_none=True)
 async def get_channel_repos(
         data: Annotated[CommandRequest, Body()],
         db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
 ):
-    channel = await crud.get_or_create_channel(db_session, data.context.channel)
+    repos = await gl_crud.get_channel_projects(
+        db_session, data.context.channel.iid, query=data.query, limit=settings.mattermost_lookup_limit
+    )
     choices = [
-        DynamicFieldChoice(
-            label=repo.path_with_namespace, value=str(repo.id), icon_data=str(repo.avatar_url)
-        ) for repo in channel.gitlab_projects
+        DynamicFieldChoice(label=path, value=str(repo_id), icon_data=avatar_proxy_url(avatar_url))
+        for repo_id, path, avatar_url in repos
     ]
-    return {'type': 'ok', 'data': {'items': choices}}
+    return LookupResponse(data=LookupData(items=choices))
+
+
+EVENT_KIND_LABELS = {
+    EventKind.pipeline: 'Pipeline',
+    EventKind.merge_request: 'Merge request',
+    EventKind.deployment: 'Деплой',
+}
+SUBSCRIPTION_STATUSES = (Status.success, Status.warning, Status.failed, Status.canceled, Status.running)
+
+subscription_form = FormTemplate(
+    Form(
+        title='Уведомления канала',
+        submit=Call(
+            path='/subscription_complete',
+            expand=Expand(
+                channel=ExpandLevel.summary
+            )
+        ),
+        fields=[
+            FormField(
+                name='kinds',
+                type=FormFieldType.static_select,
+                is_required=True,
+                label='События',
+                multiselect=True,
+                options=[Select(label=label, value=kind) for kind, label in EVENT_KIND_LABELS.items()]
+            ),
+            FormField(
+                name='branches',
+                type=FormFieldType.text,
+                label='Ветки',
+                description='Маски веток через запятую, например main, release/*. Пусто - все ветки. '
+                            'Для merge request проверяется целевая ветка',
+                subtype=TextFieldSubtype.input
+            ),
+            FormField(
+                name='statuses',
+                type=FormFieldType.static_select,
+                label='Статусы',
+                description='Статусы pipeline и деплоев. Пусто - все статусы',
+                multiselect=True,
+                options=[Select(label=status, value=status) for status in SUBSCRIPTION_STATUSES]
+            )
+        ]
+    )
+)
+
+
+@router.post('/subscription', response_model=FormResponse)
+async def subscription(
+        data: Annotated[CommandRequest, Body()],
+        bg_tasks: BackgroundTasks,
+        db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
+):
+    bg_tasks.add_task(update_bot_access_token, data.context)
+    current = await crud.get_channel_subscription(db_session, data.context.channel.iid) or DEFAULT_SUBSCRIPTION
+    return subscription_form.render({
+        'kinds': [{'label': EVENT_KIND_LABELS[kind], 'value': kind} for kind in current.kinds],
+        'branches': ', '.join(current.branches),
+        'statuses': [{'label': status, 'value': status} for status in current.statuses]
+    })
+
+
+@router.post('/subscription_complete', response_model=TextResponse, response_model_exclude_none=True)
+async def subscription_complete(
+        data: Annotated[CommandRequest, Body()],
+        bg_tasks: BackgroundTasks,
+        db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
+):
+    bg_tasks.add_task(update_bot_access_token, data.context)
+    values = data.values or {}
+    try:
+        new_subscription = Subscription(
+            kinds=[item['value'] for item in values.get('kinds') or []],
+            branches=[glob.strip() for glob in (values.get('branches') or '').split(',') if glob.strip()],
+            statuses=[item['value'] for item in values.get('statuses') or []]
+        )
+    except ValidationError:
+        return TextResponse(type=CallResponseType.error, text='Неверные параметры подписки')
+    if not new_subscription.kinds:
+        return TextResponse(type=CallResponseType.error, text='Нужно выбрать хотя бы один тип событий')
+    channel = await crud.get_or_create_channel(db_session, data.context.channel)
+    await crud.save_channel_subscription(db_session, channel, new_subscription)
+    kinds = ', '.join(EVENT_KIND_LABELS[kind] for kind in new_subscription.kinds)
+    branches = ', '.join(new_subscription.branches) or 'все'
+    statuses = ', '.join(new_subscription.statuses) or 'все'
+    return TextResponse(text=f'Канал получает: {kinds}. Ветки: {branches}. Статусы: {statuses}')
+
+
+@router.post('/pipeline_status', response_model=TextResponse, response_model_exclude_none=True)
+async def pipeline_status(data: Annotated[CommandRequest, Body()], bg_tasks: BackgroundTasks):
+    bg_tasks.add_task(update_bot_access_token, data.context)
+    statuses = await get_channel_statuses(data.context.channel.iid)
+    return TextResponse(text=render_status(statuses, settings.pipeline_status_limit))
 
 
-@router.post('/create_reminder')
+@router.post('/pipeline_stats', response_model=TextResponse, response_model_exclude_none=True)
+async def pipeline_stats(
+        data: Annotated[CommandRequest, Body()],
+        bg_tasks: BackgroundTasks,
+        db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
+):
+    bg_tasks.add_task(update_bot_access_token, data.context)
+    days = (data.values or {}).get('days') or settings.pipeline_stats_days
+    try:
+        days = int(days)
+    except ValueError:
+        days = 0
+    if not 1 <= days <= settings.pipeline_stats_max_days:
+        return TextResponse(
+            type=CallResponseType.error, text=f'Период - от 1 до {settings.pipeline_stats_max_days} дней'
+        )
+    # Дневные счетчики ведутся по UTC
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    rows = await gl_crud.get_channel_pipeline_stats(
+        db_session, data.context.channel.iid, since=since, limit=settings.pipeline_stats_limit
+    )
+    return TextResponse(text=render_stats(rows, days))
+
+
+@router.post('/create_reminder', response_model=TextResponse, response_model_exclude_none=True)
 async def create_reminder(
         data: Annotated[CommandRequest, Body()],
+        bg_tasks: BackgroundTasks,
         db_session: AsyncSession = Depends(get_db_session)  # noqa: B008
 ):
-    return {
-        'type': 'ok',
-        'text': 'Успех'
-    }
+    bg_tasks.add_task(update_bot_access_token, data.context)
+    acting_user = data.context.acting_user
+    try:
+        due_at = compute_due_at(data.values or {}, acting_user)
+    except ValueError as exc:
+        return TextResponse(type=CallResponseType.error, text=str(exc))
+    user = await crud.get_or_create_user(db_session, acting_user)
+    await schedule_reminder(db_session, user, data.context.post, due_at)
+    return TextResponse(text=f'Напомню {due_at.astimezone(acting_user.tzinfo):%d.%m.%Y в %H:%M}')
 
 
-@router.post('/create_reminder_refresh')
+def generate_reminder_datetime_form() -> Form:
+    form = generate_reminder_form()
+    form.fields.append(
+        FormField(
+            name='datetime',
+            type=FormFieldType.text,
+            is_required=True,
+            label='Введите_дату_и_время',
+            description='Формат: "01.01.1970 09:00" (учитывается ваш текущий часовой пояс)'
+        )
+    )
+    return form
+
+
+reminder_form = FormTemplate(generate_reminder_form())
+reminder_datetime_form = FormTemplate(generate_reminder_datetime_form())
+
+
+@router.post('/create_reminder_refresh', response_model=FormResponse)
 async def create_reminder_refresh(
         data: Annotated[CommandRequest, Body()]
 ):
-    form = generate_reminder_form()
-    if data.values and data.values.get('interval', {}):
-        form.fields[0].value = Select(
-            label=data.values['interval']['label'],
-            value=data.values['interval']['value']
-        )
-        if data.values['interval']['value'] == ReminderPeriod.spec_datetime:
-            form.fields.append(
-                FormField(
-                    name='datetime',
-                    type=FormFieldType.text,
-                    is_required=True,
-                    label='Введите_дату_и_время',
-                    description='Формат: "01.01.1970 09:00" (учитывается ваш текущий часовой пояс)'
-                )
-            )
-    return {
-        'type': 'form',
-        'form': form
-    }
+    interval = (data.values or {}).get('interval')
+    if not interval:
+        return reminder_form.render()
+    template = reminder_datetime_form if interval['value'] == ReminderPeriod.spec_datetime else reminder_form
+    return template.render({'interval': {'label': interval['label'], 'value': interval['value']}})
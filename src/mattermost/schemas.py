@@ -1,5 +1,6 @@
 from enum import StrEnum
 from typing import Any
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field, HttpUrl, model_validator
 
@@ -50,6 +51,14 @@ class FormFieldType(StrEnum):
     markdown = 'markdown'
 
 
+class CallResponseType(StrEnum):
+    """Тип ответа приложения на вызов"""
+    ok = 'ok'
+    error = 'error'
+    form = 'form'
+    navigate = 'navigate'
+
+
 class TextFieldSubtype(StrEnum):
     """Тип текстового поля"""
     input = 'input'  # A single-line text input field  # noqa: A003
@@ -303,6 +312,20 @@ class User(BaseModel):
     id_: str = Field(alias='id')
     username: str | None = Field(default=None)
     email: EmailStr | None = Field(default=None)
+    timezone: dict[str, str] | None = Field(default=None, exclude=True, title='Настройки часового пояса')
+
+    @property
+    def tzinfo(self) -> ZoneInfo:
+        """Часовой пояс пользователя, UTC если он не указан"""
+        timezone = self.timezone or {}
+        if timezone.get('useAutomaticTimezone', 'true') == 'true':
+            name = timezone.get('automaticTimezone')
+        else:
+            name = timezone.get('manualTimezone')
+        try:
+            return ZoneInfo(name or 'UTC')
+        except (ZoneInfoNotFoundError, ValueError):
+            return ZoneInfo('UTC')
 
     # noinspection PyNestedDecorators
     @model_validator(mode='before')
@@ -322,11 +345,20 @@ class Channel(BaseModel):
     display_name: str | None = Field(title='Видимое название')
 
 
+class Post(BaseModel):
+    """Сообщение Mattermost"""
+    id_: str = Field(alias='id')
+    channel_id: str
+    user_id: str | None = Field(default=None)
+    message: str | None = Field(default=None)
+
+
 class CommandRequestContext(BaseModel):
     bot_user_id: str = Field(serialization_alias='iid')
     bot_access_token: str = Field(serialization_alias='access_token')
     acting_user: User | None = Field(default=None)
     channel: Channel | None = Field(default=None)
+    post: Post | None = Field(default=None)
 
 
 class CommandRequest(BaseModel):
@@ -344,3 +376,25 @@ class DynamicFieldChoice(BaseModel):
     label: str = Field(title='User-facing string')
     value: str = Field(title='Machine-facing value')
     icon_data: str | None = Field(default=None, title='A fully-qualified URL')
+
+
+class FormResponse(BaseModel):
+    """Ответ с формой"""
+    type_: CallResponseType = Field(default=CallResponseType.form, alias='type')
+    form: Form
+
+
+class TextResponse(BaseModel):
+    """Ответ с текстом (успех или ошибка)"""
+    type_: CallResponseType = Field(default=CallResponseType.ok, alias='type')
+    text: str | None = Field(default=None, title='Markdown-текст, показываемый пользователю')
+
+
+class LookupData(BaseModel):
+    items: list[DynamicFieldChoice]
+
+
+class LookupResponse(BaseModel):
+    """Ответ на lookup динамического селект поля"""
+    type_: CallResponseType = Field(default=CallResponseType.ok, alias='type')
+    data: LookupData
@@ -1,72 +1,79 @@
 import os
+from collections.abc import Sequence
 from typing import TYPE_CHECKING
 
 from mdutils import MdUtils
 
 from src.config import settings
 from src.database import AsyncSession
-from src.gitlab.schemas import Status, WebHook
+from src.gitlab.schemas import (
+    BranchStatus,
+    ConnectResult,
+    DeploymentWebHook,
+    MergeRequestWebHook,
+    PipelineSummary,
+    PipelineWebHook,
+    WebHook,
+    WebHookProject,
+    WebHookUser,
+)
 
 from . import crud
+from .avatars import proxy_path
+from .badges import repository_badge, status_badges
 
 if TYPE_CHECKING:
     from .schemas import CommandRequestContext
 
-color_status_match = {
-    Status.success: 'brightgreen',
-    Status.failed: 'ff0000',
-    Status.warning: 'yellow'
-}
+
+async def prepare_message(data: WebHook | PipelineWebHook) -> str:
+    return render_message(PipelineSummary.from_webhook(data))
 
 
-async def prepare_message(data: WebHook) -> str:
+def render_message(summary: PipelineSummary) -> str:
     md_file = MdUtils(file_name='mattermost_message')
 
     # Значки со статусом pipeline и ссылкой на репу
-    badge_url = (
-        f'https://img.shields.io/badge/build-{data.object_attributes.status}-'
-        f'{color_status_match[data.object_attributes.status]}?logo=gitlab'
-    )
-    repo_badge_url = f'https://img.shields.io/badge/repository-{data.project.name.replace("-", "--")}-white'
+    root_url = str(get_root_url()).rstrip('/')
+    badge_url = f'{root_url}/{status_badges[summary.status].path}'
+    repo_badge_url = f'{root_url}/{repository_badge(summary.project_name).path}'
     md_file.new_line(
         md_file.new_inline_image("gitlab build badge", badge_url) +
         md_file.new_inline_link(
-            str(data.project.web_url), md_file.new_inline_image('gitlab repo badge', repo_badge_url)
+            summary.project_url, md_file.new_inline_image('gitlab repo badge', repo_badge_url)
         )
     )
 
-    # Информация о пользователе, запустившего сборку
-    md_file.new_line(
-        f'{md_file.new_inline_image("user avatar", str(data.user.avatar_url) + " =x25")} '
-        f'**{data.user.name} ({data.user.username})**'
-    )
+    # Информация о пользователе, запустившего сборку. Без аватара (в вебхуке avatar_url = null) картинки нет
+    avatar = ''
+    if summary.user_avatar_url:
+        avatar = md_file.new_inline_image('user avatar', avatar_proxy_url(summary.user_avatar_url) + ' =x25') + ' '
+    md_file.new_line(f'{avatar}**{summary.user_name} ({summary.user_username})**')
 
     # Инфо о pipeline
     md_file.new_line(
         f'**Статус '
-        f'{md_file.new_inline_link(str(data.object_attributes.url), f"Pipeline #{data.object_attributes.iid}")}** - '
-        f'{data.object_attributes.status}'
+        f'{md_file.new_inline_link(summary.pipeline_url, f"Pipeline #{summary.pipeline_iid}")}** - '
+        f'{summary.status}'
     )
 
     table_data = []
 
     # Данные о коммите и ветке
-    branch_url = str(data.project.web_url) + "/-/tree/" + data.object_attributes.ref
     branch = (
         f'**Ветка: **'
-        f'{md_file.new_inline_link(branch_url, data.object_attributes.ref)}&emsp;&emsp;&emsp;'
+        f'{md_file.new_inline_link(summary.branch_url, summary.ref)}&emsp;&emsp;&emsp;'
     )
     commit = (
         f'**Коммит: **'
-        f'{md_file.new_inline_link(str(data.commit.url), data.commit.title)}'
+        f'{md_file.new_inline_link(summary.commit_url, summary.commit_title)}'
     )
     table_data.extend([branch, commit])
 
     # Опциональные данные о провале сборки или с допущенными ошибками
-    failed_job = data.failed_job or data.allowed_failed_job
-    if data.object_attributes.status in [Status.failed, Status.warning] and failed_job:
-        stage = f'**Ошибка в стейдже: **{failed_job.stage}&emsp;&emsp;&emsp;'
-        job = f'**Ошибка в задаче: **{failed_job.name}'
+    if summary.failed_job:
+        stage = f'**Ошибка в стейдже: **{summary.failed_stage}&emsp;&emsp;&emsp;'
+        job = f'**Ошибка в задаче: **{summary.failed_job}'
         table_data.extend([stage, job])
 
     columns = 2
@@ -77,12 +84,154 @@ async def prepare_message(data: WebHook) -> str:
     return md_file.file_data_text
 
 
+MERGE_REQUEST_ACTIONS = {
+    'open': 'открыл',
+    'reopen': 'переоткрыл',
+    'merge': 'влил',
+    'close': 'закрыл',
+    'approved': 'одобрил',
+}
+
+
+def render_event_header(md_file: MdUtils, project: WebHookProject, user: WebHookUser) -> None:
+    """Значок репозитория и автор события"""
+    root_url = str(get_root_url()).rstrip('/')
+    repo_badge_url = f'{root_url}/{repository_badge(project.name).path}'
+    md_file.new_line(
+        md_file.new_inline_link(project.web_url, md_file.new_inline_image('gitlab repo badge', repo_badge_url))
+    )
+    avatar = ''
+    if user.avatar_url:
+        avatar = md_file.new_inline_image('user avatar', avatar_proxy_url(user.avatar_url) + ' =x25') + ' '
+    md_file.new_line(f'{avatar}**{user.name} ({user.username})**')
+
+
+def render_merge_request(data: MergeRequestWebHook) -> str:
+    md_file = MdUtils(file_name='mattermost_merge_request')
+    render_event_header(md_file, data.project, data.user)
+    attrs = data.object_attributes
+    action = MERGE_REQUEST_ACTIONS.get(attrs.action, attrs.action or attrs.state)
+    md_file.new_line(
+        f'{action} merge request {md_file.new_inline_link(attrs.url, f"!{attrs.iid} {attrs.title}")}'
+    )
+    md_file.new_line(f'**Ветки: **{attrs.source_branch} → {attrs.target_branch}')
+    return md_file.file_data_text.lstrip(' \n')
+
+
+def render_deployment(data: DeploymentWebHook) -> str:
+    md_file = MdUtils(file_name='mattermost_deployment')
+    render_event_header(md_file, data.project, data.user)
+    badge_url = f'{str(get_root_url()).rstrip("/")}/{status_badges[data.status].path}'
+    deployment = f'Деплой #{data.deployment_id}'
+    if data.deployable_url:
+        deployment = md_file.new_inline_link(data.deployable_url, deployment)
+    md_file.new_line(
+        f'{md_file.new_inline_image("deployment status", badge_url)} **{deployment}** в {data.environment} - '
+        f'{data.status}'
+    )
+    md_file.new_line(
+        f'**Ветка: **{data.ref}&emsp;&emsp;&emsp;'
+        f'**Коммит: **{md_file.new_inline_link(data.commit_url, f"{data.short_sha} {data.commit_title}")}'
+    )
+    return md_file.file_data_text.lstrip(' \n')
+
+
+def render_status(statuses: list[BranchStatus], limit: int) -> str:
+    """Таблица последних pipeline веток, сгруппированных по проектам"""
+    md_file = MdUtils(file_name='mattermost_status')
+    if not statuses:
+        md_file.new_line('В проектах канала еще не было pipeline')
+        return md_file.file_data_text.lstrip(' \n')
+    root_url = str(get_root_url()).rstrip('/')
+    table_data = ['Проект', 'Ветка', 'Статус', 'Pipeline', 'Ошибка', 'Обновлено']
+    columns = len(table_data)
+    previous_project = None
+    for item in statuses:
+        project = ''
+        if item.project_id != previous_project:
+            project = md_file.new_inline_link(item.project_url, item.project_path or item.project_url)
+            previous_project = item.project_id
+        failure = f'{item.failed_stage} / {item.failed_job}' if item.failed_job else ''
+        table_data.extend([
+            project,
+            md_file.new_inline_link(item.branch_url, item.ref),
+            md_file.new_inline_image(item.status, f'{root_url}/{status_badges[item.status].path}'),
+            md_file.new_inline_link(item.pipeline_url, f'#{item.pipeline_iid}'),
+            failure,
+            f'{item.updated_at:%d.%m.%Y %H:%M} UTC'
+        ])
+    md_file.new_line()
+    md_file.new_table(columns=columns, rows=len(table_data) // columns, text=table_data, text_align='left')
+    if len(statuses) >= limit:
+        md_file.new_line(f'Показаны {limit} веток, остальные скрыты')
+    return md_file.file_data_text.lstrip(' \n')
+
+
+def render_stats(rows: Sequence, days: int) -> str:
+    """Таблица статистики pipeline по веткам из строк gitlab.crud.get_channel_pipeline_stats"""
+    md_file = MdUtils(file_name='mattermost_stats')
+    if not rows:
+        md_file.new_line(f'За {days} дн. pipeline в проектах канала не было')
+        return md_file.file_data_text.lstrip(' \n')
+    md_file.new_line(f'**Pipeline за {days} дн.**')
+    table_data = [
+        'Проект', 'Ветка', 'Всего', 'Упало', 'Доля падений', 'С предупреждениями', 'Нестабильные', 'Среднее время'
+    ]
+    columns = len(table_data)
+    for path, web_url, ref, total, failed, warning, flaky, duration_total, duration_count in rows:
+        average = f'{round(duration_total / duration_count / 60, 1)} мин' if duration_count else ''
+        table_data.extend([
+            md_file.new_inline_link(web_url, path or web_url),
+            ref,
+            str(total),
+            str(failed),
+            f'{failed / total:.0%}',
+            str(warning),
+            f'{flaky / total:.0%}',
+            average
+        ])
+    md_file.new_line()
+    md_file.new_table(columns=columns, rows=len(table_data) // columns, text=table_data, text_align='left')
+    return md_file.file_data_text.lstrip(' \n')
+
+
+def render_connect_summary(result: ConnectResult, limit: int = 20) -> str:
+    """Итог массового прикрепления репозиториев одним сообщением"""
+    md_file = MdUtils(file_name='mattermost_connect')
+    if result.linked:
+        md_file.new_line(f'Этот канал теперь будет получать хуки с проектов ({len(result.linked)}):')
+        md_file.new_list(result.linked[:limit])
+        if len(result.linked) > limit:
+            md_file.new_line(f'и еще {len(result.linked) - limit}')
+    if result.existing:
+        md_file.new_line(f'Уже были прикреплены: {len(result.existing)}')
+    if result.hooks_created:
+        md_file.new_line(f'Создано вебхуков: {result.hooks_created}')
+    if result.group_hook:
+        md_file.new_line('События группы приходят через хук группы')
+    if result.hooks_removed:
+        md_file.new_line(f'Хуков проектов заменено хуком группы: {result.hooks_removed}')
+    if result.failed:
+        md_file.new_line(f'Не удалось обработать ({len(result.failed)}):')
+        md_file.new_list(result.failed[:limit])
+    if not (result.linked or result.existing or result.failed):
+        md_file.new_line('Проекты не найдены')
+    return md_file.file_data_text.lstrip(' \n')
+
+
 def get_root_url():
     if host := os.getenv('CI_ENVIRONMENT_DOMAIN'):
         return f'https://{host}/mattermost'
     return settings.mattermost_app_root_url or 'http://localhost'
 
 
+def avatar_proxy_url(url: str | None) -> str | None:
+    """URL аватара GitLab через прокси приложения"""
+    if not url:
+        return None
+    return f'{str(get_root_url()).rstrip("/")}/{proxy_path(url)}'
+
+
 async def update_bot_access_token(data: 'CommandRequestContext') -> None:
     async with AsyncSession() as session:
         bot, created = await crud.get_or_create_bot(session, data)
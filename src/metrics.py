@@ -0,0 +1,66 @@
+"""Метрики процесса в текстовом формате Prometheus"""
+from collections.abc import Callable
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+
+class Metric:
+    type_ = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def samples(self) -> list[tuple[tuple[str, ...], float]]:
+        return list(self._values.items())
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_}']
+        for key, value in self.samples():
+            label_text = ','.join(f'{label}="{item}"' for label, item in zip(self.labels, key, strict=True))
+            lines.append(f'{self.name}{{{label_text}}} {value}' if label_text else f'{self.name} {value}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_ = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type_ = 'gauge'
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), func: Callable[[], float] = None):
+        super().__init__(name, description, labels)
+        self._func = func
+
+    def set(self, value: float, **labels) -> None:  # noqa: A003
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> list[tuple[tuple[str, ...], float]]:
+        if self._func is not None:
+            return [((), self._func())]
+        return super().samples()
+
+
+registry: list[Metric] = []
+
+router = APIRouter(tags=['Metrics'])
+
+
+@router.get('/metrics', response_class=PlainTextResponse, summary='Метрики в формате Prometheus')
+async def metrics():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
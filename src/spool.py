@@ -0,0 +1,298 @@
+"""
+Локальная очередь (spool) принятых вебхуков на случай недоступности базы или Redis.
+
+Каждый процесс API пишет в свой каталог: файлы-сегменты только дописываются, запись - заголовок
+(длина, crc32, время приема) и сырое тело запроса. fsync выполняется пачками (по кол-ву записей
+и по таймеру) в отдельном потоке, не останавливая цикл событий. Каталог занят писателем, пока тот держит на нем flock.
+
+Воркер читает все каталоги, воспроизводит записи и хранит позицию чтения в файле cursor. Полностью прочитанные
+сегменты удаляются (компакция), каталог умершего писателя удаляется целиком после вычитки.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+import time
+import zlib
+from collections.abc import Awaitable, Callable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from src.config import settings
+from src.metrics import Gauge
+
+HEADER = struct.Struct('>IId')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+LOCK_FILE = 'lock'
+
+
+class Position(NamedTuple):
+    segment: int
+    offset: int
+
+
+class Record(NamedTuple):
+    position: Position
+    """Позиция сразу после записи"""
+    received_at: float
+    payload: bytes
+
+
+def segment_path(directory: Path, segment: int) -> Path:
+    return directory / f'{segment:020d}{SEGMENT_SUFFIX}'
+
+
+def list_segments(directory: Path) -> list[int]:
+    return sorted(int(path.stem) for path in directory.glob(f'*{SEGMENT_SUFFIX}'))
+
+
+class SpoolWriter:
+    """Запись в spool текущего процесса"""
+
+    def __init__(self, root: Path, segment_size: int, fsync_batch: int, max_bytes: int):
+        self.root = root
+        self.segment_size = segment_size
+        self.fsync_batch = fsync_batch
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._size_checked_at = 0.0
+        self.directory: Path | None = None
+        self._file = None
+        self._lock = None
+        self._segment = 0
+        self._unsynced = 0
+        self._sync_task: asyncio.Task | None = None
+        # Сегмент не закрывается, пока fsync в другом потоке сбрасывает его на диск
+        self._sync_lock = asyncio.Lock()
+        self._closing: set[asyncio.Task] = set()
+
+    def _open(self) -> None:
+        # Каталог становится виден воркеру только после взятия блокировки, иначе его могут счесть брошенным
+        name = f'{os.getpid()}-{time.time_ns()}'
+        temp_directory = self.root / f'.{name}'
+        temp_directory.mkdir(parents=True)
+        self._lock = open(temp_directory / LOCK_FILE, 'w')  # noqa: SIM115
+        fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.directory = temp_directory.rename(self.root / name)
+        self._start_segment(0)
+
+    def _start_segment(self, segment: int) -> None:
+        if self._file is not None:
+            # Заполненный сегмент сбрасывается на диск и закрывается в фоне, записи сразу идут в новый
+            self._file.flush()
+            self._unsynced = 0
+            task = asyncio.create_task(self._close_segment(self._file))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        self._segment = segment
+        self._file = open(segment_path(self.directory, segment), 'ab')  # noqa: SIM115
+
+    @property
+    def full(self) -> bool:
+        """Spool всех процессов занимает больше max_bytes. Размер пересчитывается не чаще раза в секунду"""
+        now = time.monotonic()
+        if now - self._size_checked_at >= 1:
+            self._size = spool_size(self.root)
+            self._size_checked_at = now
+        return self._size >= self.max_bytes
+
+    async def append(self, payload: bytes) -> None:
+        self._size += HEADER.size + len(payload)
+        if self._file is None:
+            self._open()
+        elif self._file.tell() >= self.segment_size:
+            self._start_segment(self._segment + 1)
+        self._file.write(HEADER.pack(len(payload), zlib.crc32(payload), time.time()) + payload)
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch:
+            await self.sync()
+
+    async def sync(self) -> None:
+        async with self._sync_lock:
+            file = self._file
+            if file is None or not self._unsynced:
+                return
+            file.flush()
+            # Записи, добавленные во время fsync, попадут в следующую пачку
+            self._unsynced = 0
+            await asyncio.to_thread(os.fsync, file.fileno())
+
+    async def _close_segment(self, file) -> None:
+        async with self._sync_lock:
+            try:
+                await asyncio.to_thread(os.fsync, file.fileno())
+            except OSError:
+                logging.exception('Не удалось сбросить сегмент spool на диск')
+            finally:
+                file.close()
+
+    async def close(self) -> None:
+        """Сброс всех записей на диск при остановке процесса"""
+        await self.sync()
+        await asyncio.gather(*self._closing)
+
+    async def run_sync(self, interval: float) -> None:
+        """fsync по таймеру, чтобы редкие записи не ждали заполнения пачки"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except OSError:
+                logging.exception('Не удалось сбросить spool на диск')
+
+    def start_sync(self, interval: float) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self.run_sync(interval))
+
+
+class SpoolReader:
+    """Чтение каталога одного писателя с сохранением позиции"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    @property
+    def cursor(self) -> Position:
+        try:
+            segment, offset = (self.directory / CURSOR_FILE).read_text().split()
+        except (FileNotFoundError, ValueError):
+            segments = list_segments(self.directory)
+            return Position(segments[0] if segments else 0, 0)
+        return Position(int(segment), int(offset))
+
+    def commit(self, position: Position) -> None:
+        temp_path = self.directory / f'.{CURSOR_FILE}.tmp'
+        temp_path.write_text(f'{position.segment} {position.offset}')
+        os.replace(temp_path, self.directory / CURSOR_FILE)
+        self.compact(position)
+
+    def compact(self, position: Position) -> None:
+        """Удаление сегментов, прочитанных целиком. Последний сегмент может еще дописываться"""
+        segments = list_segments(self.directory)
+        for segment in segments[:-1]:
+            if segment < position.segment:
+                segment_path(self.directory, segment).unlink(missing_ok=True)
+
+    def writer_alive(self) -> bool:
+        try:
+            with open(self.directory / LOCK_FILE) as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except FileNotFoundError:
+            return False
+        except BlockingIOError:
+            return True
+        return False
+
+    def records(self, start: Position | None = None) -> Iterator[Record]:
+        """Записи от позиции start (по умолчанию от курсора). Недописанная запись в конце сегмента пропускается"""
+        start = start or self.cursor
+        segments = [segment for segment in list_segments(self.directory) if segment >= start.segment]
+        for segment in segments:
+            offset = start.offset if segment == start.segment else 0
+            try:
+                with open(segment_path(self.directory, segment), 'rb') as file:
+                    file.seek(offset)
+                    yield from self._read_segment(file, segment, offset)
+            except FileNotFoundError:
+                continue
+
+    @staticmethod
+    def _read_segment(file, segment: int, offset: int) -> Iterator[Record]:
+        while header := file.read(HEADER.size):
+            if len(header) < HEADER.size:
+                return
+            length, checksum, received_at = HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            offset += HEADER.size + length
+            yield Record(Position(segment, offset), received_at, payload)
+
+    def size(self) -> int:
+        """Объем еще не прочитанных данных, байт"""
+        cursor = self.cursor
+        total = 0
+        for segment in list_segments(self.directory):
+            if segment < cursor.segment:
+                continue
+            try:
+                total += segment_path(self.directory, segment).stat().st_size
+            except FileNotFoundError:
+                continue
+            if segment == cursor.segment:
+                total -= cursor.offset
+        return max(total, 0)
+
+    def oldest(self) -> float | None:
+        """Время приема самой старой непрочитанной записи"""
+        record = next(self.records(), None)
+        return record.received_at if record else None
+
+    def remove(self) -> None:
+        for path in self.directory.iterdir():
+            path.unlink(missing_ok=True)
+        self.directory.rmdir()
+
+
+def readers(root: Path) -> list[SpoolReader]:
+    if not root.exists():
+        return []
+    return [SpoolReader(path) for path in sorted(root.iterdir()) if path.is_dir() and not path.name.startswith('.')]
+
+
+def spool_size(root: Path) -> int:
+    return sum(reader.size() for reader in readers(root))
+
+
+def spool_lag(root: Path) -> float:
+    """Возраст самой старой невоспроизведенной записи, с"""
+    oldest = [received_at for reader in readers(root) if (received_at := reader.oldest()) is not None]
+    return time.time() - min(oldest) if oldest else 0.0
+
+
+async def drain(
+        root: Path, handler: Callable[[bytes], Awaitable[None]], retryable: tuple[type[BaseException], ...],
+        batch_size: int = 100
+) -> int:
+    """
+    Воспроизведение записей всех писателей. Позиция сохраняется после каждой пачки (at-least-once)
+    :param handler: обработка тела вебхука
+    :param retryable: ошибки, при которых вычитка прерывается до следующего запуска (бэкенд еще недоступен)
+    :return: кол-во воспроизведенных записей
+    """
+    replayed = 0
+    for reader in readers(root):
+        alive = reader.writer_alive()
+        position = None
+        try:
+            for index, record in enumerate(reader.records(), start=1):
+                try:
+                    await handler(record.payload)
+                except retryable:
+                    return replayed
+                except Exception:
+                    logging.exception('Запись spool %s пропущена', record.position)
+                position = record.position
+                replayed += 1
+                if index % batch_size == 0:
+                    reader.commit(position)
+        finally:
+            if position is not None:
+                reader.commit(position)
+        # Недописанный хвост умершего писателя уже не допишется
+        if not alive and next(reader.records(), None) is None:
+            reader.remove()
+    return replayed
+
+
+spool_writer = SpoolWriter(
+    root=settings.spool_dir,
+    segment_size=settings.spool_segment_size,
+    fsync_batch=settings.spool_fsync_batch,
+    max_bytes=settings.spool_max_bytes
+)
+
+Gauge('matterlab_spool_bytes', 'Объем невоспроизведенных вебхуков в spool', func=lambda: spool_size(settings.spool_dir))
+Gauge('matterlab_spool_lag_seconds', 'Возраст самой старой записи в spool', func=lambda: spool_lag(settings.spool_dir))
@@ -0,0 +1,65 @@
+"""
+Фоновый воркер с периодическими задачами приложения.
+
+Запуск: python -m src.worker
+"""
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from src.cache import start_invalidation_listener
+from src.config import settings
+from src.database import replica_monitor
+from src.gitlab.services import (
+    drain_spool,
+    ensure_event_partitions,
+    migrate_group_hooks,
+    prune_orphan_hooks,
+    sync_projects_metadata,
+)
+from src.gitlab.tokens import sweep_tokens
+from src.mattermost import reminders
+
+# Задача -> интервал между запусками, с
+PERIODIC_TASKS: list[tuple[Callable[[], Awaitable], float]] = [
+    (reminders.deliver_due_reminders, settings.reminder_poll_interval),
+    (reminders.repair_index, settings.reminder_repair_interval),
+    (drain_spool, settings.spool_drain_interval),
+    (ensure_event_partitions, settings.pipeline_partition_interval),
+    (sweep_tokens, settings.token_sweep_interval),
+    (prune_orphan_hooks, settings.hook_prune_interval),
+    (sync_projects_metadata, settings.project_sync_interval),
+]
+
+# Однократные задачи при старте воркера
+STARTUP_TASKS: list[Callable[[], Awaitable]] = [reminders.reconcile_index, migrate_group_hooks]
+
+
+async def run_periodic(task: Callable[[], Awaitable], interval: float) -> None:
+    while True:
+        try:
+            await task()
+        except Exception:
+            logging.exception('Ошибка в фоновой задаче %s', task.__qualname__)
+        await asyncio.sleep(interval)
+
+
+async def run_startup(task: Callable[[], Awaitable]) -> None:
+    # Сбой однократной задачи (GitLab или база недоступны) не должен мешать запуску периодических
+    try:
+        await task()
+    except Exception:
+        logging.exception('Ошибка в задаче при старте %s', task.__qualname__)
+
+
+async def main() -> None:
+    start_invalidation_listener()
+    replica_monitor.start()
+    for task in STARTUP_TASKS:
+        await run_startup(task)
+    await asyncio.gather(*(run_periodic(task, interval) for task, interval in PERIODIC_TASKS))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG if settings.debug else logging.INFO)
+    asyncio.run(main())
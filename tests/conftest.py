@@ -0,0 +1,8 @@
+import os
+
+# Без .env: приложение импортируется без базы и Redis, соединения не открываются до первого запроса
+for _key, _value in {
+    'DB_USER': 'postgres', 'DB_PASSWORD': 'postgres', 'GITLAB_SECRET': 'test-secret',
+    'MATTERMOST_HOST': 'http://localhost:8065/'
+}.items():
+    os.environ.setdefault(_key, _value)
@@ -0,0 +1,34 @@
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from src.config import settings
+from src.gitlab import routers
+from src.main import app
+
+DEPLOYMENT_PAYLOAD = {
+    'object_kind': 'deployment',
+    'status': 'blocked',
+    'deployment_id': 15,
+    'deployable_url': 'https://gitlab.example.com/group/repo/-/jobs/1',
+    'environment': 'production',
+    'ref': 'main',
+    'short_sha': '279484c0',
+    'commit_url': 'https://gitlab.example.com/group/repo/-/commit/279484c0',
+    'commit_title': 'Add feature',
+    'user': {'id': 1, 'name': 'Administrator', 'username': 'root', 'avatar_url': None},
+    'project': {
+        'id': 2, 'name': 'repo', 'web_url': 'https://gitlab.example.com/group/repo',
+        'path_with_namespace': 'group/repo', 'avatar_url': None
+    },
+}
+
+
+def test_unknown_deployment_status_is_ignored():
+    client = TestClient(app)
+    with mock.patch.object(routers, 'process_webhook') as process_webhook:
+        response = client.post(
+            '/gitlab/webhook', json=DEPLOYMENT_PAYLOAD, headers={'X-Gitlab-Token': settings.gitlab_secret}
+        )
+    assert response.status_code == 200
+    process_webhook.assert_not_called()